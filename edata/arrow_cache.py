@@ -0,0 +1,190 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2016-2025 Renat Nasridinov
+# This software may be freely distributed under the MIT license.
+# https://opensource.org/licenses/MIT The MIT License (MIT)
+# or see LICENSE file
+
+# Кеш щоденних архівів у форматі Arrow IPC (Feather v2) без стиснення.
+# Кожен день перекодовується з cp1251 та розбирається лише один раз, з
+# типами оптимізованого профілю edata_convert.py (цілі числа, дати, словники
+# для стовпців з повторами). Файл читається через відображення у пам'ять:
+# стовпці не копіюються, відкриття дня займає мілісекунди, а сторінки кешу
+# ОС спільні для всіх процесів, що читають той самий день.
+#
+# У метаданих схеми зберігається SHA-256 архіву (з каталогу, див.
+# catalog.py), тож день перекодовується знову лише після зміни архіву.
+
+import argparse
+import os
+import sys
+import zipfile
+from pathlib import Path
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pacsv
+import pyarrow.ipc as ipc
+from .catalog import get_entry, is_unchanged, open_catalog, update_entry
+
+
+CSV_ENCODING = 'cp1251'
+CACHE_DIR = 'cache'
+SUFFIX = '.arrow'
+SOURCE_KEY = b'edata.source_sha256'
+# типи стовпців, як в оптимізованому профілі edata_convert.py; решта --
+# рядки
+NUMERIC_TYPES = {'id': pa.int64(), 'amount': pa.float64(),
+                 'amount_cop': pa.int64(), 'region_id': pa.int8(),
+                 'source_id': pa.int32()}
+DICTIONARY_COLUMNS = (
+    'currency', 'doc_vob', 'doc_vob_name', 'payer_edrpou', 'payer_name',
+    'payer_mfo', 'payer_bank', 'recipt_bank', 'recipt_mfo', 'payment_type',
+    'source_name', 'kekv', 'kpk', 'budgetCode')
+DATE_COLUMNS = ('doc_date', 'doc_v_date', 'trans_date')
+
+arg_parser = argparse.ArgumentParser(
+    prog=None,
+    usage=None,
+    description="Кеш щоденних архівів Є-Data у форматі Arrow IPC (Feather "
+                "v2) для читання через відображення у пам'ять",
+    epilog=None
+    )
+arg_parser.add_argument('files', nargs='*',
+                        help='ZIP-архіви, за замовчуванням -- усі архіви '
+                        'директорії даних')
+arg_parser.add_argument('-D', '--data-dir', dest='data_dir', default='data',
+                        help='директорія з ZIP-файлами, за замовчуванням -- '
+                        '`data`')
+arg_parser.add_argument('-o', '--output-dir', dest='output_dir',
+                        default=CACHE_DIR,
+                        help='директорія кешу, за замовчуванням -- '
+                        '`{}`'.format(CACHE_DIR))
+arg_parser.add_argument('-f', '--force', action='store_true',
+                        help='перекодувати навіть незмінені архіви')
+arg_parser.add_argument('-v', '--verbose', action='store_true',
+                        help='виводити інформацію про кожен файл')
+
+
+def cache_path(zip_path, cache_dir=CACHE_DIR):
+    return Path(cache_dir, Path(zip_path).stem + SUFFIX)
+
+
+def _to_date(column):
+    # значення, що не відповідають формату `YYYY-MM-DD`, стають null
+    parsed = pc.strptime(pc.utf8_slice_codeunits(column, 0, 10),
+                         format='%Y-%m-%d', unit='s', error_is_null=True)
+    return pc.cast(parsed, pa.date32())
+
+
+def read_csv(zip_path):
+    """Reads CSV of a daily archive into Arrow table with cache dtypes."""
+    with zipfile.ZipFile(zip_path) as zf:
+        member = next((m for m in zf.namelist()
+                       if m.lower().endswith('.csv')), zf.namelist()[0])
+        with zf.open(member) as raw:
+            table = pacsv.read_csv(
+                raw,
+                # перший рядок -- назви стовпців українською
+                read_options=pacsv.ReadOptions(encoding=CSV_ENCODING,
+                                               skip_rows=1),
+                parse_options=pacsv.ParseOptions(delimiter=';'),
+                convert_options=pacsv.ConvertOptions(
+                    column_types=NUMERIC_TYPES,
+                    strings_can_be_null=True,
+                    timestamp_parsers=[]))
+    columns = []
+    for name, column in zip(table.column_names, table.columns):
+        if name in DATE_COLUMNS:
+            column = _to_date(pc.cast(column, pa.string()))
+        elif name in DICTIONARY_COLUMNS:
+            column = pc.cast(column, pa.string()).dictionary_encode()
+        elif name not in NUMERIC_TYPES:
+            column = pc.cast(column, pa.string())
+        columns.append(column)
+    # один блок на стовпець: словники у файлі IPC не можуть змінюватися
+    return pa.table(columns, names=table.column_names).combine_chunks()
+
+
+def write_cache(table, path, source_sha256=None):
+    """Writes uncompressed Arrow IPC file atomically."""
+    if source_sha256:
+        metadata = dict(table.schema.metadata or {})
+        metadata[SOURCE_KEY] = source_sha256.encode('ascii')
+        table = table.replace_schema_metadata(metadata)
+    tmp_path = Path(str(path) + '.tmp')
+    with pa.OSFile(str(tmp_path), 'wb') as sink, \
+            ipc.new_file(sink, table.schema) as writer:
+        writer.write_table(table)
+    os.replace(tmp_path, path)
+
+
+def read_day(path, columns=None):
+    """Memory-maps cached day and returns Arrow table; columns are not
+    copied until modified."""
+    with pa.memory_map(str(path), 'r') as source:
+        table = ipc.open_file(source).read_all()
+    return table.select(columns) if columns else table
+
+
+def source_of(path):
+    """SHA-256 of the archive the cache file was made from, or None."""
+    try:
+        with pa.memory_map(str(path), 'r') as source:
+            metadata = ipc.open_file(source).schema.metadata or {}
+    except (OSError, pa.ArrowInvalid):
+        return None
+    value = metadata.get(SOURCE_KEY)
+    return value.decode('ascii') if value else None
+
+
+def cache_day(zip_path, cache_dir=CACHE_DIR, catalog=None, force=None,
+              sha256=None):
+    """Transcodes the archive unless an up-to-date cache file exists.
+    `sha256` of the archive may be given instead of `catalog`, then the
+    catalog is not used. Returns (cache path, True if written). Raises
+    ValueError for archives marked damaged in the catalog."""
+    path = cache_path(zip_path, cache_dir)
+    if catalog is not None:
+        entry = get_entry(catalog, zip_path) \
+            if is_unchanged(catalog, zip_path) \
+            else update_entry(catalog, zip_path)
+        if not entry['ok']:
+            raise ValueError('{}: {}'.format(zip_path, entry['error']))
+        sha256 = entry['sha256']
+    if sha256 and not force and path.exists() and source_of(path) == sha256:
+        return path, False
+    write_cache(read_csv(zip_path), path, sha256)
+    return path, True
+
+
+def main():
+    results = arg_parser.parse_args()
+    files = results.files or sorted(
+        str(p) for p in Path(results.data_dir).glob('*.zip'))
+    Path(results.output_dir).mkdir(parents=True, exist_ok=True)
+    catalog = open_catalog(results.data_dir)
+    written = failed = 0
+    try:
+        for zip_path in files:
+            try:
+                path, changed = cache_day(zip_path, results.output_dir,
+                                          catalog, force=results.force)
+            except (OSError, ValueError, pa.ArrowInvalid) as e:
+                failed += 1
+                sys.stderr.write('{}: {}\n'.format(zip_path, e))
+                continue
+            written += changed
+            if results.verbose:
+                sys.stdout.write('{:<24} {}\n'.format(
+                    path.name, 'записано' if changed else 'без змін'))
+    finally:
+        catalog.close()
+    sys.stdout.write('Записано: {}, без змін: {}, помилок: {}\n'.format(
+        written, len(files) - written - failed, failed))
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,210 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2016-2025 Renat Nasridinov
+# This software may be freely distributed under the MIT license.
+# https://opensource.org/licenses/MIT The MIT License (MIT)
+# or see LICENSE file
+
+# Каталог архіву щоденних ZIP-файлів (директорія `data`): розмір, контрольна
+# сума, стиснений/розпакований розмір, заголовок CSV та кількість рядків
+# кожного файлу. Заголовок і розміри беруться з метаданих ZIP, рядки
+# рахуються за кількістю символів нового рядка без розбору CSV. Файли з
+# незмінними розміром та часом модифікації повторно не скануються.
+
+import argparse
+import hashlib
+import io
+import json
+import mmap
+import os
+import sqlite3
+import struct
+import sys
+import time
+import zipfile
+import zlib
+from pathlib import Path
+
+
+CATALOG_NAME = 'catalog.sqlite'
+CSV_ENCODING = 'cp1251'
+# перший рядок CSV -- назви стовпців українською, другий -- машинні
+HEADER_LINES = 2
+READ_SIZE = 16 * 1024 * 1024
+LOCAL_HEADER = struct.Struct('<4s2B4HL2L2H')
+
+CREATE_TABLE = """CREATE TABLE IF NOT EXISTS catalog (name text PRIMARY KEY,
+    size integer, mtime_ns integer, sha256 text, member text NULL,
+    compressed integer NULL, uncompressed integer NULL, columns text NULL,
+    rows integer NULL, ok integer, error text NULL, scanned text);"""
+FIELDS = ('name', 'size', 'mtime_ns', 'sha256', 'member', 'compressed',
+          'uncompressed', 'columns', 'rows', 'ok', 'error', 'scanned')
+
+arg_parser = argparse.ArgumentParser(
+    prog=None,
+    usage=None,
+    description="Будує каталог щоденних ZIP-файлів з транзакціями порталу "
+                "Є-Data",
+    epilog=None
+    )
+arg_parser.add_argument('data_dir', nargs='?', default='data',
+                        help='директорія з ZIP-файлами, за замовчуванням -- '
+                        '`data`')
+arg_parser.add_argument('-f', '--force', action='store_true',
+                        help='сканувати також незмінені файли')
+arg_parser.add_argument('-v', '--verbose', dest='verbose',
+                        help="виводити додаткову інформацію",
+                        action='store_true',
+                        )
+
+
+def open_catalog(data_dir='data'):
+    db = sqlite3.connect(str(Path(data_dir, CATALOG_NAME)))
+    db.execute(CREATE_TABLE)
+    return db
+
+
+def _sha256(path):
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(READ_SIZE), b''):
+            h.update(block)
+    return h.hexdigest()
+
+
+def _count_mapped(mm, start, end):
+    """Counts newlines in mapped bytes [start, end), returns
+    (count, crc32, last byte)."""
+    count = crc = 0
+    last = b''
+    for pos in range(start, end, READ_SIZE):
+        block = mm[pos:min(pos + READ_SIZE, end)]
+        count += block.count(b'\n')
+        crc = zlib.crc32(block, crc)
+        last = block[-1:]
+    return count, crc, last
+
+
+def _count_member(zf, path, info):
+    """Counts newlines of a ZIP member. Stored members are counted over the
+    memory-mapped archive, compressed ones are streamed (ZipExtFile checks
+    CRC when the end of member is reached)."""
+    if info.compress_type == zipfile.ZIP_STORED and info.file_size:
+        with open(path, 'rb') as f, \
+                mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            fields = LOCAL_HEADER.unpack_from(mm, info.header_offset)
+            start = info.header_offset + LOCAL_HEADER.size + fields[-2] + \
+                fields[-1]
+            count, crc, last = _count_mapped(
+                mm, start, start + info.compress_size)
+        if crc != info.CRC:
+            raise zipfile.BadZipFile(
+                'Bad CRC-32 for file {!r}'.format(info.filename))
+        return count + (last not in (b'\n', b''))
+    count, last = 0, b''
+    with zf.open(info) as member:
+        for block in iter(lambda: member.read(READ_SIZE), b''):
+            count += block.count(b'\n')
+            last = block[-1:]
+    return count + (last not in (b'\n', b''))
+
+
+def _read_header(zf, info):
+    with zf.open(info) as member:
+        text = io.TextIOWrapper(member, encoding=CSV_ENCODING, newline='')
+        lines = [text.readline() for _ in range(HEADER_LINES)]
+    return lines[-1].rstrip('\r\n').split(';')
+
+
+def scan_file(path):
+    """Returns catalog entry (dict with `FIELDS` keys) for the ZIP file."""
+    stat = os.stat(path)
+    entry = dict.fromkeys(FIELDS)
+    entry.update(name=Path(path).name, size=stat.st_size,
+                 mtime_ns=stat.st_mtime_ns, sha256=_sha256(path), ok=0,
+                 scanned=time.strftime('%Y-%m-%dT%H:%M:%S'))
+    try:
+        with zipfile.ZipFile(path) as zf:
+            infos = [i for i in zf.infolist() if not i.is_dir()]
+            info = next((i for i in infos
+                         if i.filename.lower().endswith('.csv')), infos[0])
+            entry.update(
+                member=info.filename,
+                compressed=sum(i.compress_size for i in infos),
+                uncompressed=sum(i.file_size for i in infos),
+                columns=json.dumps(_read_header(zf, info)),
+                rows=max(_count_member(zf, path, info) - HEADER_LINES, 0),
+                ok=1)
+    except (zipfile.BadZipFile, IndexError, EOFError, UnicodeDecodeError,
+            zlib.error) as e:
+        entry['error'] = str(e) or type(e).__name__
+    return entry
+
+
+def is_unchanged(db, path):
+    """True if catalog has an entry with the same size and mtime."""
+    stat = os.stat(path)
+    row = db.execute('SELECT size, mtime_ns FROM catalog WHERE name = ?',
+                     (Path(path).name,)).fetchone()
+    return row == (stat.st_size, stat.st_mtime_ns)
+
+
+def get_entry(db, path):
+    row = db.execute('SELECT {} FROM catalog WHERE name = ?'.format(
+        ', '.join(FIELDS)), (Path(path).name,)).fetchone()
+    if row is None:
+        return None
+    entry = dict(zip(FIELDS, row))
+    entry['columns'] = json.loads(entry['columns'] or '[]')
+    return entry
+
+
+def update_entry(db, path):
+    """Scans the file and stores its entry, returns the entry."""
+    entry = scan_file(path)
+    db.execute('INSERT OR REPLACE INTO catalog ({}) VALUES ({})'
+               .format(', '.join(FIELDS), ', '.join(':' + k for k in FIELDS)),
+               entry)
+    db.commit()
+    return entry
+
+
+def scan(data_dir='data', force=None, verbose=None):
+    """Updates catalog of `data_dir`, returns tuple (scanned, skipped)."""
+    db = open_catalog(data_dir)
+    scanned = skipped = 0
+    try:
+        present = set()
+        for path in sorted(Path(data_dir).glob('*.zip')):
+            present.add(path.name)
+            if not force and is_unchanged(db, path):
+                skipped += 1
+                continue
+            entry = update_entry(db, path)
+            scanned += 1
+            if verbose:
+                sys.stdout.write('{:<24} {:>10} {}\n'.format(
+                    entry['name'], entry['rows'] if entry['ok'] else '-',
+                    entry['error'] or ''))
+        db.executemany('DELETE FROM catalog WHERE name = ?',
+                       ((name,) for (name,) in
+                        db.execute('SELECT name FROM catalog').fetchall()
+                        if name not in present))
+        db.commit()
+    finally:
+        db.close()
+    return scanned, skipped
+
+
+def main():
+    results = arg_parser.parse_args()
+    scanned, skipped = scan(results.data_dir, force=results.force,
+                            verbose=results.verbose)
+    if results.verbose:
+        sys.stdout.write('Проскановано: {}, пропущено незмінених: {}\n'
+                         .format(scanned, skipped))
+
+
+if __name__ == '__main__':
+    main()
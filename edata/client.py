@@ -0,0 +1,155 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2016-2025 Renat Nasridinov
+# This software may be freely distributed under the MIT license.
+# https://opensource.org/licenses/MIT The MIT License (MIT)
+# or see LICENSE file
+
+# Клієнт API порталу Є-Data для використання з інших програм. На відміну
+# від командного рядка, методи повертають значення та піднімають винятки
+# (`EdataError`, винятки `requests`) замість завершення процесу. Один
+# екземпляр можна використовувати з багатьох потоків одночасно: кожен потік
+# отримує власну `requests.Session`, а заголовки складаються окремо для
+# кожного запиту.
+
+import threading
+from datetime import datetime
+from types import MappingProxyType
+import requests
+from .core import (
+    DOWNLOAD_CHUNK_SIZE,
+    DOWNLOAD_RETRIES,
+    DOWNLOAD_TIMEOUT,
+    EDATA_API_URL,
+    HEADERS,
+    ZIPPED_STAT_NAME,
+    _transactions_of,
+    compose_data_dict,
+    download,
+    )
+from .errors import EDataSystemError
+
+
+OCTET_STREAM = 'application/octet-stream'
+
+
+class EDataClient(object):
+    """Reentrant, thread-safe E-Data API client.
+
+    `headers` are added to the default ones for every request of the
+    client, `headers` argument of a method -- for that request only."""
+
+    def __init__(self, base_url=EDATA_API_URL, headers=None,
+                 timeout=DOWNLOAD_TIMEOUT, chunk_size=DOWNLOAD_CHUNK_SIZE,
+                 retries=DOWNLOAD_RETRIES):
+        self.base_url = base_url
+        self.headers = MappingProxyType(dict(HEADERS, **(headers or {})))
+        self.timeout = timeout
+        self.chunk_size = chunk_size
+        self.retries = retries
+        self._local = threading.local()
+        self._sessions = []
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    @property
+    def session(self):
+        """`requests.Session` of the calling thread."""
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            session = self._local.session = requests.Session()
+            with self._lock:
+                self._sessions.append(session)
+        return session
+
+    def close(self):
+        with self._lock:
+            for session in self._sessions:
+                session.close()
+            self._sessions.clear()
+        self._local = threading.local()
+
+    def _headers(self, headers=None, accept=None):
+        h = dict(self.headers)
+        if accept:
+            h['Accept'] = accept
+        h.update(headers or {})
+        return h
+
+    def _get(self, url_part, params=None, headers=None):
+        r = self.session.get(self.base_url + url_part, params=params,
+                             headers=self._headers(headers),
+                             timeout=self.timeout)
+        r.raise_for_status()
+        return r
+
+    def get_json(self, url_part, params=None, headers=None):
+        """GET request to the API, returns decoded JSON; raises
+        `EDataSystemError` if API reports an error."""
+        data = self._get(url_part, params=params, headers=headers).json()
+        if isinstance(data, dict) and 'error' in data:
+            raise EDataSystemError(data['error'])
+        return data
+
+    def ping(self, regions=None, headers=None):
+        part = '/v2/regions/ping' if regions else '/v2/api/transactions/ping'
+        return self._get(part, headers=headers).status_code == 200
+
+    def lastload(self, headers=None):
+        """Date of the last complete load of transactions."""
+        data = self.get_json('/v2/api/transactions/lastload',
+                             headers=headers)
+        return datetime.strptime(data['lastLoad'], '%Y-%m-%d').date()
+
+    def transactions(self, payers=None, receipts=None, startdate=None,
+                     enddate=None, regions=None, top100=None, headers=None):
+        """Returns list of transactions (dicts as returned by API).
+        Raises DatesWithoutPayersError for a date range without payers or
+        receipts."""
+        qry = compose_data_dict(payers or [], receipts or [],
+                                startdate=startdate, enddate=enddate,
+                                regions=regions or [])
+        part = '/v2/api/transactions/top100' if top100 and not qry \
+            else '/v2/api/transactions/'
+        return _transactions_of(self.get_json(part, params=qry,
+                                              headers=headers))
+
+    def download_transactions(self, file_name, payers=None, receipts=None,
+                              startdate=None, enddate=None, regions=None,
+                              top100=None, headers=None, verbose=None):
+        """Saves transactions as ZIP with CSV to `file_name`, returns
+        download statistics (see `core.download`). Raises
+        DatesWithoutPayersError like `transactions`."""
+        qry = compose_data_dict(payers or [], receipts or [],
+                                startdate=startdate, enddate=enddate,
+                                regions=regions or [])
+        part = '/v2/api/transactions/top100' if top100 and not qry \
+            else '/v2/api/transactions/'
+        return self.download(part, file_name, params=qry, headers=headers,
+                             verbose=verbose)
+
+    def download(self, url_part, file_name, params=None, headers=None,
+                 verbose=None):
+        return download(self.base_url + url_part, file_name, params=params,
+                        headers=self._headers(headers, accept=OCTET_STREAM),
+                        verbose=verbose, chunk_size=self.chunk_size,
+                        retries=self.retries, session=self.session,
+                        timeout=self.timeout)
+
+    def org_stat(self, file_name=ZIPPED_STAT_NAME, headers=None,
+                 verbose=None):
+        """Saves organizations documents statistics (ZIP with CSV)."""
+        return self.download('/v2/stat/organizations/csv', file_name,
+                             headers=headers, verbose=verbose)
+
+    def document_stat(self, headers=None):
+        return self.get_json('/v2/stat/documents', headers=headers)
+
+    def regions(self, headers=None):
+        return self.get_json('/v2/regions', headers=headers)
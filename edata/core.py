@@ -16,17 +16,31 @@
 
 import requests
 import json
+import os
 import sqlite3
 import argparse
 import sys
 import re
+import tempfile
+import time
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from requests.exceptions import ConnectionError
+from pathlib import Path
+from requests.exceptions import ChunkedEncodingError, ConnectionError, Timeout
 from urllib3.exceptions import ProtocolError
 from .regions import REGIONS
+from .orgstat import load_snapshot
+from .profiling import add_profile_argument, profiled
+from .export import CSV_ENCODINGS, EXPORT_BATCH, FORMATS, export
+from .shards import close_all, open_shard_groups, split_by_shard
+from .schema import (
+    SCHEMA_VERSION,
+    ensure_schema,
+    get_layout,
+    row_hash,
+    schema_version)
 from .errors import (
-    EdataError,
-    NoDataReturnError,
     NoEDRPOUError,
     EDataSystemError,
     ValueIsNotADateError,
@@ -37,14 +51,28 @@ from .errors import (
     Top100WithEDRPOUError,
     WrongTreasuryInList,
     CannotFetchStatFileError,
-    StatisticProcNeedsParameterError)
+    StatisticProcNeedsParameterError,
+    OutdatedSchemaError,
+    CorruptDownloadError,
+    NoShardsError,
+    RegionsFailedError,
+    UnencodableValueError)
 
 
 SQLITE_MAX_VARIABLE_NUMBER = 999
 ISO_DATE_TEMPLATE = re.compile(r'(\d{4})-(\d{2})-(\d{2})')
 TREASURY = [x['regionCode'] for x in REGIONS]
+REGION_NAMES = {x['regionCode']: x['regionName'] for x in REGIONS}
 ZIPPED_STAT_NAME = '_stat'
 EDATA_API_URL = "http://api.spending.gov.ua/api"
+FANOUT_CONCURRENCY = 6
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+DOWNLOAD_RETRIES = 5
+# (з'єднання, читання), секунди
+DOWNLOAD_TIMEOUT = (15, 120)
+# рядки заголовка CSV порталу: українські назви та імена стовпців
+CSV_HEADER_LINES = 2
+MERGED_MEMBER = 'transactions.csv'
 
 HEADERS = {
     "User-Agent": "Mozilla/5.0 (X11; Linux x86_64; rv:47.0) "
@@ -62,6 +90,7 @@ arg_parser = argparse.ArgumentParser(
     epilog=None,
     )
 
+add_profile_argument(arg_parser)
 subparsers = arg_parser.add_subparsers(dest='subparser_name')
 
 # Дані по транзакціях
@@ -83,6 +112,12 @@ cabinets_parser = subparsers.add_parser(
     'cabinets',
     help='Статистика по документах органиізацій (zipped CSV)'
     )
+# Вивантаження з бази даних SQLite
+export_parser = subparsers.add_parser(
+    'export',
+    help='Вивантаження трансакцій з бази даних SQLite у CSV, JSON Lines '
+    'або Parquet'
+    )
 trans_parser.add_argument(
     '-v', '--verbose', action='store_true',
     help='виводити додаткову інформацію'
@@ -117,11 +152,28 @@ trans_parser.add_argument('-l', '--lastload', action='store_true',
 trans_parser.add_argument('-k', '--keep-json', action='store_true',
                           help='зберегти файл JSON при зберіганні до бази '
                           'даних SQLite')
+trans_parser.add_argument('-u', '--upsert', action='store_true',
+                          help='при зберіганні до бази даних SQLite '
+                          'перезаписувати лише змінені записи')
+trans_parser.add_argument('--shard', action='store_true',
+                          help='при зберіганні до бази даних SQLite '
+                          'записувати кожен регіон в окремий файл '
+                          '`edata.rNN.sqlite`')
 trans_parser.add_argument('--ping', action='store_true',
                           help='перевірити доступність API')
 trans_parser.add_argument('--top', action='store_true', dest='top100',
                           help='Повертає Топ 100 транзакцій по регіону')
 
+cabinets_parser.add_argument('-v', '--verbose', action='store_true',
+                             help='виводити додаткову інформацію')
+cabinets_parser.add_argument('-sql', '--sqlite', action='store_true',
+                             help='завантажити статистику до бази даних '
+                             'SQLite і зберегти зміни відносно попереднього '
+                             'знімка')
+cabinets_parser.add_argument('-d', '--database', dest='database',
+                             default='edata',
+                             help="ім'я файла бази даних (БЕЗ розширення), "
+                             "за замовчуванням -- `edata`")
 region_parser.add_argument('-p', '--ping', action='store_true',
                            help='Перевірка доступності API')
 region_parser.add_argument('-v', '--verbose', action='store_true',
@@ -138,6 +190,57 @@ doc_org_group.add_argument('--org', action='store_true', help='Зберегти
 doc_org_group.add_argument('--doc', action='store_true', help='Зберегти '
                            'агреговану ститистику документів на порталі '
                            '(загальні кількість/кількість оприлюднених)')
+trans_parser.add_argument('--all-regions', action='store_true',
+                          dest='all_regions',
+                          help='надіслати окремий запит для кожного '
+                          'регіону (або для регіонів з -t) паралельно та '
+                          "об'єднати результати")
+trans_parser.add_argument('--concurrency', type=int,
+                          default=FANOUT_CONCURRENCY,
+                          help='максимальна кількість одночасних запитів '
+                          'для --all-regions, за замовчуванням -- '
+                          '{}'.format(FANOUT_CONCURRENCY))
+trans_parser.add_argument('--buffer-size', type=int,
+                          default=DOWNLOAD_CHUNK_SIZE, dest='buffer_size',
+                          help='розмір буфера запису завантажень у байтах, '
+                          'за замовчуванням -- {}'.format(DOWNLOAD_CHUNK_SIZE))
+export_parser.add_argument('-d', '--database', dest='database',
+                           default='edata',
+                           help="ім'я файла бази даних (БЕЗ розширення), "
+                           "за замовчуванням -- `edata`")
+export_parser.add_argument('-o', '--output', dest='output', default=None,
+                           help="ім'я файла для вивантаження, за "
+                           "замовчуванням -- `edata.<формат>`")
+export_parser.add_argument('-f', '--format', dest='format', choices=FORMATS,
+                           default='csv',
+                           help='формат файла, за замовчуванням -- CSV')
+export_parser.add_argument('--encoding', choices=CSV_ENCODINGS,
+                           default='utf-8',
+                           help='кодування CSV (`cp1251` -- як на порталі), '
+                           'за замовчуванням -- `utf-8`')
+export_parser.add_argument('-m', '--by-month', action='store_true',
+                           dest='by_month',
+                           help='записувати кожен місяць в окремий файл')
+export_parser.add_argument('-p', '--payers', dest='payers', default=[],
+                           help='відправники платежу', type=str, nargs='+')
+export_parser.add_argument('-r', '--receipts', dest='receipts', default=[],
+                           help='отримувачі платежу', type=str, nargs='+')
+export_parser.add_argument('-s', '--startdate', type=str, dest='startdate',
+                           help='початкова дата трансакцій')
+export_parser.add_argument('-e', '--enddate', type=str, dest='enddate',
+                           help='кінцева дата трансакцій')
+export_parser.add_argument('-t', '--treasury', nargs='+', default=[],
+                           type=int, dest='treasury',
+                           help='перелік регіональних управлінь ДКС')
+export_parser.add_argument('--shard', action='store_true',
+                           help='база даних розділена за регіонами (див. '
+                           'shards.py)')
+export_parser.add_argument('-b', '--batch', type=int, default=EXPORT_BATCH,
+                           help='кількість записів, що читаються з бази за '
+                           'один раз, за замовчуванням -- '
+                           '{}'.format(EXPORT_BATCH))
+export_parser.add_argument('-v', '--verbose', action='store_true',
+                           help='виводити додаткову інформацію')
 trans_parser.add_argument('--zipname', type=str, default='_transactions',
                           help='імя ZIP-файлу з транзакціями',)
 
@@ -152,6 +255,16 @@ def show_db_stats(processed_records, present_records):
     return
 
 
+def show_upsert_stats(added, revised, unchanged):
+    sys.stdout.write("Кількість нових записів:" + ' ' * 6 + "{:>10}\n"
+                     .format(added))
+    sys.stdout.write("Кількість змінених записів:" + ' ' * 3 + "{:>10}\n"
+                     .format(revised))
+    sys.stdout.write("Кількість незмінних записів:" + ' ' * 2 + "{:>10}\n"
+                     .format(unchanged))
+    return
+
+
 def chunks(list_, n):
     """Yield successive n-sized chunks from list_."""
     for i in range(0, len(list_), n):
@@ -164,57 +277,221 @@ def _date_generator(edata_transactions):
         yield t
 
 
-def save_file(binary_iter_content, file_name, verbose=None):
-    with open(file_name, 'wb') as f:
-        for chunk in binary_iter_content(chunk_size=1024):
-            if chunk:
-                f.write(chunk)
-    return
+def check_zip(file_name, display_name=None):
+    """Raises CorruptDownloadError unless `file_name` is a ZIP archive
+    with readable central directory and correct CRC of every member."""
+    display_name = display_name or file_name
+    try:
+        with zipfile.ZipFile(file_name) as zf:
+            bad_member = zf.testzip()
+    except (zipfile.BadZipFile, EOFError) as e:
+        raise CorruptDownloadError(display_name, str(e))
+    if bad_member is not None:
+        raise CorruptDownloadError(
+            display_name, 'невірна CRC у `{}`'.format(bad_member))
 
 
-def make_sqlite(edata, verbose=False):
-    db = sqlite3.connect('edata.sqlite')
+def _load_part_meta(meta_name, request_key):
+    try:
+        with open(meta_name, encoding='utf-8') as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    return meta if meta.get('request') == request_key else {}
+
+
+def _discard_part(part_name, meta_name):
+    for name in (part_name, meta_name):
+        if os.path.exists(name):
+            os.unlink(name)
+
+
+def _range_validator(meta):
+    """Value for `If-Range` header: strong ETag or Last-Modified date."""
+    etag = meta.get('etag')
+    if etag and not etag.startswith('W/'):
+        return etag
+    return meta.get('last_modified')
+
+
+def download(url, file_name, params=None, headers=None, verbose=None,
+             chunk_size=DOWNLOAD_CHUNK_SIZE, validate_zip=True,
+             retries=DOWNLOAD_RETRIES, session=None,
+             timeout=DOWNLOAD_TIMEOUT):
+    """Downloads `url` to `file_name` through `<file_name>.part`.
+
+    Interrupted transfers are retried, continuing the `.part` file with
+    a `Range` request guarded by `If-Range` (ETag or Last-Modified saved in
+    `<file_name>.part.json`), so a resource changed in between is fetched
+    again from the start, as well as when the server ignores ranges.
+    The complete file is checked for ZIP integrity and atomically renamed
+    into place.
+
+    Requests go through `session` (`requests.Session`) if given,
+    `timeout` is passed to every request.
+
+    Returns dict with size in bytes, elapsed seconds, bytes per second and
+    number of resumed bytes."""
+    path = Path(file_name)
+    part_name = str(path) + '.part'
+    meta_name = part_name + '.json'
+    request_key = [url, sorted([k, str(v)]
+                               for k, v in (params or {}).items())]
+    started = time.perf_counter()
+    resumed = 0
+    for attempt in range(retries + 1):
+        meta = _load_part_meta(meta_name, request_key)
+        offset = os.path.getsize(part_name) \
+            if meta and os.path.exists(part_name) else 0
+        request_headers = dict(headers or HEADERS)
+        if offset and _range_validator(meta):
+            request_headers['Range'] = 'bytes={}-'.format(offset)
+            request_headers['If-Range'] = _range_validator(meta)
+        else:
+            offset = 0
+        try:
+            r = (session or requests).get(
+                url, headers=request_headers, params=params, stream=True,
+                timeout=timeout)
+            if r.status_code == 416:
+                # .part не відповідає ресурсу на сервері, починаємо знову
+                _discard_part(part_name, meta_name)
+                continue
+            r.raise_for_status()
+            if r.status_code == 206 and r.headers.get(
+                    'Content-Range', '').startswith(
+                        'bytes {}-'.format(offset)):
+                mode = 'ab'
+                resumed += offset
+            else:
+                mode, offset = 'wb', 0
+            meta = {'request': request_key,
+                    'etag': r.headers.get('ETag'),
+                    'last_modified': r.headers.get('Last-Modified')}
+            with open(meta_name, 'w', encoding='utf-8') as f:
+                json.dump(meta, f)
+            with open(part_name, mode) as f:
+                for chunk in r.iter_content(chunk_size=chunk_size):
+                    if chunk:
+                        f.write(chunk)
+                f.flush()
+                os.fsync(f.fileno())
+            break
+        except (ConnectionError, ChunkedEncodingError, Timeout,
+                ProtocolError) as e:
+            if attempt == retries:
+                raise
+            if verbose:
+                sys.stderr.write('Завантаження `{}` перервано ({}), '
+                                 'продовжуємо…\n'.format(path, e))
+            time.sleep(min(2 ** attempt, 30))
+    else:
+        raise CorruptDownloadError(path, 'сервер відхиляє запити Range')
+    if validate_zip:
+        try:
+            check_zip(part_name, display_name=path)
+        except CorruptDownloadError:
+            _discard_part(part_name, meta_name)
+            raise
+    os.replace(part_name, path)
+    _discard_part(part_name, meta_name)
+    elapsed = time.perf_counter() - started
+    size = os.path.getsize(path)
+    stats = {'bytes': size, 'seconds': round(elapsed, 3),
+             'bytes_per_sec': round((size - resumed) / elapsed)
+             if elapsed else size,
+             'resumed_bytes': resumed}
+    if verbose:
+        sys.stdout.write('{}: {} байт, {:.1f} МБ/с\n'.format(
+            path, size, stats['bytes_per_sec'] / 1024 / 1024))
+    return stats
+
+
+def ensure_hash_column(cursor, table='edata'):
+    """Adds `row_hash` column to the tables created before upsert mode."""
+    cursor.execute('PRAGMA table_info({})'.format(table))
+    if 'row_hash' not in [r[1] for r in cursor.fetchall()]:
+        cursor.execute(
+            'ALTER TABLE {} ADD COLUMN row_hash blob NULL'.format(table))
+
+
+def upsert_rows(cursor, rows, columns, table='edata'):
+    """Inserts new rows and rewrites only those rows whose content hash
+    differs from the stored one, identical rows are not touched at all.
+
+    `rows` is an iterable of dicts having all the keys from `columns`,
+    `columns` must contain `id`. Returns tuple of counts
+    (added, revised, unchanged)."""
+    added = revised = unchanged = 0
+    insert_qry = "INSERT INTO {} ({}, row_hash) VALUES ({}, :row_hash)" \
+        .format(table, ', '.join(columns),
+                ', '.join(':' + k for k in columns))
+    update_qry = "UPDATE {} SET {}, row_hash = :row_hash WHERE id = :id" \
+        .format(table, ', '.join('{0} = :{0}'.format(k) for k in columns
+                                 if k != 'id'))
+    select_qry = "SELECT id, row_hash FROM {} WHERE id IN (%s)".format(table)
+    for chunk in chunks(list(rows), SQLITE_MAX_VARIABLE_NUMBER):
+        # остання версія запису з однаковим id перемагає
+        incoming = {}
+        for d in chunk:
+            d = dict(d)
+            d['row_hash'] = row_hash(d[k] for k in columns)
+            incoming[d['id']] = d
+        placeholders = ', '.join(['?'] * len(incoming))
+        cursor.execute(select_qry % placeholders, list(incoming))
+        stored = dict(cursor.fetchall())
+        to_insert, to_update = [], []
+        for id_, d in incoming.items():
+            if id_ not in stored:
+                to_insert.append(d)
+            elif stored[id_] != d['row_hash']:
+                to_update.append(d)
+            else:
+                unchanged += 1
+        if to_insert:
+            cursor.executemany(insert_qry, to_insert)
+        if to_update:
+            cursor.executemany(update_qry, to_update)
+        added += len(to_insert)
+        revised += len(to_update)
+    return added, revised, unchanged
+
+
+def make_sqlite(edata, verbose=False, upsert=False, shard=False,
+                database='edata'):
+    if shard:
+        # кожен регіон -- в окремий файл, див. shards.py
+        counts = [make_sqlite(rows, verbose=verbose, upsert=upsert,
+                              database=name)
+                  for name, rows in split_by_shard(edata, database).items()]
+        return tuple(map(sum, zip(*counts))) if upsert and counts else None
+    db = sqlite3.connect(database + '.sqlite')
     c = db.cursor()
-    qry = """CREATE TABLE IF NOT EXISTS edata (amount real, payer_bank text,
-        region_id integer, trans_date text, recipt_name text,
-        id integer PRIMARY KEY ON CONFLICT REPLACE,
-        payment_details text, recipt_mfo integer NULL, payer_edrpou text,
-        recipt_bank text NULL, recipt_edrpou text, payer_mfo integer NULL,
-        payer_name text NULL, doc_number text NULL, doc_date text,
-        doc_v_date text, payer_account text, recipt_account text,
-        doc_add_attr text NULL);"""
-    values = {'amount': None, 'payer_bank': None, 'region_id': None,
-              'trans_date': None, 'recipt_name': None, 'id': None,
-              'payment_details': None, 'recipt_mfo': None,
-              'payer_edrpou': None, 'recipt_bank': None,
-              'recipt_edrpou': None, 'payer_mfo': None, 'payer_name': None,
-              'doc_number': None, 'doc_date': None, 'doc_v_date': None,
-              'payer_account': None, 'recipt_account': None,
-              'doc_add_attr': None}
-    c.execute(qry)
-
-    qry = """INSERT INTO edata (amount, payer_bank, region_id, trans_date,
-        recipt_name, id, payment_details, recipt_mfo, payer_edrpou,
-        recipt_bank, recipt_edrpou, payer_mfo, payer_name, doc_number,
-        doc_date, doc_v_date, payer_account, recipt_account, doc_add_attr)
-        VALUES (:amount, :payer_bank, :region_id, :trans_date, :recipt_name,
-        :id, :payment_details, :recipt_mfo, :payer_edrpou, :recipt_bank,
-        :recipt_edrpou, :payer_mfo, :payer_name, :doc_number, :doc_date,
-        :doc_v_date, :payer_account, :recipt_account, :doc_add_attr);"""
+    ensure_schema(db)
+    layout = get_layout(db)
+
+    if upsert:
+        ensure_hash_column(c, layout.table)
+        counts = upsert_rows(c, (layout.encode(d) for d in edata),
+                             layout.columns, table=layout.table)
+        db.commit()
+        if verbose:
+            show_upsert_stats(*counts)
+        return counts
+
     try:
         present_records: int = 0
         if verbose:
             for chunk in chunks(edata, SQLITE_MAX_VARIABLE_NUMBER):
                 id2insert = [x['id'] for x in chunk]
                 placeholders = ', '.join(['?']*len(id2insert))
-                query = "SELECT COUNT(*) FROM edata WHERE id IN (%s)" \
-                        % placeholders
+                query = "SELECT COUNT(*) FROM {} WHERE id IN (%s)" \
+                        .format(layout.table) % placeholders
                 c.execute(query, id2insert)
                 chunk_count = c.fetchone()[0]
                 present_records += chunk_count
 
-        c.executemany(qry, ({k: d.get(k, values[k]) for k in values}
-                      for d in edata))
+        c.executemany(layout.insert, [layout.encode(d) for d in edata])
         if verbose:
             processed_records = c.rowcount
             show_db_stats(processed_records, present_records)
@@ -224,57 +501,171 @@ def make_sqlite(edata, verbose=False):
 
 
 def fetch(qry_dict, output_format=None, ascii=False, indent=False,
-          keep_json=None, top100=None, verbose=False, zipname=None):
+          keep_json=None, top100=None, verbose=False, zipname=None,
+          upsert=False, buffer_size=DOWNLOAD_CHUNK_SIZE, session=None,
+          shard=False):
+    """Fetches transactions and saves them in `output_format`.
+
+    Returns download statistics for CSV, response JSON otherwise (counts of
+    added/revised/unchanged records for SQLite upsert). Errors are raised:
+    `CorruptDownloadError`, `EDataSystemError`, `OutdatedSchemaError` or
+    exceptions of `requests`."""
     transactions_api_part = '/v2/api/transactions/top100' if top100 \
         and not qry_dict else '/v2/api/transactions/'
     if output_format == '0x4':
-        HEADERS['Accept'] = 'application/octet-stream'
+        return download(EDATA_API_URL + transactions_api_part, zipname,
+                        params=qry_dict,
+                        headers=dict(HEADERS,
+                                     Accept='application/octet-stream'),
+                        verbose=verbose, chunk_size=buffer_size,
+                        session=session)
+    r = (session or requests).get(EDATA_API_URL + transactions_api_part,
+                                  headers=HEADERS,
+                                  params=qry_dict,
+                                  timeout=DOWNLOAD_TIMEOUT,
+                                  )
+    r.raise_for_status()
+    edata_json = r.json()
+    if 'error' in edata_json:
+        raise EDataSystemError(edata_json['error'])
+    if output_format == '0x2':    # json
+        make_json(edata_json, ensure_ascii=ascii, indent=indent,
+                  verbose=verbose)
+    elif output_format == '0x8':  # sqlite
+        if keep_json:
+            make_json(edata_json, ensure_ascii=ascii, indent=indent,
+                      verbose=False)
+        counts = make_sqlite(_transactions_of(edata_json),
+                             verbose=verbose, upsert=upsert, shard=shard)
+        if counts:
+            return counts
+    return edata_json
+
+
+def _transactions_of(edata_json):
+    if isinstance(edata_json, dict) and 'response' in edata_json:
+        return edata_json['response']['transactions']
+    return edata_json
+
+
+def _fetch_region(api_part, qry_dict, region, output_format, save_dir,
+                  buffer_size=DOWNLOAD_CHUNK_SIZE):
+    """Fetches data for a single region. Returns tuple (region, result,
+    latency in seconds), where `result` is a path of the saved ZIP file for
+    CSV output, list of transactions otherwise, or an exception."""
+    params = dict(qry_dict, regions=[region])
+    started = time.perf_counter()
     try:
-        r = requests.get(EDATA_API_URL + transactions_api_part,
-                         headers=HEADERS,
-                         params=qry_dict
-                         )
         if output_format == '0x4':
-            if r.status_code == 200:
-                try:
-                    save_file(r.iter_content, zipname, verbose)
-                except EdataError as e:
-                    raise
-                else:
-                    return 0
-            elif r.status_code in (403, 403, 404, 500):
-                r.raise_for_status()
-        edata_json = r.json()
-        if 'error' in edata_json:
-            raise EDataSystemError(
-                edata_json['error']
-                )
-    except requests.exceptions.HTTPError as e:
-        print(e.args[0])
-        # raise
-        sys.exit(1)
-    except ConnectionError as e:
-        raise
-        print("Помилка з'єднання: `{}`".format(e.args[0].args[0]))
-        sys.exit(1)
-    except NoDataReturnError:
-        sys.exit(0)
-    except EDataSystemError as e:
-        print(e.message)
-        sys.exit(1)
-    except Exception:
-        raise
-        # sys.exit(1)
+            result = Path(save_dir, '{}.zip'.format(region))
+            download(EDATA_API_URL + api_part, result, params=params,
+                     headers=dict(HEADERS,
+                                  Accept='application/octet-stream'),
+                     chunk_size=buffer_size)
+        else:
+            r = requests.get(EDATA_API_URL + api_part, headers=HEADERS,
+                             params=params, timeout=DOWNLOAD_TIMEOUT)
+            r.raise_for_status()
+            edata_json = r.json()
+            if 'error' in edata_json:
+                raise EDataSystemError(edata_json['error'])
+            result = _transactions_of(edata_json)
+            for t in result:
+                t.setdefault('region_id', region)
+    except Exception as e:
+        result = e
+    return region, result, time.perf_counter() - started
+
+
+def _merge_region_zips(zip_paths, zipname):
+    """Writes CSV rows of every regional archive into a single member of
+    one ZIP, so readers that take the first CSV member see all regions.
+    Header lines are kept from the first archive only."""
+    header, last = False, b'\n'
+    with zipfile.ZipFile(zipname, 'w', zipfile.ZIP_DEFLATED) as out, \
+            out.open(MERGED_MEMBER, 'w') as dst:
+        for region, path in zip_paths:
+            with zipfile.ZipFile(path) as zf:
+                names = zf.namelist()
+                member = next((m for m in names
+                               if m.lower().endswith('.csv')), names[0])
+                with zf.open(member) as src:
+                    lines = b''.join(src.readline()
+                                     for _ in range(CSV_HEADER_LINES))
+                    if not header:
+                        dst.write(lines)
+                        header, last = True, lines[-1:] or last
+                    block = src.read(DOWNLOAD_CHUNK_SIZE)
+                    if block and last != b'\n':
+                        # попередній архів закінчився без переведення рядка
+                        dst.write(b'\r\n')
+                    while block:
+                        dst.write(block)
+                        last = block[-1:]
+                        block = src.read(DOWNLOAD_CHUNK_SIZE)
+
+
+def show_region_report(report):
+    for region, info in sorted(report.items()):
+        sys.stdout.write('{:>3} {:<20} {:>8.2f} с {:>10}\n'.format(
+            region, REGION_NAMES.get(region, ''), info['latency'],
+            info.get('error') or info.get('count', '')))
+    return
+
+
+def fetch_all_regions(qry_dict, regions, output_format=None, ascii=False,
+                      indent=False, keep_json=None, top100=None,
+                      verbose=False, zipname=None, upsert=False,
+                      concurrency=FANOUT_CONCURRENCY,
+                      buffer_size=DOWNLOAD_CHUNK_SIZE, shard=False):
+    """Sends one request per region concurrently (at most `concurrency`
+    at once) and merges results into a single output. Per-region latency
+    is kept in the `regions` part of the merged JSON (or in
+    `<zipname>.regions.json` for CSV output). If some regions fail, the
+    others are still saved and `RegionsFailedError` is raised afterwards."""
+    qry_dict = {k: v for k, v in qry_dict.items() if k != 'regions'}
+    api_part = '/v2/api/transactions/top100' if top100 \
+        and not qry_dict else '/v2/api/transactions/'
+    report, transactions_, zip_paths = {}, [], []
+    with tempfile.TemporaryDirectory() as save_dir, \
+            ThreadPoolExecutor(max_workers=max(1, concurrency)) as pool:
+        futures = [pool.submit(_fetch_region, api_part, qry_dict, region,
+                               output_format, save_dir, buffer_size)
+                   for region in regions]
+        for future in futures:
+            region, result, latency = future.result()
+            report[region] = {'latency': round(latency, 3)}
+            if isinstance(result, Exception):
+                report[region]['error'] = str(result)
+                sys.stderr.write('Регіон {}: {}\n'.format(region, result))
+            elif output_format == '0x4':
+                zip_paths.append((region, result))
+            else:
+                report[region]['count'] = len(result)
+                transactions_.extend(result)
+        if output_format == '0x4' and zip_paths:
+            _merge_region_zips(zip_paths, zipname)
+    if verbose:
+        show_region_report(report)
+    if output_format == '0x4':
+        with open(str(zipname) + '.regions.json', 'w') as f:
+            json.dump(report, f, indent=1)
     else:
-        if output_format == '0x2':    # json
-            make_json(edata_json, ensure_ascii=ascii, indent=indent,
+        merged = {'response': {'transactions': transactions_, 'errors': []},
+                  'regions': report}
+        if output_format == '0x2':
+            make_json(merged, ensure_ascii=ascii, indent=indent,
                       verbose=verbose)
-        elif output_format == '0x8':  # sqlite
+        elif output_format == '0x8':
             if keep_json:
-                make_json(edata_json, ensure_ascii=ascii, indent=indent,
+                make_json(merged, ensure_ascii=ascii, indent=indent,
                           verbose=False)
-            make_sqlite(edata_json,
-                        verbose=verbose)
+            make_sqlite(transactions_, verbose=verbose, upsert=upsert,
+                        shard=shard)
+    failed = [region for region in regions if 'error' in report[region]]
+    if failed:
+        raise RegionsFailedError(failed, len(regions))
+    return report
 
 
 def make_json(edata_json, ensure_ascii=False, indent=None, verbose=None):
@@ -291,24 +682,20 @@ def make_json(edata_json, ensure_ascii=False, indent=None, verbose=None):
 
 
 def checkdate(date_string):
+    """Returns `date_string` if it is a valid ISO 8601 date, raises
+    `ValueIsNotADateError` otherwise."""
     iso_date = ISO_DATE_TEMPLATE.match(date_string)
-    try:
-        if not iso_date:
-            raise ValueIsNotADateError(
-                'Передане значення `{}` не відповідає '
-                'допустимому формату дати. Допустимий формат ISO8601: '
-                '`YYYY-MM-DD`'.format(date_string)
-                )
-    except ValueIsNotADateError as e:
-        print(e.message)
-        sys.exit(1)
+    if not iso_date:
+        raise ValueIsNotADateError(
+            'Передане значення `{}` не відповідає '
+            'допустимому формату дати. Допустимий формат ISO8601: '
+            '`YYYY-MM-DD`'.format(date_string)
+            )
     try:
         datetime.strptime(date_string, "%Y-%m-%d")
     except ValueError as e:
-        print(e.args[0])
-        sys.exit(1)
-    else:
-        return date_string
+        raise ValueIsNotADateError(e.args[0])
+    return date_string
 
 
 def get_date(d):
@@ -317,47 +704,61 @@ def get_date(d):
 
 def check_date_order(startdate, enddate):
     if not get_date(startdate) < get_date(enddate):
-        raise DateOrderViolation
+        raise DateOrderError
     return
 
 
-def ping(regions=None):
+def ping(regions=None, session=None):
+    """Returns True if API (of regions if `regions`) responds."""
     ping_url_part = '/v2/regions/ping' if regions else \
         '/v2/api/transactions/ping'
+    r = (session or requests).get(
+        EDATA_API_URL + ping_url_part,
+        headers=HEADERS,
+        timeout=DOWNLOAD_TIMEOUT,
+        )
+    if r.status_code in (403, 404):
+        r.raise_for_status()
+    return r.status_code == 200
+
+
+def show_ping(regions=None):
     try:
-        r = requests.get(
-            EDATA_API_URL + ping_url_part,
-            headers=HEADERS,
-            )
-        if r.status_code == 200:
-            print('{}API is alive!'.format('Regions ' if regions else ''))
-        elif r.status_code in (403, 403, 404):
-            r.raise_for_status()
+        alive = ping(regions=regions)
     except (ConnectionError, ProtocolError) as e:
-        print("Помилка з'єднання: `{}`".format(e.args[0].args[0]))
+        print("Помилка з'єднання: `{}`".format(e))
         sys.exit(1)
-    else:
-        sys.exit(0)
+    except requests.exceptions.HTTPError as e:
+        print(e.args[0])
+        sys.exit(1)
+    if alive:
+        print('{}API is alive!'.format('Regions ' if regions else ''))
+    sys.exit(0)
+
+
+def get_lastload(verbose=None, session=None):
+    """Returns date (datetime.date) of the last complete load of
+    transactions."""
+    r = (session or requests).get(
+        EDATA_API_URL + '/v2/api/transactions/lastload',
+        headers=HEADERS,
+        timeout=DOWNLOAD_TIMEOUT,
+        )
+    if verbose:
+        if r.status_code == 200:
+            print('Response 200, OK…')
+    r.raise_for_status()
+    lastload_json = r.json()
+    return datetime.strptime(lastload_json['lastLoad'], '%Y-%m-%d').date()
 
 
 def show_lastload(verbose=None):
     try:
-        r = requests.get(
-            EDATA_API_URL + '/v2/api/transactions/lastload',
-            headers=HEADERS,
-            )
-        lastload_json = r.json()
-        if verbose:
-            if r.status_code == 200:
-                print('Response 200, OK…')
-        if r.status_code in (403, 403, 404):
-            r.raise_for_status()
+        d1 = get_lastload(verbose=verbose)
     except (ConnectionError, ProtocolError) as e:
-        print("Помилка з'єднання: `{}`".format(e.args[0].args[0]))
+        print("Помилка з'єднання: `{}`".format(e))
         sys.exit(1)
     else:
-        d = lastload_json['lastLoad']
-        d1 = datetime.strptime(d, '%Y-%m-%d')
         print(d1.strftime('%a, %b %d %Y'))
         sys.exit(0)
 
@@ -369,25 +770,24 @@ def compose_data_dict(
         enddate=None,
         regions=None
         ):
+    """Returns query parameters for transactions API. Raises
+    DatesWithoutPayersError if a date range is given without payers or
+    recipients."""
+    if (startdate or enddate) and not (payers_edrpous or recipt_edrpous):
+        if startdate != enddate:
+            raise DatesWithoutPayersError
     d = {}
-    try:
-        if (startdate or enddate) and not (payers_edrpous or recipt_edrpous):
-            if startdate != enddate:
-                raise DatesWithoutPayersError
-        if startdate:
-            d['startdate'] = startdate
-        if enddate:
-            d['enddate'] = enddate
-        if payers_edrpous:
-            d['payers_edrpous'] = payers_edrpous
-        if recipt_edrpous:
-            d['recipt_edrpous'] = recipt_edrpous
-        if regions:
-            d['regions'] = regions
-    except DatesWithoutPayersError:
-        pass
-    finally:
-        return d
+    if startdate:
+        d['startdate'] = startdate
+    if enddate:
+        d['enddate'] = enddate
+    if payers_edrpous:
+        d['payers_edrpous'] = payers_edrpous
+    if recipt_edrpous:
+        d['recipt_edrpous'] = recipt_edrpous
+    if regions:
+        d['regions'] = regions
+    return d
 
 
 def get_date_value(date_):
@@ -399,21 +799,23 @@ def transactions(results):
         if results.lastload and not (results.payers or results.receipts):
             show_lastload(verbose=results.verbose)
         elif results.ping and not (results.payers or results.receipts):
-            ping(regions=False)
+            show_ping(regions=False)
         elif results.lastload and (results.payers or results.receipts):
             raise OnlyLastLoadParameterIsAllowedError
         elif results.top100 and (results.payers or results.receipts):
             raise Top100WithEDRPOUError
-    except OnlyLastLoadParameterIsAllowedError:
+    except OnlyLastLoadParameterIsAllowedError as e:
+        sys.stderr.write('{}\n'.format(e))
         sys.exit(2)
-    except Top100WithEDRPOUError:
-        pass
+    except Top100WithEDRPOUError as e:
+        sys.stderr.write('{}\n'.format(e))
 
     try:
         output_formats = [results.json, results.csv, results.sqlite]
         if sum(output_formats) > 1:
             raise OnlyOneOutputFormatIsAllowedError
-    except OnlyOneOutputFormatIsAllowedError:
+    except OnlyOneOutputFormatIsAllowedError as e:
+        sys.stderr.write('{}\n'.format(e))
         sys.exit(2)
 
     # format constants:
@@ -437,73 +839,93 @@ def transactions(results):
         sys.stdout.write('Параметр `--keep-json` проігноровано, оскільки '
                          'збереження проводиться не в базу даних SQLite.\n')
 
-    startdate, enddate = get_date_value(results.startdate), \
-        get_date_value(results.enddate)
+    try:
+        startdate, enddate = get_date_value(results.startdate), \
+            get_date_value(results.enddate)
+    except ValueIsNotADateError as e:
+        print(e.message)
+        sys.exit(1)
 
     try:
         if not results.top100:
             if startdate != enddate and not (results.payers or results.receipts):
                 raise NoEDRPOUError
-    except NoEDRPOUError:
+    except NoEDRPOUError as e:
+        sys.stderr.write('{}\n'.format(e))
         sys.exit(2)
 
     if startdate and enddate:
         try:
             if startdate != enddate:
                 check_date_order(startdate, enddate)
-        except DateOrderViolation:
+        except DateOrderError as e:
+            sys.stderr.write('{}\n'.format(e))
             startdate, enddate = enddate, startdate
     if results.treasury:
         try:
             if not set(results.treasury).issubset(TREASURY):
                 raise WrongTreasuryInList
-        except WrongTreasuryInList:
+        except WrongTreasuryInList as e:
+            sys.stderr.write('{}\n'.format(e))
             sys.exit(2)
         finally:
             treasury = results.treasury
     else:
         treasury = results.treasury
 
-    qry = compose_data_dict(startdate=startdate,
-                            recipt_edrpous=results.receipts,
-                            payers_edrpous=results.payers,
-                            enddate=enddate,
-                            regions=treasury,
-                            )
-    fetch(qry, output_format=format_, ascii=results.ascii,
-          top100=results.top100, indent=results.indent,
-          keep_json=results.keep_json, verbose=results.verbose,
-          zipname=results.zipname)
+    try:
+        qry = compose_data_dict(startdate=startdate,
+                                recipt_edrpous=results.receipts,
+                                payers_edrpous=results.payers,
+                                enddate=enddate,
+                                regions=treasury,
+                                )
+    except DatesWithoutPayersError as e:
+        sys.stderr.write('{}\n'.format(e))
+        qry = compose_data_dict(recipt_edrpous=results.receipts,
+                                payers_edrpous=results.payers,
+                                regions=treasury,
+                                )
+    try:
+        if results.all_regions:
+            return fetch_all_regions(
+                qry, treasury or TREASURY, output_format=format_,
+                ascii=results.ascii, top100=results.top100,
+                indent=results.indent, keep_json=results.keep_json,
+                verbose=results.verbose, zipname=results.zipname,
+                upsert=results.upsert, concurrency=results.concurrency,
+                buffer_size=results.buffer_size, shard=results.shard)
+        return fetch(qry, output_format=format_, ascii=results.ascii,
+                     top100=results.top100, indent=results.indent,
+                     keep_json=results.keep_json, verbose=results.verbose,
+                     zipname=results.zipname, upsert=results.upsert,
+                     buffer_size=results.buffer_size, shard=results.shard)
+    except (CorruptDownloadError, OutdatedSchemaError,
+            RegionsFailedError) as e:
+        sys.stderr.write('{}\n'.format(e))
+        sys.exit(1)
+    except EDataSystemError as e:
+        print(e.message)
+        sys.exit(1)
+    except requests.exceptions.HTTPError as e:
+        print(e.args[0])
+        sys.exit(1)
+    except (ConnectionError, ProtocolError) as e:
+        print("Помилка з'єднання: `{}`".format(e))
+        sys.exit(1)
 
 
-def _stat_get_org(verbose=None):
+def _stat_get_org(verbose=None, file_name=ZIPPED_STAT_NAME, session=None):
     stat_part = '/v2/stat/organizations/csv'
-    HEADERS['Accept'] = 'application/octet-stream'
-    try:
-        r = requests.get(EDATA_API_URL + stat_part,
-                         headers=HEADERS,
-                         )
-        if r.status_code in (403, 403, 404):
-            r.raise_for_status()
-        if r.status_code != 200:
-            raise CannotFetchStatFileError
-    except CannotFetchStatFileError:
-        sys.exit(1)
-    except Exception:
-        raise
-    else:
-        save_file(r.iter_content, ZIPPED_STAT_NAME, verbose)
+    return download(EDATA_API_URL + stat_part, file_name,
+                    headers=dict(HEADERS, Accept='application/octet-stream'),
+                    verbose=verbose, session=session)
 
 
-def _stat_get_doc(url, ascii=None, verbose=None):
-    try:
-        _download_arbitrary_json(url, ascii=ascii, verbose=verbose,
-                                 json_filename='_stat_documents.json',
-                                 )
-    except Exception:
-        raise
-    else:
-        sys.exit(0)
+def _stat_get_doc(url, ascii=None, verbose=None, session=None):
+    return _download_arbitrary_json(url, ascii=ascii, verbose=verbose,
+                                    json_filename='_stat_documents.json',
+                                    session=session)
 
 
 def cabinets(results):
@@ -513,22 +935,82 @@ def cabinets(results):
             print("Fetching organizational documents statistics...")
         _stat_get_org(verbose=results.verbose)
 
-    except CannotFetchStatFileError:
-        sys.stderr.write("Не вдалося отримати файл статистики.\n")
+    except (CannotFetchStatFileError, CorruptDownloadError) as e:
+        sys.stderr.write('{}\n'.format(e))
         sys.exit(1)
     except Exception:
         raise
     else:
         if results.verbose:
             print("Organizational documents statistics saved successfully.")
+        if results.sqlite:
+            db = sqlite3.connect(results.database + '.sqlite')
+            try:
+                load_snapshot(db, ZIPPED_STAT_NAME, verbose=results.verbose)
+            except zipfile.BadZipFile as e:
+                sys.stderr.write('Не вдалося прочитати файл статистики: '
+                                 '{}\n'.format(e))
+                sys.exit(1)
+            finally:
+                db.close()
         sys.exit(0)
 
 
+def export_db(results):
+    if re.match(r'^.+\.sqlite$', results.database):
+        results.database = re.sub(r'^(.+)\.sqlite$', '\\1',
+                                  results.database)
+    db_file = results.database + '.sqlite'
+    if not results.shard and not os.path.isfile(db_file):
+        sys.stderr.write('Файл бази даних `{}` не існує\n'.format(db_file))
+        sys.exit(1)
+    try:
+        startdate, enddate = get_date_value(results.startdate), \
+            get_date_value(results.enddate)
+    except ValueIsNotADateError as e:
+        print(e.message)
+        sys.exit(1)
+    try:
+        if results.treasury and not set(results.treasury).issubset(TREASURY):
+            raise WrongTreasuryInList
+    except WrongTreasuryInList as e:
+        sys.stderr.write('{}\n'.format(e))
+        sys.exit(2)
+    output = results.output or 'edata.{}'.format(results.format)
+    try:
+        # до розділеної бази приєднуються лише файли потрібних регіонів,
+        # за потреби -- до кількох з'єднань
+        db = open_shard_groups(results.database, results.treasury) \
+            if results.shard else [sqlite3.connect(db_file)]
+    except (NoShardsError, OutdatedSchemaError) as e:
+        sys.stderr.write('{}\n'.format(e))
+        sys.exit(1)
+    try:
+        if not results.shard and schema_version(db[0]) < SCHEMA_VERSION:
+            raise OutdatedSchemaError(results.database)
+        counts = export(db, output, fmt=results.format,
+                        encoding=results.encoding, by_month=results.by_month,
+                        batch=results.batch, verbose=results.verbose,
+                        payers=results.payers, receipts=results.receipts,
+                        startdate=startdate, enddate=enddate,
+                        regions=results.treasury)
+    except (OutdatedSchemaError, UnencodableValueError) as e:
+        sys.stderr.write('{}\n'.format(e))
+        sys.exit(1)
+    finally:
+        close_all(db)
+    if results.verbose:
+        for path, count in counts.items():
+            sys.stdout.write('{:<32} {:>10}\n'.format(str(path), count))
+    sys.exit(0)
+
+
 def statistic(org, doc, ascii=None, verbose=None):
     try:
         if not (org or doc):
             raise StatisticProcNeedsParameterError
-    except StatisticProcNeedsParameterError:
+    except StatisticProcNeedsParameterError as e:
+        sys.stderr.write('{}\n'.format(e))
         sys.exit(1)
 
     try:
@@ -536,33 +1018,31 @@ def statistic(org, doc, ascii=None, verbose=None):
             _stat_get_org(verbose)
         elif doc:
             _stat_get_doc('/v2/stat/documents', ascii, verbose)
-    except Exception:
-        raise
+    except CorruptDownloadError as e:
+        sys.stderr.write('{}\n'.format(e))
+        sys.exit(1)
     else:
         sys.exit(0)
 
 
-def _download_arbitrary_json(url_part, ascii, json_filename, verbose):
+def _download_arbitrary_json(url_part, ascii, json_filename, verbose,
+                             session=None):
     """Downloads JSON data through API URL and saves it to
-    file with specified name"""
-    try:
-        r = requests.get(EDATA_API_URL + url_part,
-                         headers=HEADERS,
-                         )
-        if r.status_code in (403, 403, 404):
-            r.raise_for_status()
-    except Exception:
-        raise
-    else:
-        if r.status_code == 200:
-            with open(json_filename, 'w') as json_file:
-                json.dump(r.json(), json_file, ensure_ascii=ascii)
-        return
+    file with specified name, returns the data"""
+    r = (session or requests).get(EDATA_API_URL + url_part,
+                                  headers=HEADERS,
+                                  timeout=DOWNLOAD_TIMEOUT,
+                                  )
+    r.raise_for_status()
+    data = r.json()
+    with open(json_filename, 'w') as json_file:
+        json.dump(data, json_file, ensure_ascii=ascii)
+    return data
 
 
 def regions(ping_region=None, ascii=None, verbose=None):
     if ping_region:
-        ping(regions=True)
+        show_ping(regions=True)
     region_list_part = '/v2/regions'
     try:
         _download_arbitrary_json(
@@ -574,12 +1054,24 @@ def regions(ping_region=None, ascii=None, verbose=None):
         sys.exit(0)
 
 
-if __name__ == '__main__':
-    if len(sys.argv) == 1:
-        arg_parser.print_help()
-        sys.exit(2)
-    results = arg_parser.parse_args()
-    print(results)
+def output_name(results):
+    """Name of the file the command writes, profiling reports are saved
+    next to it."""
+    command = results.subparser_name
+    if command == 'transactions':
+        if results.json:
+            return 'edata.json'
+        if results.sqlite:
+            return 'edata.sqlite'
+        return str(results.zipname)
+    if command == 'export':
+        return results.output or 'edata.{}'.format(results.format)
+    if command == 'cabinets':
+        return ZIPPED_STAT_NAME
+    return command or 'edata'
+
+
+def run(results):
     command = results.subparser_name
     if command == 'transactions':
         transactions(results)
@@ -589,3 +1081,14 @@ if __name__ == '__main__':
         regions(results.ping, results.ascii)
     elif command == 'cabinets':
         cabinets(results)
+    elif command == 'export':
+        export_db(results)
+
+
+if __name__ == '__main__':
+    if len(sys.argv) == 1:
+        arg_parser.print_help()
+        sys.exit(2)
+    results = arg_parser.parse_args()
+    print(results)
+    profiled(run, results, output_name(results), results)
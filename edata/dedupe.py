@@ -0,0 +1,318 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2016-2025 Renat Nasridinov
+# This software may be freely distributed under the MIT license.
+# https://opensource.org/licenses/MIT The MIT License (MIT)
+# or see LICENSE file
+
+# Видалення повторних трансакцій (за `id`) з CSV, злитих за місяцями
+# (archive.sh, pipeline.py), та файлів Parquet (edata_convert.py). Дублікати
+# з'являються, коли день завантажено двічі або портал повторно публікує
+# записи; у SQLite їх прибирає `ON CONFLICT REPLACE`.
+#
+# Залишається найновіша копія: файли обробляються від найновішої дати (з
+# імені файла `YYYY-MM-DD...` чи `YYYYMM...`, інакше -- час модифікації) до
+# найстарішої, у межах файла -- останній рядок. Бачені `id` зберігаються у
+# відсортованих масивах NumPy (uint32, якщо значення вміщуються, інакше
+# int64), а не у множині Python: рік трансакцій займає сотні МБ, а не
+# гігабайти. Файл перезаписується, лише якщо з нього щось видалено; індекс
+# кодів ЄДРПОУ (`<файл>.edrpou.idx`, edrpou_index.py) перезаписаного Parquet
+# будується заново, бо номери рядків у ньому змінюються.
+#
+# З `--index` поруч з файлом зберігається `<файл>.ids.npz` -- відсортовані
+# унікальні `id`, кількість рядків, розмір і час модифікації файла. Файл, що
+# не змінився і не містить уже бачених `id`, не читається, тож повторний
+# запуск після нового дня читає лише цей день і файли зі спільними `id`.
+
+import argparse
+import csv
+import os
+import re
+import sys
+from datetime import date
+from pathlib import Path
+import numpy as np
+from .profiling import add_profile_argument, profiled
+
+
+CSV_ENCODING = 'cp1251'
+ID_INDEX_SUFFIX = '.ids.npz'
+CSV_HEADER_LINES = 2
+PARQUET_BATCH = 65536
+# `id`, що не є цілим числом; такі рядки не видаляються
+NO_ID = -1
+FILE_DATE = re.compile(r'(\d{4})-?(\d{2})(?:-?(\d{2}))?')
+
+arg_parser = argparse.ArgumentParser(
+    prog=None,
+    usage=None,
+    description="Видалення повторних трансакцій з CSV, злитих за місяцями, "
+                "та файлів Parquet; залишається копія з найновішого файла",
+    epilog=None
+    )
+arg_parser.add_argument('files', nargs='+',
+                        help='файли CSV (як створює archive.sh) або Parquet')
+arg_parser.add_argument('-o', '--output-dir', dest='output_dir', default=None,
+                        help='директорія для результату, за замовчуванням '
+                        '-- файли перезаписуються')
+arg_parser.add_argument('-n', '--dry-run', action='store_true',
+                        dest='dry_run',
+                        help='лише порахувати дублікати')
+arg_parser.add_argument('-i', '--index', action='store_true',
+                        help='зберігати індекс `id` поруч з файлами і не '
+                        'читати файли, що не змінилися')
+arg_parser.add_argument('-v', '--verbose', action='store_true',
+                        help='виводити кількість дублікатів для кожного файла')
+add_profile_argument(arg_parser)
+
+
+class SeenIds(object):
+    """Set of int ids kept as sorted NumPy runs.
+
+    Every added batch becomes a run; runs are merged while the previous one
+    is not larger than the last (as in a log-structured merge), so there
+    are at most log2(n) runs and each id is copied O(log n) times."""
+
+    def __init__(self):
+        self._runs = []
+
+    def __len__(self):
+        return sum(len(run) for run in self._runs)
+
+    @property
+    def nbytes(self):
+        return sum(run.nbytes for run in self._runs)
+
+    def contains(self, ids):
+        """Returns bool array: which of `ids` were added before."""
+        found = np.zeros(len(ids), dtype=bool)
+        for run in self._runs:
+            pos = np.searchsorted(run, ids)
+            pos[pos == len(run)] = 0
+            found |= run[pos] == ids
+        return found
+
+    def add(self, ids):
+        """Adds unique `ids` that are not in the set yet."""
+        if not len(ids):
+            return
+        self._runs.append(_compact(np.sort(ids)))
+        while len(self._runs) > 1 and \
+                len(self._runs[-2]) <= len(self._runs[-1]):
+            last = self._runs.pop()
+            merged = np.concatenate((self._runs.pop(), last))
+            # обидві частини вже відсортовано, timsort об'єднує за O(n)
+            merged.sort(kind='stable')
+            self._runs.append(merged)
+
+
+def _compact(ids):
+    if ids[0] >= 0 and ids[-1] <= np.iinfo(np.uint32).max:
+        return ids.astype(np.uint32)
+    return ids.astype(np.int64)
+
+
+def file_date(path):
+    """Date from the file name (`2024-03-01.parquet`, `202403.csv`), or
+    modification time."""
+    m = FILE_DATE.search(Path(path).stem)
+    if m:
+        try:
+            return date(int(m[1]), int(m[2]), int(m[3] or 1))
+        except ValueError:
+            pass
+    return date.fromtimestamp(os.stat(path).st_mtime)
+
+
+def _keep_mask(ids, seen):
+    """Rows to keep: the last row of every id that is not in `seen`, and
+    all rows without id. Adds kept ids to `seen`."""
+    valid = ids != NO_ID
+    # індекс останнього входження: перше у перевернутому масиві
+    reverse = ids[::-1]
+    uniques, first = np.unique(reverse, return_index=True)
+    last = len(ids) - 1 - first
+    new = (uniques != NO_ID) & ~seen.contains(uniques)
+    keep = ~valid
+    keep[last[new]] = True
+    seen.add(uniques[new])
+    return keep
+
+
+def _csv_rows(f):
+    """Yields (parsed row, raw text of the row) of an open CSV file, so rows
+    can be written back byte for byte."""
+    raw = []
+
+    def lines():
+        for line in f:
+            raw.append(line)
+            yield line
+    for row in csv.reader(lines(), delimiter=';'):
+        yield row, ''.join(raw)
+        raw.clear()
+
+
+def _open_csv(path, mode='r'):
+    # surrogateescape зберігає байти, невизначені у cp1251
+    return open(path, mode, encoding=CSV_ENCODING, errors='surrogateescape',
+                newline='')
+
+
+def _to_id(value):
+    try:
+        return int(value)
+    except ValueError:
+        return NO_ID
+
+
+def _csv_ids(path):
+    with _open_csv(path) as f:
+        rows = _csv_rows(f)
+        next(rows)
+        header, _ = next(rows)
+        column = header.index('id')
+        return np.fromiter((_to_id(row[column]) if len(row) > column
+                            else NO_ID for row, _ in rows), dtype=np.int64)
+
+
+def _write_csv(path, target, keep):
+    tmp_path = Path(str(target) + '.tmp')
+    with _open_csv(path) as f, _open_csv(tmp_path, 'w') as out:
+        rows = _csv_rows(f)
+        for _ in range(CSV_HEADER_LINES):
+            out.write(next(rows)[1])
+        out.writelines(raw for (_, raw), k in zip(rows, keep) if k)
+    os.replace(tmp_path, target)
+
+
+def _parquet_ids(path):
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.parquet as pq
+    ids = pq.read_table(str(path), columns=['id'])['id']
+    ids = pc.cast(ids, pa.int64(), safe=False)
+    return pc.fill_null(ids, NO_ID).to_numpy()
+
+
+def _write_parquet(path, target, keep):
+    import pyarrow.parquet as pq
+    source = pq.ParquetFile(str(path))
+    tmp_path = Path(str(target) + '.tmp')
+    offset = 0
+    with pq.ParquetWriter(str(tmp_path), source.schema_arrow) as writer:
+        for batch in source.iter_batches(batch_size=PARQUET_BATCH):
+            mask = keep[offset:offset + batch.num_rows]
+            offset += batch.num_rows
+            writer.write_batch(batch.filter(mask))
+    os.replace(tmp_path, target)
+
+
+def _rebuild_edrpou_index(path, target):
+    from .edrpou_index import INDEX_SUFFIX, build_index
+    if Path(str(path) + INDEX_SUFFIX).exists():
+        build_index(target)
+
+
+def _is_parquet(path):
+    return Path(path).suffix == '.parquet'
+
+
+def _id_index_path(path):
+    return Path(str(path) + ID_INDEX_SUFFIX)
+
+
+def load_id_index(path):
+    """Returns (rows, sorted unique ids) from `<path>.ids.npz`, or None if
+    there is no index or the file changed after it was written."""
+    try:
+        with np.load(str(_id_index_path(path))) as index:
+            stat, ids = index['stat'], index['ids']
+    except (OSError, KeyError, ValueError):
+        return None
+    st = os.stat(path)
+    if stat[0] != st.st_size or stat[1] != st.st_mtime_ns:
+        return None
+    return int(stat[2]), ids
+
+
+def save_id_index(path, ids, rows):
+    st = os.stat(path)
+    tmp_path = Path(str(_id_index_path(path)) + '.tmp')
+    with open(tmp_path, 'wb') as f:
+        np.savez(f, ids=ids, stat=np.array([st.st_size, st.st_mtime_ns,
+                                            rows], dtype=np.int64))
+    os.replace(tmp_path, _id_index_path(path))
+
+
+def dedupe(paths, output_dir=None, dry_run=None, verbose=None, index=None):
+    """Drops repeated transactions from `paths` (all CSV or all Parquet,
+    they are deduplicated against each other). With `index` unchanged files
+    are checked against their id index instead of being read. Returns dict
+    {path: (rows, dropped)}."""
+    order = sorted(paths, key=lambda p: (file_date(p), os.stat(p).st_mtime),
+                   reverse=True)
+    seen = SeenIds()
+    stats = {}
+    for path in order:
+        target = Path(output_dir, Path(path).name) if output_dir else path
+        cached = load_id_index(path) if index and target == path else None
+        if cached is not None and not seen.contains(cached[1]).any():
+            seen.add(cached[1])
+            stats[path] = (cached[0], 0)
+            if verbose:
+                sys.stdout.write('{:<32} {:>10} {:>8}\n'.format(
+                    Path(path).name, cached[0], 'індекс'))
+            continue
+        parquet = _is_parquet(path)
+        ids = _parquet_ids(path) if parquet else _csv_ids(path)
+        keep = _keep_mask(ids, seen)
+        dropped = int(len(keep) - keep.sum())
+        stats[path] = (len(keep), dropped)
+        if not dry_run:
+            if dropped or target != path:
+                if parquet:
+                    _write_parquet(path, target, keep)
+                    _rebuild_edrpou_index(path, target)
+                else:
+                    _write_csv(path, target, keep)
+            if index:
+                kept = np.unique(ids[keep])
+                save_id_index(target, kept[kept != NO_ID],
+                              int(keep.sum()))
+        if verbose:
+            sys.stdout.write('{:<32} {:>10} {:>8}\n'.format(
+                Path(path).name, len(keep), dropped))
+    if verbose:
+        sys.stdout.write("Унікальних id: {}, пам'ять: {:.1f} МБ\n".format(
+            len(seen), seen.nbytes / 1024 / 1024))
+    return stats
+
+
+def main():
+    results = arg_parser.parse_args()
+    if results.output_dir:
+        Path(results.output_dir).mkdir(parents=True, exist_ok=True)
+    profiled(run, results, Path(results.output_dir or
+                                Path(results.files[0]).parent, 'dedupe'),
+             results)
+
+
+def run(results):
+    stats = {}
+    # CSV та Parquet -- різні подання тих самих даних, тож окремо
+    for group in ([p for p in results.files if not _is_parquet(p)],
+                  [p for p in results.files if _is_parquet(p)]):
+        if group:
+            stats.update(dedupe(group, results.output_dir,
+                                dry_run=results.dry_run,
+                                verbose=results.verbose,
+                                index=results.index))
+    sys.stdout.write('Записів: {}, видалено дублікатів: {}\n'.format(
+        sum(rows for rows, _ in stats.values()),
+        sum(dropped for _, dropped in stats.values())))
+
+
+if __name__ == '__main__':
+    main()
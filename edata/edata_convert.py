@@ -5,8 +5,13 @@
 import pandas as pd
 import numpy as np
 pd.options.display.max_columns = 32
+import argparse
+import sys
 import time
 from os import scandir
+from .catalog import get_entry, open_catalog
+from .edrpou_index import build_index
+from .profiling import add_profile_argument, profiled
 
 
 cur_cat = pd.CategoricalDtype(
@@ -44,36 +49,156 @@ dtype= str_dict | {
 }
 
 
-def read_edata(csv):
+# Оптимізований профіль: текст у рядках Arrow, стовпці з великою кількістю
+# повторів -- категорії, дати розбираються під час читання за фіксованим
+# форматом, `amount` зменшується до float32, якщо це не змінює копійок.
+category_columns = [
+    'doc_vob', 'doc_vob_name', 'payer_edrpou', 'payer_name', 'payer_mfo',
+    'payer_bank', 'recipt_bank', 'recipt_mfo', 'payment_type', 'source_name',
+    'kekv', 'kpk', 'budgetCode'
+]
+date_columns = ['doc_date', 'doc_v_date', 'trans_date']
+DATE_FORMAT = '%Y-%m-%d'
+
+optimised_dtype = {
+    x: 'string[pyarrow]' for x in str_dict if x not in category_columns
+} | {x: 'category' for x in category_columns} | {
+    'currency': cur_cat, 'region_id': reg_cat,
+    'source_id': np.int32, 'amount': np.float64
+}
+
+PROFILES = {'current': dtype, 'optimised': optimised_dtype}
+
+
+def downcast_amount(df):
+    amount32 = df['amount'].astype(np.float32)
+    if (amount32.astype(np.float64).round(2) == df['amount'].round(2)).all():
+        df['amount'] = amount32
+    if 'amount_cop' in df.columns:
+        df['amount_cop'] = pd.to_numeric(df['amount_cop'], downcast='integer')
+    return df
+
+
+def parse_dates(df, profile='current'):
+    """Converts date columns in place, reporting values that are not dates
+    to stderr."""
+    for col in date_columns:
+        if profile == 'optimised':
+            if pd.api.types.is_datetime64_any_dtype(df[col]):
+                continue
+            # значення, що не відповідають формату, стають NaT
+            parsed = pd.to_datetime(df[col], format=DATE_FORMAT,
+                                    errors='coerce')
+            bad = parsed.isna() & df[col].notna()
+            if bad.any():
+                sys.stderr.write('{}: не дати {}\n'.format(
+                    col, df.loc[bad, col].unique()[:5].tolist()))
+            df[col] = parsed
+            continue
+        try:
+            df[col] = pd.to_datetime(df[col])
+        except Exception:
+            sys.stderr.write('{}: не вдалося розібрати дати\n'.format(col))
+    return df
+
+
+def read_edata(csv, profile='current', verbose=None):
     s = time.time()
-    _ = pd.read_csv(csv, encoding="cp1251", sep=";", skiprows=1,
-                    dtype=dtype,
-                    low_memory=False
-                   )
-    print(time.time() - s)
+    if profile == 'optimised':
+        _ = pd.read_csv(csv, encoding="cp1251", sep=";", skiprows=1,
+                        dtype=optimised_dtype,
+                        parse_dates=date_columns,
+                        date_format=DATE_FORMAT,
+                        low_memory=False
+                       )
+    else:
+        _ = pd.read_csv(csv, encoding="cp1251", sep=";", skiprows=1,
+                        dtype=dtype,
+                        low_memory=False
+                       )
+    if verbose:
+        print(f"{csv}: {time.time() - s:.2f} s")
     if 'doc_date' not in _.columns:
-        print(_.columns)
+        sys.stderr.write('{}: немає стовпця doc_date, стовпці: {}\n'.format(
+            csv, list(_.columns)))
         return 1
     return _
 
 
-with scandir("data") as it:
-    for i in it:
-        print(i.path)
-        if not i.path.endswith('csv.zip'):
-            continue
-        nm = i.path.split('/')[1].split('.')[0]
-        _ = read_edata(i.path)
-        if isinstance(_, int) and _ == 1:
+def load_day(csv, profile='current', verbose=None):
+    """Reads daily CSV with the given dtype profile and parses dates.
+    Returns DataFrame, or 1 if the file is not an E-Data CSV."""
+    _ = read_edata(csv, profile, verbose)
+    if isinstance(_, int):
+        return _
+    _ = parse_dates(_, profile)
+    if profile == 'optimised':
+        _ = downcast_amount(_)
+    return _
+
+
+def memory_report(csv):
+    """Loads the file with every profile and returns a list of
+    (profile, seconds, megabytes) tuples."""
+    rows = []
+    for profile in PROFILES:
+        s = time.time()
+        _ = load_day(csv, profile)
+        if isinstance(_, int):
             break
-        if _.shape[1] != 32:
-            print("!")
-            continue
-        for col in ['doc_date','doc_v_date','trans_date']:
-            try:
-                _[col] = pd.to_datetime(_[col])
-            except:
-                print(col)
-                col1 = _[col].to_list()
-        _.to_parquet(f"{nm}.parquet")
+        rows.append((profile, time.time() - s,
+                     _.memory_usage(deep=True).sum() / 1024 / 1024))
+        del _
+    return rows
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(
+        description="Перетворює щоденні CSV-архіви Є-Data у Parquet")
+    arg_parser.add_argument('--dtypes', choices=list(PROFILES),
+                            default='optimised',
+                            help='профіль типів даних при читанні CSV')
+    arg_parser.add_argument('--report', action='store_true',
+                            help='лише порівняти пам\'ять та час читання '
+                            'кожного файлу з усіма профілями')
+    arg_parser.add_argument('--index', action='store_true',
+                            help='побудувати індекс ЄДРПОУ для кожного '
+                            'файлу Parquet')
+    arg_parser.add_argument('-v', '--verbose', action='store_true',
+                            help='виводити час читання кожного файлу')
+    add_profile_argument(arg_parser)
+    args = arg_parser.parse_args()
+    profiled(convert, args, 'edata_convert', args)
+
+
+def convert(args):
+    catalog = open_catalog("data")
+
+    with scandir("data") as it:
+        for i in it:
+            print(i.path)
+            if not i.path.endswith('csv.zip'):
+                continue
+            entry = get_entry(catalog, i.path)
+            if entry is not None and not entry['ok']:
+                print(entry['error'])
+                continue
+            nm = i.path.split('/')[1].split('.')[0]
+            if args.report:
+                for profile, seconds, mb in memory_report(i.path):
+                    print(f"{nm}\t{profile:<10}\t{seconds:8.2f} s"
+                          f"\t{mb:10.1f} MB")
+                continue
+            _ = load_day(i.path, args.dtypes, args.verbose)
+            if isinstance(_, int) and _ == 1:
+                break
+            if _.shape[1] != 32:
+                print("!")
+                continue
+            _.to_parquet(f"{nm}.parquet")
+            if args.index:
+                build_index(f"{nm}.parquet")
+
 
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,275 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2016-2025 Renat Nasridinov
+# This software may be freely distributed under the MIT license.
+# https://opensource.org/licenses/MIT The MIT License (MIT)
+# or see LICENSE file
+
+# Індекс кодів ЄДРПОУ для кожного щоденного файлу (ZIP з CSV або Parquet).
+# Поруч з файлом записується `<файл>.edrpou.idx`: фільтр Блума за кодами
+# платників та отримувачів і відсортовані пари код -> номер рядка окремо для
+# `payer_edrpou` та `recipt_edrpou` (унікальні коди, зсуви та номери
+# рядків). Пошук відкриває лише ті файли, фільтр яких може містити код, і
+# читає лише потрібні рядки (групи рядків Parquet).
+
+import argparse
+import csv
+import hashlib
+import io
+import struct
+import sys
+import zipfile
+from array import array
+from bisect import bisect_left
+from pathlib import Path
+from .schema import encode_code
+
+
+INDEX_SUFFIX = '.edrpou.idx'
+MAGIC = b'EDIX'
+VERSION = 1
+# m, k, кількість кодів і рядків платників, кількість кодів і рядків
+# отримувачів
+HEADER = struct.Struct('<4sBIBIIII')
+BLOOM_BITS_PER_KEY = 10
+BLOOM_HASHES = 7
+CSV_ENCODING = 'cp1251'
+ROLES = ('payer_edrpou', 'recipt_edrpou')
+
+arg_parser = argparse.ArgumentParser(
+    prog=None,
+    usage=None,
+    description="Індекси кодів ЄДРПОУ для щоденних файлів Є-Data та пошук "
+                "трансакцій організації за ними",
+    epilog=None
+    )
+subparsers = arg_parser.add_subparsers(dest='subparser_name')
+build_parser = subparsers.add_parser('build', help='побудувати індекси')
+build_parser.add_argument('files', nargs='+',
+                          help='ZIP- або Parquet-файли, чи директорії з ними')
+build_parser.add_argument('-v', '--verbose', action='store_true',
+                          help='виводити додаткову інформацію')
+lookup_parser = subparsers.add_parser('lookup', help='знайти трансакції')
+lookup_parser.add_argument('edrpou', help='код ЄДРПОУ')
+lookup_parser.add_argument('files', nargs='+',
+                           help='ZIP- або Parquet-файли, чи директорії з '
+                           'ними')
+lookup_parser.add_argument('-r', '--role', choices=ROLES + ('both',),
+                           default='both',
+                           help='шукати серед платників, отримувачів чи '
+                           'обох')
+
+
+def _positions(key, m, k):
+    digest = hashlib.blake2b(key.to_bytes(8, 'little', signed=True),
+                             digest_size=16).digest()
+    h1 = int.from_bytes(digest[:8], 'little')
+    h2 = int.from_bytes(digest[8:], 'little') | 1
+    return [(h1 + i * h2) % m for i in range(k)]
+
+
+def _native(a):
+    if sys.byteorder == 'big':
+        a.byteswap()
+    return a
+
+
+def _read_zip_codes(path):
+    with zipfile.ZipFile(path) as zf:
+        member = next((m for m in zf.namelist()
+                       if m.lower().endswith('.csv')), zf.namelist()[0])
+        with zf.open(member) as raw:
+            text = io.TextIOWrapper(raw, encoding=CSV_ENCODING, newline='')
+            reader = csv.reader(text, delimiter=';')
+            next(reader)
+            header = next(reader)
+            idx = [header.index(role) for role in ROLES]
+            for row in reader:
+                yield [row[i] if i < len(row) else None for i in idx]
+
+
+def _read_parquet_codes(path):
+    import pyarrow.parquet as pq
+    table = pq.read_table(str(path), columns=list(ROLES))
+    yield from zip(*(table.column(role).to_pylist() for role in ROLES))
+
+
+def _pack_pairs(pair_list):
+    """Sorted (code, row) pairs -> arrays of unique codes, offsets of
+    their first row in the rows array, and rows."""
+    pair_list.sort()
+    keys, offsets, rows = array('q'), array('i'), array('i')
+    for key, row in pair_list:
+        if not keys or keys[-1] != key:
+            keys.append(key)
+            offsets.append(len(rows))
+        rows.append(row)
+    offsets.append(len(rows))
+    return keys, offsets, rows
+
+
+def build_index(path):
+    """Writes `<path>.edrpou.idx` for the ZIP or Parquet file, returns path
+    of the index."""
+    path = Path(path)
+    reader = _read_parquet_codes if path.suffix == '.parquet' \
+        else _read_zip_codes
+    pairs = ([], [])
+    for row_number, codes in enumerate(reader(path)):
+        for pair_list, code in zip(pairs, codes):
+            code = encode_code(code, 8) if code is not None else None
+            if isinstance(code, int):
+                pair_list.append((code, row_number))
+    keys = {key for pair_list in pairs for key, _ in pair_list}
+    m = max(64, len(keys) * BLOOM_BITS_PER_KEY)
+    m += -m % 8
+    bloom = bytearray(m // 8)
+    for key in keys:
+        for pos in _positions(key, m, BLOOM_HASHES):
+            bloom[pos >> 3] |= 1 << (pos & 7)
+    index_path = Path(str(path) + INDEX_SUFFIX)
+    tmp_path = Path(str(index_path) + '.tmp')
+    with open(tmp_path, 'wb') as f:
+        sections = [_pack_pairs(pair_list) for pair_list in pairs]
+        f.write(HEADER.pack(MAGIC, VERSION, m, BLOOM_HASHES,
+                            len(sections[0][0]), len(sections[0][2]),
+                            len(sections[1][0]), len(sections[1][2])))
+        f.write(bloom)
+        for section in sections:
+            for a in section:
+                _native(a).tofile(f)
+    tmp_path.replace(index_path)
+    return index_path
+
+
+class EDRPOUIndex(object):
+    def __init__(self, index_path):
+        self.index_path = index_path
+        with open(index_path, 'rb') as f:
+            magic, version, self.m, self.k, *self._counts = \
+                HEADER.unpack(f.read(HEADER.size))
+            if magic != MAGIC or version != VERSION:
+                raise ValueError('{}: не є індексом ЄДРПОУ'.format(
+                    index_path))
+            self.bloom = f.read(self.m // 8)
+        self._maps = None
+
+    @property
+    def maps(self):
+        # відсортовані масиви читаються лише після позитивної перевірки
+        # фільтром Блума
+        if self._maps is None:
+            self._maps = {}
+            with open(self.index_path, 'rb') as f:
+                f.seek(HEADER.size + len(self.bloom))
+                for role, n_keys, n_rows in zip(ROLES, self._counts[::2],
+                                                self._counts[1::2]):
+                    keys, offsets, rows = array('q'), array('i'), array('i')
+                    keys.fromfile(f, n_keys)
+                    offsets.fromfile(f, n_keys + 1)
+                    rows.fromfile(f, n_rows)
+                    self._maps[role] = (_native(keys), _native(offsets),
+                                        _native(rows))
+        return self._maps
+
+    def may_contain(self, key):
+        return all(self.bloom[pos >> 3] & (1 << (pos & 7))
+                   for pos in _positions(key, self.m, self.k))
+
+    def rows(self, key, roles=ROLES):
+        """Sorted row numbers where `key` occurs in any of `roles`."""
+        if not self.may_contain(key):
+            return []
+        found = set()
+        for role in roles:
+            keys, offsets, rows = self.maps[role]
+            i = bisect_left(keys, key)
+            if i < len(keys) and keys[i] == key:
+                found.update(rows[offsets[i]:offsets[i + 1]])
+        return sorted(found)
+
+
+def _data_files(paths):
+    for p in map(Path, paths):
+        if p.is_dir():
+            yield from sorted(x for x in p.iterdir()
+                              if x.suffix in ('.zip', '.parquet'))
+        else:
+            yield p
+
+
+def _read_zip_rows(path, row_numbers):
+    wanted = set(row_numbers)
+    last = row_numbers[-1]
+    with zipfile.ZipFile(path) as zf:
+        member = next((m for m in zf.namelist()
+                       if m.lower().endswith('.csv')), zf.namelist()[0])
+        with zf.open(member) as raw:
+            text = io.TextIOWrapper(raw, encoding=CSV_ENCODING, newline='')
+            reader = csv.reader(text, delimiter=';')
+            next(reader)
+            header = next(reader)
+            for n, row in enumerate(reader):
+                if n in wanted:
+                    yield dict(zip(header, row))
+                if n >= last:
+                    break
+
+
+def _read_parquet_rows(path, row_numbers):
+    import pyarrow.parquet as pq
+    pf = pq.ParquetFile(str(path))
+    start = 0
+    for group in range(pf.metadata.num_row_groups):
+        end = start + pf.metadata.row_group(group).num_rows
+        in_group = [n - start for n in row_numbers if start <= n < end]
+        if in_group:
+            table = pf.read_row_group(group).take(in_group)
+            yield from table.to_pylist()
+        start = end
+
+
+def lookup(edrpou, paths, roles=ROLES):
+    """Yields (file path, row dict) for every transaction of `edrpou` in
+    indexed files among `paths` (files without index are skipped)."""
+    key = encode_code(edrpou, 8)
+    if not isinstance(key, int):
+        return
+    for path in _data_files(paths):
+        index_path = Path(str(path) + INDEX_SUFFIX)
+        if not index_path.exists():
+            continue
+        row_numbers = EDRPOUIndex(index_path).rows(key, roles)
+        if not row_numbers:
+            continue
+        reader = _read_parquet_rows if path.suffix == '.parquet' \
+            else _read_zip_rows
+        for row in reader(path, row_numbers):
+            yield path, row
+
+
+def main():
+    results = arg_parser.parse_args()
+    if results.subparser_name == 'build':
+        for path in _data_files(results.files):
+            index_path = build_index(path)
+            if results.verbose:
+                sys.stdout.write('{}\n'.format(index_path))
+    elif results.subparser_name == 'lookup':
+        roles = ROLES if results.role == 'both' else (results.role,)
+        writer = None
+        for path, row in lookup(results.edrpou, results.files, roles):
+            if writer is None:
+                writer = csv.DictWriter(sys.stdout,
+                                        ['file'] + list(row), delimiter=';',
+                                        extrasaction='ignore')
+                writer.writeheader()
+            writer.writerow(dict(row, file=path.name))
+    else:
+        arg_parser.print_help()
+        sys.exit(2)
+
+
+if __name__ == '__main__':
+    main()
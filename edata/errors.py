@@ -5,8 +5,6 @@
 # https://opensource.org/licenses/MIT The MIT License (MIT)
 # or see LICENSE file
 
-import sys
-
 
 class EdataError(Exception):
     def __init__(self, message, error_code=None):
@@ -16,84 +14,154 @@ class EdataError(Exception):
 
 class NoEDRPOUError(EdataError):
     def __init__(self):
-        sys.stderr.write(
+        super().__init__(
             'Не вказано ані відправників (параметр -p/--payers),'
             ' ані отримувачів (параметр -r/--receipts). Повинен бути вказаний'
-            ' хоч один з них.\n'
+            ' хоч один з них.'
             )
 
 
 class OnlyOneOutputFormatIsAllowedError(EdataError):
     def __init__(self):
-        sys.stderr.write(
+        super().__init__(
             'Забагато вихідних форматів, має бути вказано лише один '
-            'формат для зберігання.\n'
+            'формат для зберігання.'
             )
 
 
 class Top100WithEDRPOUError(EdataError):
     def __init__(self):
-        sys.stderr.write(
+        super().__init__(
             'Параметр --top100 не може використовуватися разом з кодами '
-            'ЄДРПОУ отримувачів коштів та платників, ігноруємо…\n'
+            'ЄДРПОУ отримувачів коштів та платників, ігноруємо…'
             )
 
 
 class CannotFetchStatFileError(EdataError):
     def __init__(self):
-        sys.stderr.write(
-            'Не вдалося отримати файл статистики.\n'
+        super().__init__(
+            'Не вдалося отримати файл статистики.'
             )
 
 
 class OnlyLastLoadParameterIsAllowedError(EdataError):
     def __init__(self):
-        sys.stderr.write(
+        super().__init__(
             'Параметр `lastload` не призначений для використання разом з '
-            'іншими параметрами.\n'
+            'іншими параметрами.'
             )
 
 
 class NoDataReturnError(EdataError):
     def __init__(self):
-        sys.stderr.write('Системою Є-Data на запит не повернуто даних.\n')
+        super().__init__('Системою Є-Data на запит не повернуто даних.')
 
 
 class EDataSystemError(EdataError):
     def __init__(self, message):
         self.message = "Помилка API порталу Є-Data:\n" \
             "{}\n".format(message)
+        super().__init__(self.message)
 
 
 class ValueIsNotADateError(EdataError):
     def __init__(self, message):
         self.message = message
+        super().__init__(message)
 
 
 class DateOrderError(EdataError):
     def __init__(self):
-        sys.stderr.write(
+        super().__init__(
             'Початкова дата більша за кінцеву, дати буде поміняно '
-            'місцями.\n'
+            'місцями.'
             )
 
 
 class DatesWithoutPayersError(EdataError):
     def __init__(self):
-        sys.stderr.write(
+        super().__init__(
             'Початкова та/або кінцева дата зазначені без кодів платників '
-            'або отримувачів, параметри проігноровано.\n'
+            'або отримувачів, параметри проігноровано.'
             )
 
 
 class StatisticProcNeedsParameterError(EdataError):
     def __init__(self):
-        sys.stderr.write(
+        super().__init__(
             'Ця процедура потребує наявності одного з параметрів `--doc` або '
-            '`--org`. Вкажіть потрібний і запустіть скрипт знову.\n'
+            '`--org`. Вкажіть потрібний і запустіть скрипт знову.'
             )
 
 
 class WrongTreasuryInList(EdataError):
     def __init__(self):
-        sys.stderr.write('Казначейства з даним кодом не існує.\n')
+        super().__init__('Казначейства з даним кодом не існує.')
+
+
+class OutdatedSchemaError(EdataError):
+    def __init__(self, database):
+        super().__init__(
+            'База даних `{}` має застарілу схему таблиці `edata`. Перетворіть '
+            'її командою `python -m edata.schema -d <ім\'я бази>` і '
+            'запустіть скрипт знову.'.format(database)
+            )
+        self.database = database
+
+
+class CorruptDownloadError(EdataError):
+    def __init__(self, file_name, reason):
+        super().__init__(
+            'Завантажений файл `{}` пошкоджено ({}), його не '
+            'збережено.'.format(file_name, reason)
+            )
+        self.file_name = file_name
+        self.reason = reason
+
+
+class NoShardsError(EdataError):
+    def __init__(self, database):
+        super().__init__(
+            'Не знайдено жодного файла бази даних `{}`, розділеної за '
+            'регіонами.'.format(database)
+            )
+        self.database = database
+
+
+class TooManyShardsError(EdataError):
+    def __init__(self, needed, limit):
+        super().__init__(
+            'Потрібно приєднати {} файлів бази даних, але SQLite дозволяє '
+            'не більше {} (SQLITE_MAX_ATTACHED). Вкажіть лише потрібні '
+            'регіони або використайте SQLite, зібраний з більшим '
+            'SQLITE_MAX_ATTACHED.'.format(needed, limit)
+            )
+        self.needed = needed
+        self.limit = limit
+
+
+class UnencodableValueError(EdataError):
+    def __init__(self, file_name, encoding, row_id, column):
+        super().__init__(
+            'Значення стовпця `{}` запису {} не можна записати у кодуванні '
+            '{}, вивантаження у файл `{}` перервано. Використайте '
+            '`--encoding utf-8`.'.format(column, row_id, encoding, file_name)
+            )
+        self.file_name = file_name
+        self.encoding = encoding
+        self.row_id = row_id
+        self.column = column
+
+
+class RegionsFailedError(EdataError):
+    def __init__(self, failed, total):
+        if len(failed) < total:
+            tail = 'збережено лише дані інших регіонів'
+        else:
+            tail = 'нічого не збережено'
+        super().__init__(
+            'Не вдалося отримати дані {} з {} регіонів ({}), {}.'.format(
+                len(failed), total, ', '.join(map(str, failed)), tail)
+            )
+        self.failed = failed
+        self.total = total
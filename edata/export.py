@@ -0,0 +1,224 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2016-2025 Renat Nasridinov
+# This software may be freely distributed under the MIT license.
+# https://opensource.org/licenses/MIT The MIT License (MIT)
+# or see LICENSE file
+
+# Вивантаження таблиці `edata` з бази даних SQLite у CSV, JSON Lines або
+# Parquet. Записи читаються курсором порціями (`fetchmany`) і одразу
+# записуються, тож використана пам'ять не залежить від кількості записів.
+# Записи кількох з'єднань (база, розділена за регіонами, див. shards.py)
+# об'єднуються у спільний потік.
+# Значення перетворюються з компактної схеми (див. schema.py) назад у
+# формат порталу.
+
+import csv
+import heapq
+import json
+import sys
+from itertools import chain, islice
+from datetime import date
+from pathlib import Path
+from .errors import UnencodableValueError
+from .schema import (
+    CODE_COLUMNS,
+    COLUMNS,
+    DATE_COLUMNS,
+    decode_date,
+    decode_row,
+    encode_code,
+    encode_date,
+    )
+
+
+EXPORT_BATCH = 50000
+FORMATS = ('csv', 'jsonl', 'parquet')
+CSV_ENCODINGS = ('utf-8', 'cp1251')
+# дата, для якої невідома `trans_date`, при розбитті за місяцями
+UNKNOWN_MONTH = 'unknown'
+
+
+def build_query(payers=None, receipts=None, startdate=None, enddate=None,
+                regions=None, by_month=None):
+    """Returns (SQL, parameters) selecting `COLUMNS` of rows matching the
+    filters. Filters of different kinds are combined with AND."""
+    where, params = [], []
+    for column, codes in (('payer_edrpou', payers),
+                          ('recipt_edrpou', receipts)):
+        if codes:
+            where.append('{} IN ({})'.format(
+                column, ', '.join('?' * len(codes))))
+            params.extend(encode_code(c, CODE_COLUMNS[column])
+                          for c in codes)
+    if startdate:
+        where.append('trans_date >= ?')
+        params.append(encode_date(startdate))
+    if enddate:
+        where.append('trans_date <= ?')
+        params.append(encode_date(enddate))
+    if regions:
+        where.append('region_id IN ({})'.format(
+            ', '.join('?' * len(regions))))
+        params.extend(regions)
+    qry = 'SELECT {} FROM edata'.format(', '.join(COLUMNS))
+    if where:
+        qry += ' WHERE ' + ' AND '.join(where)
+    if by_month:
+        # записи одного місяця мають йти поспіль; NULL та текстові дати
+        # (місяць `unknown`) -- одним блоком наприкінці
+        qry += " ORDER BY typeof(trans_date) != 'integer', trans_date"
+    return qry, params
+
+
+def _order_key(row):
+    # той самий порядок, що й ORDER BY у `build_query`
+    trans_date = row[COLUMNS.index('trans_date')]
+    return (0, trans_date) if isinstance(trans_date, int) else (1, 0)
+
+
+def _fetch(cursor, batch):
+    while True:
+        rows = cursor.fetchmany(batch)
+        if not rows:
+            return
+        yield from rows
+
+
+def _month(row):
+    trans_date = row[COLUMNS.index('trans_date')]
+    return decode_date(trans_date)[:7] if isinstance(trans_date, int) \
+        else UNKNOWN_MONTH
+
+
+class _CSVWriter(object):
+    """Raises `UnencodableValueError` for a row that cannot be written in
+    `encoding` (e.g. cp1251), rows before it are kept."""
+
+    def __init__(self, path, encoding='utf-8'):
+        self._path, self._encoding = path, encoding
+        self._file = open(path, 'w', encoding=encoding, newline='')
+        self._writer = csv.DictWriter(self._file, COLUMNS, delimiter=';')
+        self._writer.writeheader()
+
+    def write(self, rows):
+        for d in rows:
+            try:
+                self._writer.writerow(d)
+            except UnicodeEncodeError:
+                raise UnencodableValueError(
+                    self._path, self._encoding, d['id'],
+                    self._bad_column(d)) from None
+
+    def _bad_column(self, d):
+        for k in COLUMNS:
+            try:
+                str(d[k]).encode(self._encoding)
+            except UnicodeEncodeError:
+                return k
+
+    def close(self):
+        self._file.close()
+
+
+class _JSONLinesWriter(object):
+    def __init__(self, path, encoding='utf-8'):
+        self._file = open(path, 'w', encoding='utf-8')
+
+    def write(self, rows):
+        self._file.writelines(
+            json.dumps(d, ensure_ascii=False) + '\n' for d in rows)
+
+    def close(self):
+        self._file.close()
+
+
+def _parquet_date(value):
+    # текстові дати, що не є датами (напр. `невідомо`), -- NULL
+    if not isinstance(value, str):
+        return value
+    try:
+        return date.fromisoformat(value)
+    except ValueError:
+        return None
+
+
+class _ParquetWriter(object):
+    """Writes every batch as a separate row group."""
+
+    def __init__(self, path, encoding=None):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        self._pa = pa
+        types = {'amount': pa.float64(), 'id': pa.int64(),
+                 'region_id': pa.int64()}
+        types.update((k, pa.date32()) for k in DATE_COLUMNS)
+        self._schema = pa.schema(
+            [(k, types.get(k, pa.string())) for k in COLUMNS])
+        self._writer = pq.ParquetWriter(str(path), self._schema)
+
+    def write(self, rows):
+        rows = [dict(d, **{k: _parquet_date(d[k]) for k in DATE_COLUMNS})
+                for d in rows]
+        self._writer.write_table(
+            self._pa.Table.from_pylist(rows, schema=self._schema))
+
+    def close(self):
+        self._writer.close()
+
+
+WRITERS = {'csv': _CSVWriter, 'jsonl': _JSONLinesWriter,
+           'parquet': _ParquetWriter}
+
+
+def _month_path(path, month):
+    return path.with_name('{}-{}{}'.format(path.stem, month, path.suffix))
+
+
+def export(db, output, fmt='csv', encoding='utf-8', by_month=None,
+           batch=EXPORT_BATCH, verbose=None, **filters):
+    """Streams rows of `edata` matching `filters` (see `build_query`) to
+    `output`. `db` is a connection or a list of them (see
+    `shards.open_shard_groups`). With `by_month` every month goes to its
+    own file named `<stem>-YYYY-MM<suffix>`. Returns dict {file path:
+    number of rows}."""
+    output = Path(output)
+    qry, params = build_query(by_month=by_month, **filters)
+    connections = db if isinstance(db, (list, tuple)) else [db]
+    streams = [_fetch(c.execute(qry, params), batch) for c in connections]
+    if by_month and len(streams) > 1:
+        stream = heapq.merge(*streams, key=_order_key)
+    else:
+        stream = chain.from_iterable(streams)
+    counts = {}
+    writer = path = None
+    try:
+        while True:
+            rows = list(islice(stream, batch))
+            if not rows:
+                break
+            if by_month:
+                groups = {}
+                for r in rows:
+                    groups.setdefault(_month(r), []).append(r)
+            else:
+                groups = {None: rows}
+            for month, group in groups.items():
+                target = _month_path(output, month) if month else output
+                if target != path:
+                    if writer is not None:
+                        writer.close()
+                    # рядки впорядковано за датою, тож файл попереднього
+                    # місяця вже не знадобиться
+                    writer, path = WRITERS[fmt](target, encoding), target
+                    counts[path] = 0
+                writer.write([decode_row(r) for r in group])
+                counts[path] += len(group)
+            if verbose:
+                sys.stdout.write('Вивантажено записів: {:>10}\n'.format(
+                    sum(counts.values())))
+    finally:
+        if writer is not None:
+            writer.close()
+    return counts
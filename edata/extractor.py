@@ -2,7 +2,9 @@
 # -*- coding: utf-8 -*-
 
 
-from .core import transactions
+from .core import transactions, DOWNLOAD_CHUNK_SIZE
+from .edrpou_index import build_index
+from .profiling import add_profile_argument, profiled
 import sys
 import argparse
 import time
@@ -18,17 +20,11 @@ from typing import Optional
 
 Namespace = namedtuple('Namespace', "csv,indent,json,keep_json,lastload,"
     "payers,ping,receipts,sqlite,startdate,enddate,subparser_name,top100,"
-    "treasury,verbose,zipname,ascii")
+    "treasury,verbose,zipname,ascii,upsert,shard,all_regions,concurrency,"
+    "buffer_size")
 
 start_date = end_date = None
-
-try:
-    save_dir_name: Path = Path("edata", "data")
-    Path(save_dir_name).mkdir(parents=True, exist_ok=True)
-except Exception as e:
-    print("Не вдається створити директорію для збереження даних у \n"
-          "тимчасовій директорії. Створено у поточній.\n")
-    raise
+save_dir_name: Path = Path("edata", "data")
 
 
 def daterange(start_date: date, end_date: date):
@@ -38,7 +34,7 @@ def daterange(start_date: date, end_date: date):
 
 
 def extract(start_date: date, end_date: date, verbose: Optional[bool]=None,
-            save_dir=None):
+            save_dir=None, index: Optional[bool]=None):
     if save_dir is None:
         save_dir = Path('data')
         save_dir.mkdir(exist_ok=True)
@@ -54,8 +50,12 @@ def extract(start_date: date, end_date: date, verbose: Optional[bool]=None,
             indent=0, json=False, keep_json=False, lastload=False,
             payers=[], ping=False, receipts=[], sqlite=False,
             subparser_name='transactions', top100=False, treasury=[],
-            verbose=False, zipname=Path(save_dir / (tr_date + '.zip')))
+            verbose=False, zipname=Path(save_dir / (tr_date + '.zip')),
+            upsert=False, shard=False, all_regions=False, concurrency=1,
+            buffer_size=DOWNLOAD_CHUNK_SIZE)
         transactions(results)
+        if index and results.zipname.exists():
+            build_index(results.zipname)
         time.sleep(1.5)
 
 
@@ -66,6 +66,13 @@ def last_day_date(d: date):
 
 
 if __name__ == "__main__":
+    # директорія створюється лише під час запуску, не при імпорті модуля
+    try:
+        Path(save_dir_name).mkdir(parents=True, exist_ok=True)
+    except Exception as e:
+        print("Не вдається створити директорію для збереження даних у \n"
+              "тимчасовій директорії. Створено у поточній.\n")
+        raise
     arg_parser = argparse.ArgumentParser()
     arg_parser.add_argument('start_date', type=str,
                             help='початкова дата завантаження')
@@ -74,6 +81,10 @@ if __name__ == "__main__":
                             'береться останній день місяця `start_date`')
     arg_parser.add_argument('-v', '--verbose', action="store_true",
                             help='вивід дат')
+    arg_parser.add_argument('--index', action="store_true",
+                            help='побудувати індекс ЄДРПОУ для кожного '
+                            'завантаженого файлу')
+    add_profile_argument(arg_parser)
     args = arg_parser.parse_args()
     # print(args)
     try:
@@ -86,6 +97,7 @@ if __name__ == "__main__":
         print(e.args[0], "Невірний формат дати, має бути ISO 8601")
         sys.exit(1)
     else:
-        extract(start_date, end_date, verbose=args.verbose,
-                save_dir=save_dir_name)
+        profiled(extract, args, Path(save_dir_name, 'extractor'),
+                 start_date, end_date, verbose=args.verbose,
+                 save_dir=save_dir_name, index=args.index)
 
@@ -8,15 +8,33 @@
 
 
 import argparse
+import csv
 import errno
+import io
 import json
 import os
 import re
 import sqlite3
 import sys
-from datetime import datetime
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
 from os import scandir
-from edata import chunks, show_db_stats, SQLITE_MAX_VARIABLE_NUMBER
+from .core import (
+    chunks,
+    ensure_hash_column,
+    show_db_stats,
+    show_upsert_stats,
+    upsert_rows,
+    SQLITE_MAX_VARIABLE_NUMBER)
+from .errors import OutdatedSchemaError
+from .profiling import add_profile_argument, profiled
+from .schema import ensure_schema, get_layout
+from .shards import split_by_shard
+
+
+CSV_ENCODING = 'cp1251'
+CSV_BATCH = 50000
+SHARD_JOBS = 4
 
 
 class Error(Exception):
@@ -59,7 +77,8 @@ arg_parser = argparse.ArgumentParser(
     epilog=None
     )
 
-arg_parser.add_argument('-f', '--file', default=[], help='JSON-файл(и)',
+arg_parser.add_argument('-f', '--file', default=[], help='JSON-файл(и) або '
+                        'ZIP-архіви з CSV',
                         type=str,  nargs='+')
 arg_parser.add_argument('-d', '--database', dest='database',
                         default='edata',
@@ -70,79 +89,56 @@ arg_parser.add_argument('-v', '--verbose', dest='verbose',
                         help="виводити додаткову інформацію",
                         action='store_true',
                         )
+arg_parser.add_argument('-u', '--upsert', dest='upsert',
+                        help="перезаписувати лише записи, вміст яких "
+                        "змінився",
+                        action='store_true',
+                        )
+arg_parser.add_argument('--shard', action='store_true',
+                        help="записувати кожен регіон в окремий файл "
+                        "`<ім'я>.rNN.sqlite` (див. shards.py)")
+add_profile_argument(arg_parser)
+
+
+def _add_counts(totals, counts):
+    return tuple(map(sum, zip(totals, counts))) if counts else totals
 
 
 class EDataSQLDatabase(object):
-    def __init__(self, database=None, verbose=None):
-        self._database_name = database+'.sqlite' if database \
-            else 'edata.sqlite'
-        self._database = sqlite3.connect(self._database_name)
-        self.date8601 = True
+    def __init__(self, database=None, verbose=None, upsert=None,
+                 check_same_thread=True):
         self.verbose = verbose
-        self.values = {'amount': None, 'payer_bank': None, 'region_id': None,
-                       'trans_date': None, 'recipt_name': None, 'id': None,
-                       'payment_details': None, 'recipt_mfo': None,
-                       'payer_edrpou': None, 'recipt_bank': None,
-                       'recipt_edrpou': None, 'payer_mfo': None,
-                       'payer_name': None}
-        # регулярний вираз для перетворення iso 8601 datetime
-        # на iso8601 date
-        self._dt_8601 = re.compile(
-            "(\d{4}\-\d{2}\-\d{2}T\d{2}\:\d{2}\:\d{2})((?:\+|\-)\d{2}\:\d{2})"
-            )
-        if not self._check_table():
-            if self.verbose:
-                sys.stdout.write('Створюємо таблицю...\n')
-            self._create_table()
+        self.upsert = upsert
+        self._open(database, check_same_thread)
 
-    def _check_table(self):
+    def _open(self, database, check_same_thread):
+        self._database_name = database+'.sqlite' if database \
+            else 'edata.sqlite'
+        self._database = sqlite3.connect(self._database_name,
+                                         check_same_thread=check_same_thread)
+        # дати ISO 8601 datetime перетворюються на номер дня
+        # у schema.encode_row
+        ensure_schema(self._database, verbose=self.verbose)
+        # звичайна або нормалізована схема, див. schema.py
+        self.layout = get_layout(self._database)
+        if self.upsert:
+            ensure_hash_column(self._database.cursor(), self.layout.table)
+
+    def close(self):
+        self._database.close()
+
+    def _upsert_json(self, edata):
         c = self._database.cursor()
-        chk_qry = """SELECT name FROM sqlite_master WHERE type='table'
-        AND name = 'edata';""".format(self._database_name)
-        c.execute(chk_qry)
-        return c.fetchone()
-
-
-    def _create_table(self):
-        try:
-            c = self._database.cursor()
-            qry = """CREATE TABLE IF NOT EXISTS edata (amount real,
-                payer_bank text, region_id integer, trans_date text,
-                recipt_name text, id integer PRIMARY KEY ON CONFLICT REPLACE,
-                payment_details text, recipt_mfo integer NULL,
-                payer_edrpou text, recipt_bank text NULL, recipt_edrpou text,
-                payer_mfo integer NULL,
-                payer_name text NULL);"""
-            c.execute(qry)
-            return 0
-        except:
-            raise
-
-    def _iso8601_replace(self, edata):
-        transactions = self._date_generator(edata)
-        for t in transactions:
-            t['trans_date'] = self._iso8601_to_date(t['trans_date'])
-        return edata
-
-    def _date_generator(self, edata_transactions):
-        transactions = [t for t in edata_transactions]
-        for t in transactions:
-            yield t
-
-    def _iso8601_to_date(self, s):
-        m = self._dt_8601.match(s)
-        if m:
-            datetime_part, timezone_part = m.groups()
-        else:
-            return s
-
-        d = datetime.strptime(
-            "{}{}".format(datetime_part, re.sub('\:', '', timezone_part)),
-            '%Y-%m-%dT%H:%M:%S%z'
-            )
-        return d.strftime('%Y-%m-%d')
+        counts = upsert_rows(c, (self.layout.encode(d) for d in edata),
+                             self.layout.columns, table=self.layout.table)
+        self._database.commit()
+        if self.verbose:
+            show_upsert_stats(*counts)
+        return counts
 
     def _insert_json(self, edata):
+        if self.upsert:
+            return self._upsert_json(edata)
         c = self._database.cursor()
         if self.verbose:
             # загальна кількість записів, що є сумою кількостей
@@ -153,32 +149,23 @@ class EDataSQLDatabase(object):
             id2insert_lists = chunks([
                 x['id'] for x in edata],
                 SQLITE_MAX_VARIABLE_NUMBER)
-            already_exist_qry = 'SELECT COUNT(*) FROM edata WHERE id IN (%s)'
+            already_exist_qry = 'SELECT COUNT(*) FROM {} WHERE id IN ' \
+                '(%s)'.format(self.layout.table)
             for l in id2insert_lists:
                 placeholders = ', '.join(['?'] * len(l))
                 query = already_exist_qry % placeholders
                 c.execute(query, l)
                 chunk_count = c.fetchone()[0]
                 present_records += chunk_count
-        # convert dates
-        self._iso8601_replace(edata)
-
-        qry = """INSERT INTO edata (amount, payer_bank, region_id, trans_date,
-            recipt_name, id, payment_details, recipt_mfo, payer_edrpou,
-            recipt_bank, recipt_edrpou, payer_mfo, payer_name) VALUES (:amount,
-            :payer_bank, :region_id, :trans_date, :recipt_name, :id,
-            :payment_details, :recipt_mfo, :payer_edrpou, :recipt_bank,
-            :recipt_edrpou, :payer_mfo, :payer_name);"""
+
+        qry = self.layout.insert
         # запит ділиться на частини по 999, щоб задовольняти обмеженню
         # SQLITE_MAX_VARIABLE_NUMBER
         processed_records = 0
         for edata_chunk in chunks(edata, SQLITE_MAX_VARIABLE_NUMBER):
             try:
-                c.executemany(
-                    qry,
-                    ({k: d.get(k, self.values[k]) for k in self.values}
-                        for d in edata_chunk)
-                    )
+                c.executemany(qry, [self.layout.encode(d)
+                                    for d in edata_chunk])
                 processed_records += c.rowcount
             except:
                 raise
@@ -214,6 +201,78 @@ class EDataSQLDatabase(object):
         else:
             self._insert_json(json_data['response']['transactions'])
 
+    def import_zip(self, zip_file):
+        """Imports daily ZIP archive with CSV (as saved by `extractor.py`),
+        reading it in batches of `CSV_BATCH` rows. In upsert mode returns
+        counts (added, revised, unchanged)."""
+        totals = (0, 0, 0)
+        with zipfile.ZipFile(zip_file) as zf:
+            member = next((m for m in zf.namelist()
+                           if m.lower().endswith('.csv')), zf.namelist()[0])
+            with zf.open(member) as raw:
+                text = io.TextIOWrapper(raw, encoding=CSV_ENCODING,
+                                        newline='')
+                reader = csv.reader(text, delimiter=';')
+                # перший рядок -- назви стовпців українською
+                next(reader)
+                header = next(reader)
+                batch = []
+                for row in reader:
+                    batch.append(
+                        {k: v if v != '' else None
+                         for k, v in zip(header, row)})
+                    if len(batch) >= CSV_BATCH:
+                        totals = _add_counts(totals,
+                                             self._insert_json(batch))
+                        batch = []
+                if batch:
+                    totals = _add_counts(totals, self._insert_json(batch))
+        return totals if self.upsert else None
+
+
+class ShardedSQLDatabase(EDataSQLDatabase):
+    """Writes transactions of every region to its own database (see
+    shards.py); shards of a batch are written concurrently."""
+
+    def __init__(self, database=None, verbose=None, upsert=None,
+                 jobs=SHARD_JOBS):
+        self.jobs = jobs
+        super().__init__(database=database, verbose=verbose, upsert=upsert)
+
+    def _open(self, database, check_same_thread):
+        # файли регіонів відкриваються за потреби, див. `_shard`
+        self._database_name = database or 'edata'
+        self._shards = {}
+
+    def close(self):
+        for shard in self._shards.values():
+            shard.close()
+        self._shards.clear()
+
+    def _shard(self, name):
+        shard = self._shards.get(name)
+        if shard is None:
+            # кожен файл у межах порції пише лише один потік
+            shard = self._shards[name] = EDataSQLDatabase(
+                database=name, upsert=self.upsert, check_same_thread=False)
+        return shard
+
+    def _insert_json(self, edata):
+        groups = split_by_shard(edata, self._database_name)
+        shards = [self._shard(name) for name in groups]
+        with ThreadPoolExecutor(max_workers=max(1, self.jobs)) as pool:
+            counts = list(pool.map(lambda shard, rows:
+                                   shard._insert_json(rows),
+                                   shards, groups.values()))
+        if self.upsert:
+            counts = tuple(map(sum, zip(*counts)))
+            if self.verbose:
+                show_upsert_stats(*counts)
+            return counts
+        if self.verbose:
+            sys.stdout.write('Записано {} значень до {} файлів\n'.format(
+                len(edata), len(groups)))
+
 
 def check_file(json_file):
     try:
@@ -234,6 +293,10 @@ def main():
     results = arg_parser.parse_args()
     if re.match('^.+\.sqlite$', results.database):
         results.database = re.sub('^(.+)\.sqlite$', '\\1', results.database)
+    profiled(load, results, results.database + '.sqlite', results)
+
+
+def load(results):
     try:
         json_filenames = results.file if results.file else \
             [f.path for f in scandir() if f.is_file() and
@@ -242,11 +305,21 @@ def main():
             raise NoFilesProvidedError
     except NoFilesProvidedError:
         sys.exit(2)
-    else:
-        edb = EDataSQLDatabase(database=results.database,
-                               verbose=results.verbose)
+    database_class = ShardedSQLDatabase if results.shard \
+        else EDataSQLDatabase
+    try:
+        edb = database_class(database=results.database,
+                             verbose=results.verbose,
+                             upsert=results.upsert)
+        # файли регіонів відкриваються під час імпорту
         for f in [f for f in json_filenames if check_file(f)]:
-            edb.import_file(f)
+            if f.lower().endswith('.zip'):
+                edb.import_zip(f)
+            else:
+                edb.import_file(f)
+    except OutdatedSchemaError as e:
+        sys.stderr.write('{}\n'.format(e))
+        sys.exit(1)
 
 
 if __name__ == '__main__':
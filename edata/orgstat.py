@@ -0,0 +1,181 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2016-2025 Renat Nasridinov
+# This software may be freely distributed under the MIT license.
+# https://opensource.org/licenses/MIT The MIT License (MIT)
+# or see LICENSE file
+
+# Завантаження статистики документів організацій (файл `_stat`, ZIP з CSV)
+# до бази даних SQLite. CSV читається потоком прямо з архіву, поточний стан
+# кожної організації зберігається у таблиці `org_stat`, а у таблицю
+# `org_stat_changes` з датою знімка потрапляють лише додані, змінені та
+# зниклі організації. Якщо код організації повторюється у файлі, береться
+# перший рядок, решта рахуються як повтори.
+
+import argparse
+import csv
+import io
+import json
+import re
+import sqlite3
+import sys
+import zipfile
+from datetime import date
+from .schema import encode_date, row_hash
+
+
+WRITE_BATCH = 5000
+DEFAULT_ENCODING = 'cp1251'
+
+CREATE_TABLES = (
+    """CREATE TABLE IF NOT EXISTS org_stat (org text PRIMARY KEY,
+        row_hash blob NOT NULL, data text NOT NULL, snapshot integer);""",
+    """CREATE TABLE IF NOT EXISTS org_stat_changes (snapshot integer,
+        org text, change text, data text NULL,
+        PRIMARY KEY (snapshot, org) ON CONFLICT REPLACE);""",
+    )
+
+arg_parser = argparse.ArgumentParser(
+    prog=None,
+    usage=None,
+    description="Завантажує статистику документів організацій порталу "
+                "Є-Data до бази даних SQLite та зберігає зміни між знімками",
+    epilog=None
+    )
+arg_parser.add_argument('file', nargs='?', default='_stat',
+                        help='ZIP-файл статистики, за замовчуванням -- '
+                        '`_stat`')
+arg_parser.add_argument('-d', '--database', dest='database',
+                        default='edata',
+                        help="ім'я файла бази даних (БЕЗ розширення), "
+                        "за замовчуванням -- `edata`"
+                        )
+arg_parser.add_argument('-s', '--snapshot', type=str, default=None,
+                        help='дата знімка у форматі ISO 8601, за '
+                        'замовчуванням -- поточна')
+arg_parser.add_argument('-k', '--key', type=str, default=None,
+                        help='стовпець з кодом організації, за '
+                        'замовчуванням -- перший')
+arg_parser.add_argument('-e', '--encoding', type=str,
+                        default=DEFAULT_ENCODING,
+                        help='кодування CSV, за замовчуванням -- '
+                        '`{}`'.format(DEFAULT_ENCODING))
+arg_parser.add_argument('-v', '--verbose', dest='verbose',
+                        help="виводити додаткову інформацію",
+                        action='store_true',
+                        )
+
+
+class _Semicolon(csv.excel):
+    delimiter = ';'
+
+
+def _open_csv(zip_file, member, encoding):
+    raw = zip_file.open(member)
+    text = io.TextIOWrapper(raw, encoding=encoding, newline='')
+    header_line = text.readline()
+    try:
+        dialect = csv.Sniffer().sniff(header_line, delimiters=';,\t')
+    except csv.Error:
+        dialect = _Semicolon
+    header = next(csv.reader([header_line], dialect))
+    header[0] = header[0].lstrip('\ufeff')
+    return header, csv.reader(text, dialect)
+
+
+def _flush(db, current, changes):
+    if current:
+        db.executemany(
+            "INSERT OR REPLACE INTO org_stat (org, row_hash, data, snapshot) "
+            "VALUES (?, ?, ?, ?)", current)
+    if changes:
+        db.executemany(
+            "INSERT INTO org_stat_changes (snapshot, org, change, data) "
+            "VALUES (?, ?, ?, ?)", changes)
+    current.clear()
+    changes.clear()
+
+
+def load_snapshot(db, zip_path, snapshot=None, key=None,
+                  encoding=DEFAULT_ENCODING, verbose=None):
+    """Streams organizations statistics CSV from `zip_path` into `db` and
+    stores the diff against the previous snapshot in one pass.
+
+    Returns dict with counts of added, changed, removed and unchanged
+    organizations and of repeated rows. Raises ValueError if `key` is not
+    a column of the CSV."""
+    snapshot = encode_date(snapshot or date.today().isoformat())
+    for qry in CREATE_TABLES:
+        db.execute(qry)
+    previous = dict(db.execute('SELECT org, row_hash FROM org_stat'))
+    counts = dict.fromkeys(('added', 'changed', 'removed', 'unchanged',
+                            'duplicate'), 0)
+    current, changes = [], []
+    seen = set()
+    with zipfile.ZipFile(zip_path) as zf:
+        member = next((m for m in zf.namelist()
+                       if m.lower().endswith('.csv')), zf.namelist()[0])
+        header, reader = _open_csv(zf, member, encoding)
+        if key and key not in header:
+            raise ValueError(
+                'Стовпця `{}` немає у файлі статистики, наявні стовпці: '
+                '{}'.format(key, ', '.join(header)))
+        key_index = header.index(key) if key else 0
+        for row in reader:
+            if not row:
+                continue
+            org = row[key_index] if key_index < len(row) else ''
+            if org in seen:
+                counts['duplicate'] += 1
+                continue
+            seen.add(org)
+            h = row_hash(row)
+            old = previous.pop(org, None)
+            if old == h:
+                counts['unchanged'] += 1
+                continue
+            change = 'added' if old is None else 'changed'
+            counts[change] += 1
+            data = json.dumps(dict(zip(header, row)), ensure_ascii=False)
+            current.append((org, h, data, snapshot))
+            changes.append((snapshot, org, change, data))
+            if len(current) >= WRITE_BATCH:
+                _flush(db, current, changes)
+    _flush(db, current, changes)
+    # організації, яких немає у новому знімку
+    for org in previous:
+        changes.append((snapshot, org, 'removed', None))
+    counts['removed'] = len(previous)
+    _flush(db, current, changes)
+    db.executemany('DELETE FROM org_stat WHERE org = ?',
+                   ((org,) for org in previous))
+    db.commit()
+    if verbose:
+        for k, v in counts.items():
+            sys.stdout.write('{:<10} {:>10}\n'.format(k, v))
+    return counts
+
+
+def main():
+    results = arg_parser.parse_args()
+    if re.match(r'^.+\.sqlite$', results.database):
+        results.database = re.sub(r'^(.+)\.sqlite$', '\\1', results.database)
+    db = sqlite3.connect(results.database + '.sqlite')
+    try:
+        load_snapshot(db, results.file, snapshot=results.snapshot,
+                      key=results.key, encoding=results.encoding,
+                      verbose=results.verbose)
+    except (zipfile.BadZipFile, FileNotFoundError) as e:
+        sys.stderr.write('Не вдалося прочитати файл статистики: '
+                         '{}\n'.format(e))
+        sys.exit(1)
+    except ValueError as e:
+        sys.stderr.write('{}\n'.format(e))
+        sys.exit(2)
+    finally:
+        db.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,430 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2016-2025 Renat Nasridinov
+# This software may be freely distributed under the MIT license.
+# https://opensource.org/licenses/MIT The MIT License (MIT)
+# or see LICENSE file
+
+# Щоденна обробка як граф залежних задач:
+#
+#   extract (день) -> convert (день, Parquet)
+#                  -> cache (день, Arrow IPC, див. arrow_cache.py)
+#                  -> merge (місяць, CSV як archive.sh)
+#                  -> load (день, SQLite)
+#   convert, merge -> dedupe (повторні трансакції у Parquet та CSV; за
+#                     індексом `id` читаються лише змінені файли та файли зі
+#                     спільними `id`, див. dedupe.py)
+#
+# Для кожної задачі зберігається підпис -- хеш вмісту її вхідних файлів
+# (з каталогу, див. catalog.py, тож SHA-256 файлу перераховується лише при
+# зміні його розміру чи часу модифікації) та параметрів. Задача
+# виконується, лише якщо підпис змінився або немає її результату, тож новий
+# день означає один файл Parquet, одне злиття місяця та одне завантаження до
+# бази. Вхідні файли, що не є архівами (результати попередніх етапів),
+# порівнюються за розміром і часом модифікації. Незалежні задачі
+# виконуються паралельно, завантаження до однієї бази даних -- послідовно.
+
+import argparse
+import hashlib
+import io
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+import zipfile
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import date, timedelta
+from pathlib import Path
+from .catalog import get_entry, is_unchanged, open_catalog, update_entry
+from .dedupe import dedupe
+from .profiling import add_profile_argument, profiled
+
+
+STAGES = ('extract', 'convert', 'cache', 'merge', 'load', 'dedupe')
+STATE_NAME = 'pipeline.sqlite'
+JOBS = 4
+COPY_BUFFER = 1024 * 1024
+HEADER_LINES = 2
+
+CREATE_STATE = """CREATE TABLE IF NOT EXISTS tasks (name text PRIMARY KEY,
+    signature text, finished text);"""
+
+arg_parser = argparse.ArgumentParser(
+    prog=None,
+    usage=None,
+    description="Інкрементна обробка щоденних файлів Є-Data: завантаження, "
+                "перетворення у Parquet, злиття за місяцями та завантаження "
+                "до SQLite",
+    epilog=None
+    )
+arg_parser.add_argument('-s', '--startdate', type=str, default=None,
+                        help='початкова дата завантаження нових днів')
+arg_parser.add_argument('-e', '--enddate', type=str, default=None,
+                        help='кінцева дата, за замовчуванням -- початкова')
+arg_parser.add_argument('-D', '--data-dir', dest='data_dir', default='data',
+                        help='директорія з ZIP-файлами, за замовчуванням -- '
+                        '`data`')
+arg_parser.add_argument('-o', '--output-dir', dest='output_dir',
+                        default='output',
+                        help='директорія для Parquet та CSV за місяцями, за '
+                        'замовчуванням -- `output`')
+arg_parser.add_argument('-d', '--database', dest='database', default='edata',
+                        help="ім'я файла бази даних (БЕЗ розширення), "
+                        "за замовчуванням -- `edata`")
+arg_parser.add_argument('--stages', nargs='+', choices=STAGES,
+                        default=list(STAGES),
+                        help='етапи обробки, за замовчуванням -- усі')
+arg_parser.add_argument('-j', '--jobs', type=int, default=JOBS,
+                        help='кількість одночасних задач, за замовчуванням '
+                        '-- {}'.format(JOBS))
+arg_parser.add_argument('-f', '--force', action='store_true',
+                        help='виконати всі задачі незалежно від стану')
+arg_parser.add_argument('-n', '--dry-run', action='store_true',
+                        dest='dry_run',
+                        help='лише показати задачі, що будуть виконані')
+arg_parser.add_argument('-v', '--verbose', action='store_true',
+                        help='виводити додаткову інформацію')
+add_profile_argument(arg_parser)
+
+
+class Task(object):
+    """Node of the pipeline graph. `inputs` is a callable returning input
+    paths (evaluated when dependencies are done), `resource` names a
+    resource that only one task may use at a time."""
+
+    def __init__(self, name, action, inputs=None, outputs=(), deps=(),
+                 params=None, resource=None):
+        self.name = name
+        self.action = action
+        self.inputs = inputs or (lambda: [])
+        self.outputs = [Path(p) for p in outputs]
+        self.deps = list(deps)
+        self.params = params or {}
+        self.resource = resource
+
+
+def _zip_path(data_dir, day):
+    return Path(data_dir, '{}.zip'.format(day))
+
+
+def _csv_member(zf):
+    return next((m for m in zf.namelist() if m.lower().endswith('.csv')),
+                zf.namelist()[0])
+
+
+def extract_day(day, data_dir):
+    from .extractor import extract
+    try:
+        extract(date.fromisoformat(day), date.fromisoformat(day),
+                save_dir=Path(data_dir))
+    except SystemExit as e:
+        raise RuntimeError('не вдалося завантажити {} (код {})'.format(
+            day, e.code))
+    if not _zip_path(data_dir, day).exists():
+        raise RuntimeError('файл {} не створено'.format(
+            _zip_path(data_dir, day)))
+
+
+def convert_day(zip_path, parquet_path):
+    from .edata_convert import load_day
+    df = load_day(str(zip_path), 'optimised')
+    if isinstance(df, int):
+        raise ValueError('{} не є CSV порталу Є-Data'.format(zip_path))
+    tmp_path = Path(str(parquet_path) + '.tmp')
+    df.to_parquet(tmp_path)
+    os.replace(tmp_path, parquet_path)
+
+
+def merge_month(zip_paths, csv_path):
+    """Concatenates CSV of daily archives into one file keeping the header
+    lines of the first one only (as `archive.sh` does)."""
+    tmp_path = Path(str(csv_path) + '.tmp')
+    with open(tmp_path, 'wb') as out:
+        for n, zip_path in enumerate(zip_paths):
+            with zipfile.ZipFile(zip_path) as zf, \
+                    zf.open(_csv_member(zf)) as member:
+                src = io.BufferedReader(member, COPY_BUFFER)
+                if n:
+                    for _ in range(HEADER_LINES):
+                        src.readline()
+                while True:
+                    block = src.read(COPY_BUFFER)
+                    if not block:
+                        break
+                    out.write(block)
+    os.replace(tmp_path, csv_path)
+
+
+def cache_task(zip_path, cache_dir, data_dir):
+    from .arrow_cache import cache_day
+    # каталог оновлює лише головний потік (Pipeline.fingerprint перед
+    # запуском задачі), тут SHA-256 архіву лише читається
+    catalog = open_catalog(data_dir)
+    try:
+        entry = get_entry(catalog, zip_path)
+    finally:
+        catalog.close()
+    cache_day(zip_path, cache_dir, sha256=entry['sha256'] if entry else None)
+
+
+def load_day(zip_path, database):
+    from .json2sqlite import EDataSQLDatabase
+    edb = EDataSQLDatabase(database=database, upsert=True)
+    try:
+        edb.import_zip(str(zip_path))
+    finally:
+        edb.close()
+
+
+def _is_damaged(catalog, path):
+    """True if the catalog marks the unchanged archive as damaged."""
+    if catalog is None or not is_unchanged(catalog, path):
+        return False
+    return not get_entry(catalog, path)['ok']
+
+
+def build_tasks(data_dir, output_dir, database, stages=STAGES, days=(),
+                catalog=None):
+    """Returns tasks for existing daily archives of `data_dir` and for
+    `days` to be downloaded. Days whose archive already exists are not
+    downloaded again unless `catalog` marks the archive as damaged."""
+    data_dir, output_dir = Path(data_dir), Path(output_dir)
+    existing = {p.stem for p in data_dir.glob('*.zip')
+                if len(p.stem) == 10 and p.stem[4] == '-'}
+    all_days = sorted(existing | set(days))
+    tasks = []
+    if 'extract' in stages:
+        tasks.extend(Task('extract:' + day, lambda day=day: extract_day(
+                          day, data_dir),
+                          outputs=[_zip_path(data_dir, day)],
+                          resource='api')
+                     for day in sorted(days)
+                     if day not in existing or
+                     _is_damaged(catalog, _zip_path(data_dir, day)))
+    if 'convert' in stages:
+        (output_dir / 'parquet').mkdir(parents=True, exist_ok=True)
+        for day in all_days:
+            zip_path = _zip_path(data_dir, day)
+            parquet_path = output_dir / 'parquet' / '{}.parquet'.format(day)
+            tasks.append(Task(
+                'convert:' + day,
+                lambda z=zip_path, p=parquet_path: convert_day(z, p),
+                inputs=lambda z=zip_path: [z], outputs=[parquet_path],
+                deps=['extract:' + day]))
+    if 'cache' in stages:
+        (output_dir / 'cache').mkdir(parents=True, exist_ok=True)
+        for day in all_days:
+            zip_path = _zip_path(data_dir, day)
+            cache_path = output_dir / 'cache' / '{}.arrow'.format(day)
+            tasks.append(Task(
+                'cache:' + day,
+                lambda z=zip_path: cache_task(z, output_dir / 'cache',
+                                              data_dir),
+                inputs=lambda z=zip_path: [z], outputs=[cache_path],
+                deps=['extract:' + day]))
+    if 'merge' in stages:
+        (output_dir / 'merged').mkdir(parents=True, exist_ok=True)
+        for month in sorted({day[:7] for day in all_days}):
+            csv_path = output_dir / 'merged' / '{}.csv'.format(
+                month.replace('-', ''))
+            month_days = [day for day in all_days if day[:7] == month]
+
+            def month_zips(month=month):
+                return sorted(data_dir.glob('{}-*.zip'.format(month)))
+            tasks.append(Task(
+                'merge:' + month,
+                lambda m=month_zips, p=csv_path: merge_month(m(), p),
+                inputs=month_zips, outputs=[csv_path],
+                deps=['extract:' + day for day in month_days]))
+    if 'load' in stages:
+        for day in all_days:
+            zip_path = _zip_path(data_dir, day)
+            tasks.append(Task(
+                'load:' + day, lambda z=zip_path: load_day(z, database),
+                inputs=lambda z=zip_path: [z], deps=['extract:' + day],
+                params={'database': database}, resource='sqlite'))
+    if 'dedupe' in stages:
+        for kind, pattern, stage in (('parquet', '*.parquet', 'convert:'),
+                                     ('merged', '*.csv', 'merge:')):
+            def files(kind=kind, pattern=pattern):
+                return sorted((output_dir / kind).glob(pattern))
+            tasks.append(Task(
+                'dedupe:' + kind, lambda f=files: dedupe(f(), index=True),
+                inputs=files,
+                deps=[t.name for t in tasks if t.name.startswith(stage)]))
+    return tasks
+
+
+class Pipeline(object):
+    def __init__(self, data_dir='data', jobs=JOBS, force=None,
+                 dry_run=None, verbose=None):
+        self.data_dir = Path(data_dir)
+        self.jobs = jobs
+        self.force = force
+        self.dry_run = dry_run
+        self.verbose = verbose
+        self.catalog = open_catalog(data_dir)
+        self.state = sqlite3.connect(str(self.data_dir / STATE_NAME))
+        self.state.execute(CREATE_STATE)
+        self._locks = {}
+
+    def close(self):
+        self.catalog.close()
+        self.state.close()
+
+    def fingerprint(self, path):
+        """SHA-256 of the archive from the catalog, rescanned only if size
+        or mtime changed. Raises ValueError for damaged archives. Other
+        files are identified by size and mtime."""
+        if Path(path).suffix != '.zip':
+            st = os.stat(path)
+            return '{}:{}'.format(st.st_size, st.st_mtime_ns)
+        if is_unchanged(self.catalog, path):
+            entry = get_entry(self.catalog, path)
+        else:
+            entry = update_entry(self.catalog, path)
+        if not entry['ok']:
+            raise ValueError('{}: {}'.format(path, entry['error']))
+        return entry['sha256']
+
+    def signature(self, task):
+        inputs = [(Path(p).name, self.fingerprint(p)) for p in task.inputs()]
+        payload = json.dumps([task.name, inputs, task.params,
+                              [str(p) for p in task.outputs]],
+                             sort_keys=True)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def is_fresh(self, task, signature):
+        row = self.state.execute('SELECT signature FROM tasks WHERE name = ?',
+                                 (task.name,)).fetchone()
+        return row is not None and row[0] == signature and \
+            all(p.exists() for p in task.outputs)
+
+    def _call(self, task):
+        lock = self._locks.get(task.resource)
+        started = time.perf_counter()
+        if lock is None:
+            task.action()
+        else:
+            with lock:
+                task.action()
+        return time.perf_counter() - started
+
+    def run(self, tasks):
+        """Runs outdated tasks in dependency order, at most `jobs` at once.
+        Returns dict {task name: 'done' | 'fresh' | 'failed' | 'skipped'}."""
+        names = {t.name for t in tasks}
+        self._locks = {t.resource: threading.Lock() for t in tasks
+                       if t.resource}
+        pending = {t.name: t for t in tasks}
+        status, running = {}, {}
+        with ThreadPoolExecutor(max_workers=max(1, self.jobs)) as pool:
+            while pending or running:
+                for name, task in list(pending.items()):
+                    deps = [d for d in task.deps if d in names]
+                    if any(status.get(d) in ('failed', 'skipped')
+                           for d in deps):
+                        del pending[name]
+                        status[name] = 'skipped'
+                        continue
+                    if not all(status.get(d) in ('done', 'fresh')
+                               for d in deps):
+                        continue
+                    del pending[name]
+                    try:
+                        signature = self.signature(task)
+                    except (OSError, ValueError) as e:
+                        status[name] = 'failed'
+                        sys.stderr.write('{}: {}\n'.format(name, e))
+                        continue
+                    if not self.force and self.is_fresh(task, signature):
+                        status[name] = 'fresh'
+                        continue
+                    if self.dry_run:
+                        status[name] = 'done'
+                        sys.stdout.write('{}\n'.format(name))
+                        continue
+                    running[pool.submit(self._call, task)] = \
+                        (task, signature)
+                if not running:
+                    if pending:
+                        # залежності, що не можуть бути виконані
+                        status.update(dict.fromkeys(pending, 'skipped'))
+                    break
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    task, signature = running.pop(future)
+                    try:
+                        seconds = future.result()
+                    except Exception as e:
+                        status[task.name] = 'failed'
+                        sys.stderr.write('{}: {}\n'.format(task.name, e))
+                        continue
+                    # підпис рахується знову: вхідні файли могли змінитися
+                    # під час виконання (напр. завантаження дня)
+                    try:
+                        if task.inputs():
+                            signature = self.signature(task)
+                    except (OSError, ValueError) as e:
+                        status[task.name] = 'failed'
+                        sys.stderr.write('{}: {}\n'.format(task.name, e))
+                        continue
+                    self.state.execute(
+                        'INSERT OR REPLACE INTO tasks (name, signature, '
+                        'finished) VALUES (?, ?, ?)',
+                        (task.name, signature,
+                         time.strftime('%Y-%m-%dT%H:%M:%S')))
+                    self.state.commit()
+                    status[task.name] = 'done'
+                    if self.verbose:
+                        sys.stdout.write('{:<24} {:>8.1f} с\n'.format(
+                            task.name, seconds))
+        return status
+
+
+def _days(startdate, enddate):
+    if not startdate:
+        return []
+    start = date.fromisoformat(startdate)
+    end = date.fromisoformat(enddate) if enddate else start
+    return [(start + timedelta(days=n)).isoformat()
+            for n in range((end - start).days + 1)]
+
+
+def main():
+    results = arg_parser.parse_args()
+    try:
+        days = _days(results.startdate, results.enddate)
+    except ValueError as e:
+        sys.stderr.write('{}\n'.format(e))
+        sys.exit(2)
+    Path(results.data_dir).mkdir(parents=True, exist_ok=True)
+    profiled(run, results, Path(results.data_dir, 'pipeline'), results, days)
+
+
+def run(results, days):
+    pipeline = Pipeline(results.data_dir, jobs=results.jobs,
+                        force=results.force, dry_run=results.dry_run,
+                        verbose=results.verbose)
+    try:
+        tasks = build_tasks(results.data_dir, results.output_dir,
+                            results.database, stages=results.stages,
+                            days=days, catalog=pipeline.catalog)
+        status = pipeline.run(tasks)
+    finally:
+        pipeline.close()
+    counts = {}
+    for s in status.values():
+        counts[s] = counts.get(s, 0) + 1
+    if results.verbose or 'failed' in counts:
+        sys.stdout.write(', '.join('{}: {}'.format(k, v)
+                                   for k, v in sorted(counts.items())) + '\n')
+    if 'failed' in counts:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
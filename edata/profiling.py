@@ -0,0 +1,153 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2016-2025 Renat Nasridinov
+# This software may be freely distributed under the MIT license.
+# https://opensource.org/licenses/MIT The MIT License (MIT)
+# or see LICENSE file
+
+# Профілювання команд за опцією `--profile`. Поруч з результатом команди
+# записуються:
+# * `<ім'я>.<час>.prof` -- статистика cProfile (для pstats, snakeviz);
+# * `<ім'я>.<час>.collapsed` -- згорнуті стеки для flamegraph.pl/speedscope;
+# * `<ім'я>.<час>.memory.txt` -- пік пам'яті та найбільші невивільнені
+#   виділення (tracemalloc);
+# * `<ім'я>.<час>.profile.json` -- параметри запуску та підсумки.
+# Без опції команда викликається напряму, без жодних додаткових витрат.
+
+import cProfile
+import json
+import os
+import pstats
+import sys
+import time
+import tracemalloc
+from collections import Counter
+from pathlib import Path
+
+
+PROFILE_MODES = ('cpu', 'memory', 'all')
+TOP_ALLOCATIONS = 25
+# шляхи з меншим часом (секунди) не потрапляють до згорнутих стеків
+MIN_STACK_TIME = 1e-6
+MAX_STACK_DEPTH = 200
+
+
+def add_profile_argument(parser):
+    parser.add_argument('--profile', action='store_true',
+                        help='профілювати виконання і записати звіти поруч '
+                        'з результатом')
+    parser.add_argument('--profile-mode', dest='profile_mode',
+                        choices=PROFILE_MODES, default='all',
+                        help='що профілювати: cpu (cProfile), memory '
+                        "(tracemalloc) чи all, за замовчуванням -- all")
+
+
+def _label(func):
+    filename, lineno, name = func
+    if filename == '~':
+        return name.replace(';', ',')
+    return '{} ({}:{})'.format(name, os.path.basename(filename),
+                               lineno).replace(';', ',')
+
+
+def collapsed_stacks(stats):
+    """Returns Counter {`frame;frame;...`: seconds} built from the cProfile
+    call graph. Time of a function called from several places is split
+    in proportion to each caller's cumulative time, as flamegraph tools for
+    deterministic profilers do.
+
+    Every caller -> callee edge is expanded once: on later paths the callee
+    becomes a leaf frame with its share of time, so shared and recursive
+    call graphs take time linear in the number of edges instead of the
+    number of paths (which may be exponential)."""
+    data = stats.stats
+    callees = {}
+    for func, (_, _, _, _, callers) in data.items():
+        for caller, edge in callers.items():
+            callees.setdefault(caller, {})[func] = edge
+    stacks = Counter()
+    expanded = set()
+
+    def walk(func, path, on_path, share):
+        cumtime = data[func][3]
+        path = path + (_label(func),)
+        own = data[func][2] * share
+        if own >= MIN_STACK_TIME:
+            stacks[';'.join(path)] += own
+        if len(path) >= MAX_STACK_DEPTH:
+            return
+        for callee, edge in callees.get(func, {}).items():
+            if callee in on_path or not data[callee][3] or not cumtime:
+                continue
+            edge_time = edge[3] * share
+            if edge_time < MIN_STACK_TIME:
+                continue
+            if (func, callee) in expanded:
+                stacks[';'.join(path + (_label(callee),))] += edge_time
+                continue
+            expanded.add((func, callee))
+            walk(callee, path, on_path | {callee},
+                 edge_time / data[callee][3])
+
+    for func, (_, _, _, _, callers) in data.items():
+        if not callers:
+            walk(func, (), {func}, 1.0)
+    return stacks
+
+
+def _write_memory_report(path, snapshot, current, peak):
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write('Пік: {:.1f} МБ, наприкінці: {:.1f} МБ\n\n'
+                'Найбільші виділення, що лишилися наприкінці:\n'.format(
+                    peak / 1024 / 1024, current / 1024 / 1024))
+        for stat in snapshot.statistics('lineno')[:TOP_ALLOCATIONS]:
+            frame = stat.traceback[0]
+            f.write('{:>10.1f} КБ {:>9} {}:{}\n'.format(
+                stat.size / 1024, stat.count, frame.filename, frame.lineno))
+
+
+def profiled(func, results, output, *args, **kwargs):
+    """Calls `func(*args, **kwargs)`; if `results.profile` is set, under
+    cProfile and/or tracemalloc, writing reports next to `output` even if
+    the command ends with `sys.exit`."""
+    if not getattr(results, 'profile', None):
+        return func(*args, **kwargs)
+    mode = results.profile_mode
+    base = '{}.{}'.format(output, time.strftime('%Y%m%d-%H%M%S'))
+    profile = cProfile.Profile() if mode in ('cpu', 'all') else None
+    if mode in ('memory', 'all'):
+        tracemalloc.start()
+    summary = {'argv': sys.argv, 'mode': mode,
+               'parameters': vars(results),
+               'started': time.strftime('%Y-%m-%dT%H:%M:%S'),
+               'exit_code': None}
+    started = time.perf_counter()
+    try:
+        if profile is not None:
+            return profile.runcall(func, *args, **kwargs)
+        return func(*args, **kwargs)
+    except SystemExit as e:
+        summary['exit_code'] = e.code
+        raise
+    finally:
+        summary['seconds'] = round(time.perf_counter() - started, 3)
+        Path(base).parent.mkdir(parents=True, exist_ok=True)
+        if tracemalloc.is_tracing():
+            current, peak = tracemalloc.get_traced_memory()
+            snapshot = tracemalloc.take_snapshot()
+            tracemalloc.stop()
+            summary['peak_memory_bytes'] = peak
+            _write_memory_report(base + '.memory.txt', snapshot, current,
+                                 peak)
+        if profile is not None:
+            profile.dump_stats(base + '.prof')
+            stacks = collapsed_stacks(pstats.Stats(profile))
+            with open(base + '.collapsed', 'w', encoding='utf-8') as f:
+                for stack, seconds in sorted(stacks.items()):
+                    # мікросекунди: flamegraph.pl очікує цілі значення
+                    f.write('{} {}\n'.format(stack,
+                                             max(1, round(seconds * 1e6))))
+        with open(base + '.profile.json', 'w', encoding='utf-8') as f:
+            json.dump(summary, f, ensure_ascii=False, indent=1, default=str)
+        sys.stderr.write('Звіти профілювання: {}.*\n'.format(base))
@@ -0,0 +1,163 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2016-2025 Renat Nasridinov
+# This software may be freely distributed under the MIT license.
+# https://opensource.org/licenses/MIT The MIT License (MIT)
+# or see LICENSE file
+
+# Зведені таблиці (день × регіон, день × платник, день × отримувач) з
+# кількістю та сумою `amount` (у копійках, див. schema.py). Підтримуються
+# тригерами на таблиці `edata`, тож кожне додавання, заміна (ON CONFLICT
+# REPLACE) чи оновлення запису змінює лише один рядок у кожній зведеній
+# таблиці.
+#
+# Заміну запису з тим самим `id` тригер BEFORE INSERT робить сам: спершу
+# видаляє старий запис (спрацьовує тригер видалення), тож ON CONFLICT
+# REPLACE вже нічого не видаляє. Інакше результат залежав би від
+# `PRAGMA recursive_triggers`, що діє лише в межах одного з'єднання.
+
+import argparse
+import re
+import sqlite3
+import sys
+
+
+# назва таблиці: (назва стовпця ключа, вираз над рядком таблиці `edata`)
+# (або `edata_facts` нормалізованої схеми, див. schema.py)
+ROLLUPS = {
+    'rollup_day_region': ('region_id', 'coalesce({row}.region_id, -1)'),
+    'rollup_day_payer': ('payer_edrpou', "coalesce({row}.payer_edrpou, '')"),
+    'rollup_day_recipt': ('recipt_edrpou',
+                          "coalesce({row}.recipt_edrpou, '')"),
+    }
+DAY_EXPR = "coalesce({row}.trans_date, -1)"
+AMOUNT_EXPR = "coalesce({row}.amount, 0)"
+TRACKED_COLUMNS = 'amount, trans_date, region_id, payer_edrpou, recipt_edrpou'
+
+arg_parser = argparse.ArgumentParser(
+    prog=None,
+    usage=None,
+    description="Обслуговування зведених таблиць бази даних SQLite з "
+                "даними порталу Є-Data",
+    epilog=None
+    )
+arg_parser.add_argument('-d', '--database', dest='database',
+                        default='edata',
+                        help="ім'я файла бази даних (БЕЗ розширення), "
+                        "за замовчуванням -- `edata`"
+                        )
+arg_parser.add_argument('-r', '--rebuild', action='store_true',
+                        help='перерахувати зведені таблиці з нуля')
+arg_parser.add_argument('-v', '--verbose', dest='verbose',
+                        help="виводити додаткову інформацію",
+                        action='store_true',
+                        )
+
+
+def _add_sql(table, key, row):
+    return (
+        "INSERT INTO {table} (day, {key}, cnt, total) "
+        "VALUES ({day}, {expr}, 1, {amount}) "
+        "ON CONFLICT (day, {key}) DO UPDATE SET cnt = cnt + 1, "
+        "total = total + excluded.total;".format(
+            table=table, key=key, day=DAY_EXPR.format(row=row),
+            expr=ROLLUPS[table][1].format(row=row),
+            amount=AMOUNT_EXPR.format(row=row))
+        )
+
+
+def _remove_sql(table, key, row):
+    return (
+        "UPDATE {table} SET cnt = cnt - 1, total = total - {amount} "
+        "WHERE day = {day} AND {key} = {expr};"
+        "DELETE FROM {table} WHERE day = {day} AND {key} = {expr} "
+        "AND cnt <= 0;".format(
+            table=table, key=key, day=DAY_EXPR.format(row=row),
+            expr=ROLLUPS[table][1].format(row=row),
+            amount=AMOUNT_EXPR.format(row=row))
+        )
+
+
+def _create_statements(source='edata'):
+    yield from (
+        "CREATE TABLE IF NOT EXISTS {} (day integer NOT NULL, {} NOT NULL, "
+        "cnt integer NOT NULL, total integer NOT NULL, "
+        "PRIMARY KEY (day, {})) WITHOUT ROWID;".format(table, key, key)
+        for table, (key, _) in ROLLUPS.items()
+        )
+    add = ''.join(_add_sql(t, k, 'NEW') for t, (k, _) in ROLLUPS.items())
+    remove = ''.join(_remove_sql(t, k, 'OLD') for t, (k, _) in ROLLUPS.items())
+    yield ("CREATE TRIGGER IF NOT EXISTS {0}_rollup_replace BEFORE INSERT "
+           "ON {0} BEGIN DELETE FROM {0} WHERE id = NEW.id; END;"
+           .format(source))
+    yield ("CREATE TRIGGER IF NOT EXISTS {0}_rollup_insert AFTER INSERT ON "
+           "{0} BEGIN {1} END;".format(source, add))
+    yield ("CREATE TRIGGER IF NOT EXISTS {0}_rollup_delete AFTER DELETE ON "
+           "{0} BEGIN {1} END;".format(source, remove))
+    yield ("CREATE TRIGGER IF NOT EXISTS {0}_rollup_update AFTER UPDATE OF "
+           "{1} ON {0} BEGIN {2}{3} END;".format(source, TRACKED_COLUMNS,
+                                                  remove, add))
+
+
+def _rollups_exist(db):
+    c = db.execute(
+        "SELECT count(*) FROM sqlite_master WHERE type = 'table' AND name IN "
+        "({})".format(', '.join('?' * len(ROLLUPS))), list(ROLLUPS))
+    return c.fetchone()[0] == len(ROLLUPS)
+
+
+def source_table(db):
+    """Table the triggers are installed on: `edata_facts` for normalised
+    databases, `edata` otherwise."""
+    c = db.execute("SELECT count(*) FROM sqlite_master WHERE type = 'table' "
+                   "AND name = 'edata_facts'")
+    return 'edata_facts' if c.fetchone()[0] else 'edata'
+
+
+def ensure_rollups(db, source='edata', verbose=None):
+    """Creates summary tables with their triggers (filling them from
+    existing rows on the first run)."""
+    existed = _rollups_exist(db)
+    for statement in _create_statements(source):
+        db.execute(statement)
+    if not existed:
+        rebuild_rollups(db, source=source, verbose=verbose)
+    db.commit()
+
+
+def rebuild_rollups(db, source='edata', verbose=None):
+    """Recalculates all summary tables from the source table."""
+    for table, (key, expr) in ROLLUPS.items():
+        db.execute('DELETE FROM {}'.format(table))
+        db.execute(
+            "INSERT INTO {table} (day, {key}, cnt, total) "
+            "SELECT {day} AS d, {expr} AS k, count(*), sum({amount}) "
+            "FROM {source} GROUP BY d, k;".format(
+                table=table, key=key, day=DAY_EXPR.format(row=source),
+                expr=expr.format(row=source), source=source,
+                amount=AMOUNT_EXPR.format(row=source))
+            )
+        if verbose:
+            count = db.execute(
+                'SELECT count(*) FROM {}'.format(table)).fetchone()[0]
+            sys.stdout.write('{}: {:>10}\n'.format(table, count))
+    db.commit()
+
+
+def main():
+    results = arg_parser.parse_args()
+    if re.match(r'^.+\.sqlite$', results.database):
+        results.database = re.sub(r'^(.+)\.sqlite$', '\\1', results.database)
+    db = sqlite3.connect(results.database + '.sqlite')
+    try:
+        source = source_table(db)
+        ensure_rollups(db, source=source, verbose=results.verbose)
+        if results.rebuild:
+            rebuild_rollups(db, source=source, verbose=results.verbose)
+    finally:
+        db.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,456 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2016-2025 Renat Nasridinov
+# This software may be freely distributed under the MIT license.
+# https://opensource.org/licenses/MIT The MIT License (MIT)
+# or see LICENSE file
+
+# Спільна схема таблиці `edata` для всіх завантажувачів SQLite.
+#
+# Значення зберігаються у компактному вигляді:
+# * дати (`trans_date`, `doc_date`, `doc_v_date`) -- ціле число днів від
+#   1970-01-01, у SQL перетворюється на дату виразом `date(x + 2440587.5)`;
+# * `amount` -- ціле число копійок;
+# * коди ЄДРПОУ та МФО -- ціле число, якщо код складається лише з цифр.
+#   Код звичайної довжини (8 цифр ЄДРПОУ, 6 цифр МФО) зберігається як є,
+#   код іншої довжини -- як `довжина * 10**12 + код`, щоб не загубити
+#   ведучі нулі. Усі інші значення (напр. `xxxxxxxxxx`) лишаються текстом.
+#
+# Необов'язкова нормалізована схема (`--normalise`): назви організацій
+# (ЄДРПОУ + назва) та банків (МФО + назва) зберігаються один раз у таблицях
+# `org` та `bank`, таблиця `edata_facts` посилається на них цілими ключами,
+# а представлення `edata` повертає ті самі стовпці, що й таблиця звичайної
+# схеми. Завантажувачі визначають схему бази самі (див. `get_layout`).
+
+import argparse
+import hashlib
+import json
+import re
+import sqlite3
+import sys
+from collections import namedtuple
+from datetime import date, timedelta
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
+from .errors import OutdatedSchemaError
+from .rollups import ROLLUPS, ensure_rollups, source_table
+
+
+SCHEMA_VERSION = 2
+EPOCH = date(1970, 1, 1)
+CODE_LENGTH_BASE = 10 ** 12
+MIGRATION_BATCH = 50000
+
+COLUMNS = (
+    'amount', 'payer_bank', 'region_id', 'trans_date', 'recipt_name', 'id',
+    'payment_details', 'recipt_mfo', 'payer_edrpou', 'recipt_bank',
+    'recipt_edrpou', 'payer_mfo', 'payer_name', 'doc_number', 'doc_date',
+    'doc_v_date', 'payer_account', 'recipt_account', 'doc_add_attr',
+    )
+DATE_COLUMNS = ('trans_date', 'doc_date', 'doc_v_date')
+# назва стовпця: кількість цифр у коді звичайної довжини
+CODE_COLUMNS = {'payer_edrpou': 8, 'recipt_edrpou': 8,
+                'payer_mfo': 6, 'recipt_mfo': 6}
+# цілі числа у JSON порталу, але текст у щоденних CSV
+INT_COLUMNS = ('id', 'region_id')
+
+CREATE_TABLE = """CREATE TABLE IF NOT EXISTS {table} (amount integer,
+    payer_bank text NULL, region_id integer, trans_date integer,
+    recipt_name text, id integer PRIMARY KEY ON CONFLICT REPLACE,
+    payment_details text, recipt_mfo integer NULL, payer_edrpou integer,
+    recipt_bank text NULL, recipt_edrpou integer, payer_mfo integer NULL,
+    payer_name text NULL, doc_number text NULL, doc_date integer NULL,
+    doc_v_date integer NULL, payer_account text NULL,
+    recipt_account text NULL, doc_add_attr text NULL, row_hash blob NULL);"""
+
+INSERT = "INSERT INTO {table} ({columns}) VALUES ({values});".format(
+    table='{table}', columns=', '.join(COLUMNS),
+    values=', '.join(':' + k for k in COLUMNS))
+
+# таблиця виміру: (стовпець ключа, стовпець коду)
+DIMENSIONS = {'org': ('org_id', 'edrpou'), 'bank': ('bank_id', 'mfo')}
+# стовпець `edata_facts`: (таблиця виміру, стовпці коду та назви в `edata`)
+FACT_KEYS = {
+    'payer_org': ('org', 'payer_edrpou', 'payer_name'),
+    'recipt_org': ('org', 'recipt_edrpou', 'recipt_name'),
+    'payer_bank_id': ('bank', 'payer_mfo', 'payer_bank'),
+    'recipt_bank_id': ('bank', 'recipt_mfo', 'recipt_bank'),
+    }
+# коди ЄДРПОУ лишаються і у `edata_facts`: за ними фільтрують та будують
+# зведені таблиці
+DIMENSION_COLUMNS = ('payer_name', 'recipt_name', 'payer_mfo', 'payer_bank',
+                     'recipt_mfo', 'recipt_bank')
+FACT_COLUMNS = tuple(k for k in COLUMNS if k not in DIMENSION_COLUMNS) + \
+    tuple(FACT_KEYS)
+
+CREATE_DIMENSION = """CREATE TABLE IF NOT EXISTS {table} (
+    {key} integer PRIMARY KEY, {code} NULL, name text NULL);"""
+CREATE_FACTS = """CREATE TABLE IF NOT EXISTS edata_facts (amount integer,
+    region_id integer, trans_date integer,
+    id integer PRIMARY KEY ON CONFLICT REPLACE, payment_details text,
+    payer_edrpou integer, recipt_edrpou integer, doc_number text NULL,
+    doc_date integer NULL, doc_v_date integer NULL,
+    payer_account text NULL, recipt_account text NULL,
+    doc_add_attr text NULL, payer_org integer NULL, recipt_org integer NULL,
+    payer_bank_id integer NULL, recipt_bank_id integer NULL,
+    row_hash blob NULL);"""
+FACT_INSERT = "INSERT INTO edata_facts ({}) VALUES ({});".format(
+    ', '.join(FACT_COLUMNS), ', '.join(':' + k for k in FACT_COLUMNS))
+
+Layout = namedtuple('Layout', 'table columns insert encode')
+
+arg_parser = argparse.ArgumentParser(
+    prog=None,
+    usage=None,
+    description="Перетворює базу даних SQLite з даними порталу Є-Data на "
+                "компактну схему",
+    epilog=None
+    )
+arg_parser.add_argument('-d', '--database', dest='database',
+                        default='edata',
+                        help="ім'я файла бази даних (БЕЗ розширення), "
+                        "за замовчуванням -- `edata`"
+                        )
+arg_parser.add_argument('-b', '--batch', dest='batch', type=int,
+                        default=MIGRATION_BATCH,
+                        help='кількість записів, що переносяться за одну '
+                        'транзакцію')
+arg_parser.add_argument('-n', '--normalise', action='store_true',
+                        help='перевести базу даних на нормалізовану схему '
+                        'з таблицями організацій та банків')
+arg_parser.add_argument('--vacuum', action='store_true',
+                        help='стиснути файл бази даних після перетворення')
+arg_parser.add_argument('-v', '--verbose', dest='verbose',
+                        help="виводити додаткову інформацію",
+                        action='store_true',
+                        )
+
+
+def row_hash(values):
+    """Returns compact (8 bytes) content hash of the row values sequence."""
+    payload = json.dumps(list(values), ensure_ascii=False,
+                         separators=(',', ':'), default=str)
+    return hashlib.blake2b(payload.encode('utf-8'), digest_size=8).digest()
+
+
+def encode_date(value):
+    """ISO 8601 date or datetime -> number of days since 1970-01-01."""
+    if value is None or isinstance(value, int):
+        return value
+    try:
+        return (date.fromisoformat(str(value)[:10]) - EPOCH).days
+    except ValueError:
+        return value
+
+
+def decode_date(value):
+    if isinstance(value, int):
+        return (EPOCH + timedelta(days=value)).isoformat()
+    return value
+
+
+def encode_amount(value):
+    """Amount in hryvnias -> integer amount in kopecks."""
+    if value is None or value == '' or isinstance(value, int):
+        return value if value != '' else None
+    try:
+        return int((Decimal(str(value)) * 100).to_integral_value(
+            rounding=ROUND_HALF_UP))
+    except InvalidOperation:
+        return value
+
+
+def decode_amount(value):
+    if isinstance(value, int):
+        return value / 100
+    return value
+
+
+def encode_int(value):
+    """Decimal string (as read from CSV) -> int, other values unchanged."""
+    if isinstance(value, str) and value.strip().isdigit() and \
+            value.isascii():
+        return int(value)
+    return value
+
+
+def encode_code(value, width):
+    if isinstance(value, int) or value is None:
+        return value
+    value = str(value).strip()
+    if not value.isdigit() or not value.isascii() or len(value) > 12:
+        return value or None
+    if len(value) == width:
+        return int(value)
+    return len(value) * CODE_LENGTH_BASE + int(value)
+
+
+def decode_code(value, width):
+    if not isinstance(value, int):
+        return value
+    if value < CODE_LENGTH_BASE:
+        return str(value).zfill(width)
+    length, code = divmod(value, CODE_LENGTH_BASE)
+    return str(code).zfill(length)
+
+
+def encode_row(d):
+    """Transaction dict as returned by API -> dict of compact values for
+    every column of `COLUMNS`."""
+    row = {k: d.get(k) for k in COLUMNS}
+    for k in DATE_COLUMNS:
+        row[k] = encode_date(row[k])
+    for k, width in CODE_COLUMNS.items():
+        row[k] = encode_code(row[k], width)
+    for k in INT_COLUMNS:
+        row[k] = encode_int(row[k])
+    row['amount'] = encode_amount(row['amount'])
+    return row
+
+
+def decode_row(row, columns=COLUMNS):
+    """Row of compact values (sequence ordered as `columns`) -> dict with
+    values in API format."""
+    d = dict(zip(columns, row))
+    for k in DATE_COLUMNS:
+        if k in d:
+            d[k] = decode_date(d[k])
+    for k, width in CODE_COLUMNS.items():
+        if k in d:
+            d[k] = decode_code(d[k], width)
+    if 'amount' in d:
+        d['amount'] = decode_amount(d['amount'])
+    return d
+
+
+def _table_exists(db, table):
+    return db.execute("SELECT name FROM sqlite_master WHERE type='table' "
+                      "AND name = ?", (table,)).fetchone() is not None
+
+
+def schema_version(db):
+    return db.execute('PRAGMA user_version').fetchone()[0]
+
+
+def is_normalised(db):
+    return source_table(db) == 'edata_facts'
+
+
+def ensure_schema(db, verbose=None):
+    """Creates `edata` table (and its rollups) if it does not exist yet.
+    Returns True if the table was created.
+
+    Raises `OutdatedSchemaError` for databases which must be migrated
+    first."""
+    if _table_exists(db, 'edata') or is_normalised(db):
+        if schema_version(db) < SCHEMA_VERSION:
+            raise OutdatedSchemaError(db_name(db))
+        created = False
+    else:
+        if verbose:
+            sys.stdout.write('Створюємо таблицю...\n')
+        db.execute(CREATE_TABLE.format(table='edata'))
+        db.execute('PRAGMA user_version = {}'.format(SCHEMA_VERSION))
+        created = True
+    ensure_rollups(db, source=source_table(db))
+    return created
+
+
+class Dimensions(object):
+    """Interns organisations and banks of the normalised layout. Keys are
+    cached in memory, unknown (code, name) pairs are added to the dimension
+    tables on first use (within the caller's transaction)."""
+
+    def __init__(self, db):
+        self.db = db
+        self._keys = {}
+        for table, (key, code) in DIMENSIONS.items():
+            self._keys[table] = {
+                (c, name): k for k, c, name in db.execute(
+                    'SELECT {}, {}, name FROM {}'.format(key, code, table))}
+
+    def key(self, table, code, name):
+        if code is None and name is None:
+            return None
+        keys = self._keys[table]
+        k = keys.get((code, name))
+        if k is None:
+            c = self.db.execute('INSERT INTO {} ({}, name) VALUES (?, ?)'
+                                .format(table, DIMENSIONS[table][1]),
+                                (code, name))
+            k = keys[(code, name)] = c.lastrowid
+        return k
+
+    def encode(self, row):
+        """Dict of compact values (see `encode_row`) -> dict of
+        `edata_facts` values."""
+        fact = {k: row[k] for k in FACT_COLUMNS if k not in FACT_KEYS}
+        for fact_key, (table, code, name) in FACT_KEYS.items():
+            fact[fact_key] = self.key(table, row[code], row[name])
+        return fact
+
+
+def get_layout(db):
+    """Returns `Layout` (table, columns, insert statement and function
+    encoding API transaction dict) for writing rows to `db`."""
+    if is_normalised(db):
+        dimensions = Dimensions(db)
+        return Layout('edata_facts', FACT_COLUMNS, FACT_INSERT,
+                      lambda d: dimensions.encode(encode_row(d)))
+    return Layout('edata', COLUMNS, INSERT.format(table='edata'), encode_row)
+
+
+def _view_sql():
+    aliases = {fact_key: 'd{}'.format(i)
+               for i, fact_key in enumerate(FACT_KEYS)}
+    select = {k: 'f.' + k for k in COLUMNS if k not in DIMENSION_COLUMNS}
+    joins = []
+    for fact_key, (table, code, name) in FACT_KEYS.items():
+        alias = aliases[fact_key]
+        if code in DIMENSION_COLUMNS:
+            select[code] = '{}.{} AS {}'.format(alias, DIMENSIONS[table][1],
+                                                code)
+        select[name] = '{}.name AS {}'.format(alias, name)
+        joins.append('LEFT JOIN {} {} ON {}.{} = f.{}'.format(
+            table, alias, alias, DIMENSIONS[table][0], fact_key))
+    return 'CREATE VIEW IF NOT EXISTS edata AS SELECT {}, f.row_hash ' \
+        'FROM edata_facts f {};'.format(
+            ', '.join(select[k] for k in COLUMNS), ' '.join(joins))
+
+
+def _create_normalised(db):
+    for table, (key, code) in DIMENSIONS.items():
+        db.execute(CREATE_DIMENSION.format(table=table, key=key, code=code))
+    db.execute(CREATE_FACTS)
+
+
+def db_name(db):
+    return db.execute('PRAGMA database_list').fetchone()[2]
+
+
+def migrate(db, batch=MIGRATION_BATCH, verbose=None):
+    """Converts `edata` table of the older schema to the compact one in
+    place. Rows are copied to `edata_compact` in batches ordered by `id`
+    (an interrupted migration continues from the last copied row), then the
+    tables are swapped and rollups are rebuilt. Returns number of copied
+    rows."""
+    if not _table_exists(db, 'edata') or \
+            schema_version(db) >= SCHEMA_VERSION:
+        return 0
+    present = [r[1] for r in db.execute('PRAGMA table_info(edata)')]
+    columns = [k for k in COLUMNS if k in present]
+    db.execute(CREATE_TABLE.format(table='edata_compact'))
+    last_id = db.execute(
+        'SELECT max(id) FROM edata_compact').fetchone()[0]
+    select_qry = "SELECT {} FROM edata WHERE id > ? ORDER BY id LIMIT ?" \
+        .format(', '.join(columns))
+    insert_qry = "INSERT INTO edata_compact ({}, row_hash) VALUES ({}, " \
+        ":row_hash);".format(', '.join(COLUMNS),
+                             ', '.join(':' + k for k in COLUMNS))
+    copied = 0
+    while True:
+        rows = db.execute(select_qry, (
+            last_id if last_id is not None else -1, batch)).fetchall()
+        if not rows:
+            break
+        encoded = []
+        for r in rows:
+            d = encode_row(dict(zip(columns, r)))
+            d['row_hash'] = row_hash(d[k] for k in COLUMNS)
+            encoded.append(d)
+        db.executemany(insert_qry, encoded)
+        db.commit()
+        copied += len(rows)
+        last_id = rows[-1][columns.index('id')]
+        if verbose:
+            sys.stdout.write('Перенесено записів: {:>10}\n'.format(copied))
+    try:
+        db.execute('BEGIN')
+        db.execute('DROP TABLE edata')
+        db.execute('ALTER TABLE edata_compact RENAME TO edata')
+        for table in ROLLUPS:
+            db.execute('DROP TABLE IF EXISTS {}'.format(table))
+        db.execute('PRAGMA user_version = {}'.format(SCHEMA_VERSION))
+    except Exception:
+        db.rollback()
+        raise
+    else:
+        db.commit()
+    ensure_rollups(db, verbose=verbose)
+    return copied
+
+
+def normalise(db, batch=MIGRATION_BATCH, verbose=None):
+    """Converts compact `edata` table to the normalised layout in place
+    (an empty database gets the normalised layout right away). Rows are
+    copied to `edata_facts` in batches ordered by `id`, so an interrupted
+    conversion continues from the last copied row; then the table is
+    replaced by the `edata` view. Rollup tables are kept, their triggers
+    move to `edata_facts`. Returns number of copied rows."""
+    if is_normalised(db) and not _table_exists(db, 'edata'):
+        return 0
+    if _table_exists(db, 'edata') and schema_version(db) < SCHEMA_VERSION:
+        raise OutdatedSchemaError(db_name(db))
+    _create_normalised(db)
+    copied = 0
+    if _table_exists(db, 'edata'):
+        dimensions = Dimensions(db)
+        last_id = db.execute('SELECT max(id) FROM edata_facts').fetchone()[0]
+        select_qry = "SELECT {} FROM edata WHERE id > ? ORDER BY id " \
+            "LIMIT ?".format(', '.join(COLUMNS))
+        insert_qry = "INSERT INTO edata_facts ({}, row_hash) VALUES ({}, " \
+            ":row_hash);".format(', '.join(FACT_COLUMNS),
+                                 ', '.join(':' + k for k in FACT_COLUMNS))
+        while True:
+            rows = db.execute(select_qry, (
+                last_id if last_id is not None else -1, batch)).fetchall()
+            if not rows:
+                break
+            facts = []
+            for r in rows:
+                d = dimensions.encode(dict(zip(COLUMNS, r)))
+                d['row_hash'] = row_hash(d[k] for k in FACT_COLUMNS)
+                facts.append(d)
+            db.executemany(insert_qry, facts)
+            db.commit()
+            copied += len(rows)
+            last_id = rows[-1][COLUMNS.index('id')]
+            if verbose:
+                sys.stdout.write('Перенесено записів: {:>10}\n'.format(
+                    copied))
+    try:
+        db.execute('BEGIN')
+        db.execute('DROP TABLE IF EXISTS edata')
+        db.execute(_view_sql())
+        db.execute('PRAGMA user_version = {}'.format(SCHEMA_VERSION))
+    except Exception:
+        db.rollback()
+        raise
+    else:
+        db.commit()
+    ensure_rollups(db, source='edata_facts', verbose=verbose)
+    return copied
+
+
+def main():
+    results = arg_parser.parse_args()
+    if re.match(r'^.+\.sqlite$', results.database):
+        results.database = re.sub(r'^(.+)\.sqlite$', '\\1', results.database)
+    db = sqlite3.connect(results.database + '.sqlite')
+    try:
+        if schema_version(db) >= SCHEMA_VERSION or \
+                not _table_exists(db, 'edata'):
+            if not results.normalise:
+                sys.stdout.write('Перетворення не потрібне.\n')
+        else:
+            migrate(db, batch=results.batch, verbose=results.verbose)
+        if results.normalise:
+            normalise(db, batch=results.batch, verbose=results.verbose)
+        if results.vacuum:
+            db.execute('VACUUM')
+    finally:
+        db.close()
+
+
+if __name__ == '__main__':
+    main()
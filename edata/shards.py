@@ -0,0 +1,219 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2016-2025 Renat Nasridinov
+# This software may be freely distributed under the MIT license.
+# https://opensource.org/licenses/MIT The MIT License (MIT)
+# or see LICENSE file
+
+# База даних SQLite, розділена за регіонами (`--shard` у json2sqlite.py та
+# `edata.py transactions`): записи кожного `region_id` (див. regions.py)
+# зберігаються в окремому файлі `<ім'я>.rNN.sqlite`, записи з невідомим
+# регіоном -- у `<ім'я>.r00.sqlite`. Кожен файл має власний запис (тож
+# завантаження різних регіонів не чекають одне на одне), власні зведені
+# таблиці та обслуговується окремо (`python -m edata.shards`).
+#
+# `open_sharded` повертає з'єднання, до якого приєднано файли регіонів, з
+# тимчасовими представленнями `edata` та зведених таблиць (UNION ALL), тож
+# запити до однієї бази працюють без змін. SQLite зазвичай дозволяє
+# приєднати лише 10 файлів (SQLITE_MAX_ATTACHED), тож для всіх регіонів
+# `open_shard_groups` повертає кілька таких з'єднань, результати запитів до
+# яких об'єднуються у Python (див. export.py, summary.py).
+
+import argparse
+import os
+import re
+import sqlite3
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from .errors import NoShardsError, OutdatedSchemaError, TooManyShardsError
+from .regions import REGIONS
+from .rollups import ROLLUPS, ensure_rollups, rebuild_rollups, source_table
+from .schema import COLUMNS, SCHEMA_VERSION
+
+
+UNKNOWN_REGION = 0
+SHARD_KEYS = tuple(sorted(x['regionCode'] for x in REGIONS)) + \
+    (UNKNOWN_REGION,)
+SHARD_SUFFIX = '.r{:02d}'
+MAINTENANCE_JOBS = 4
+
+arg_parser = argparse.ArgumentParser(
+    prog=None,
+    usage=None,
+    description="Обслуговування бази даних SQLite, розділеної за регіонами: "
+                "кожен файл регіону обробляється окремо",
+    epilog=None
+    )
+arg_parser.add_argument('-d', '--database', dest='database', default='edata',
+                        help="ім'я бази даних (БЕЗ розширення), за "
+                        "замовчуванням -- `edata`")
+arg_parser.add_argument('-t', '--treasury', nargs='+', type=int, default=[],
+                        help='лише вказані регіони')
+arg_parser.add_argument('-r', '--rebuild', action='store_true',
+                        help='перерахувати зведені таблиці з нуля')
+arg_parser.add_argument('--vacuum', action='store_true',
+                        help='стиснути файли (VACUUM)')
+arg_parser.add_argument('-j', '--jobs', type=int, default=MAINTENANCE_JOBS,
+                        help='кількість файлів, що обробляються одночасно, '
+                        'за замовчуванням -- {}'.format(MAINTENANCE_JOBS))
+arg_parser.add_argument('-v', '--verbose', action='store_true',
+                        help='виводити кількість записів та розмір файлів')
+
+
+def shard_key(region_id):
+    """Region code of the shard a transaction goes to."""
+    try:
+        region = int(region_id)
+    except (TypeError, ValueError):
+        return UNKNOWN_REGION
+    return region if region in SHARD_KEYS else UNKNOWN_REGION
+
+
+def shard_name(database, key):
+    """Name of the shard database (without `.sqlite`)."""
+    return database + SHARD_SUFFIX.format(key)
+
+
+def split_by_shard(edata, database):
+    """Groups API transaction dicts: {shard name: [transactions]}."""
+    groups = {}
+    for d in edata:
+        groups.setdefault(shard_name(database, shard_key(d.get('region_id'))),
+                          []).append(d)
+    return groups
+
+
+def shard_files(database, regions=None):
+    """Existing shard files of `database`: list of (region code, path)."""
+    keys = [shard_key(r) for r in regions] if regions else SHARD_KEYS
+    paths = ((key, Path(shard_name(database, key) + '.sqlite'))
+             for key in sorted(set(keys)))
+    return [(key, path) for key, path in paths if path.is_file()]
+
+
+def _attach_limit(db, needed=len(SHARD_KEYS)):
+    """Raises the limit of attached databases of `db` as far as SQLite
+    allows, returns the limit."""
+    if db.getlimit(sqlite3.SQLITE_LIMIT_ATTACHED) < needed:
+        # не може перевищити SQLITE_MAX_ATTACHED, з яким зібрано SQLite
+        db.setlimit(sqlite3.SQLITE_LIMIT_ATTACHED, needed)
+    return db.getlimit(sqlite3.SQLITE_LIMIT_ATTACHED)
+
+
+def _union_view(name, columns, schemas, table=None):
+    return 'CREATE TEMP VIEW {} AS {};'.format(name, ' UNION ALL '.join(
+        'SELECT {} FROM {}.{}'.format(columns, schema, table or name)
+        for schema in schemas))
+
+
+def _attach(db, shards):
+    schemas = []
+    for key, path in shards:
+        schema = 'r{:02d}'.format(key)
+        db.execute('ATTACH DATABASE ? AS {}'.format(schema), (str(path),))
+        version = db.execute(
+            'PRAGMA {}.user_version'.format(schema)).fetchone()[0]
+        if version < SCHEMA_VERSION:
+            raise OutdatedSchemaError(str(path))
+        schemas.append(schema)
+    db.execute(_union_view('edata', ', '.join(COLUMNS), schemas))
+    for table, (key, _) in ROLLUPS.items():
+        db.execute(_union_view(table, 'day, {}, cnt, total'.format(key),
+                               schemas))
+
+
+def open_shard_groups(database='edata', regions=None):
+    """Returns list of connections, each with as many shards of `database`
+    (or only of `regions`) attached as SQLite allows, as `rNN`, and with
+    temporary `edata` and rollup views combining them. Every shard is
+    attached to one connection only.
+
+    Raises `NoShardsError` or `OutdatedSchemaError`."""
+    shards = shard_files(database, regions)
+    if not shards:
+        raise NoShardsError(database)
+    connections = []
+    try:
+        while shards:
+            db = sqlite3.connect(':memory:')
+            connections.append(db)
+            limit = _attach_limit(db, len(shards))
+            _attach(db, shards[:limit])
+            shards = shards[limit:]
+    except Exception:
+        close_all(connections)
+        raise
+    return connections
+
+
+def open_sharded(database='edata', regions=None):
+    """Returns one connection with shards of `database` (or only of
+    `regions`), see `open_shard_groups`.
+
+    Raises `NoShardsError`, `TooManyShardsError` if SQLite cannot attach
+    that many databases, or `OutdatedSchemaError`."""
+    connections = open_shard_groups(database, regions)
+    if len(connections) > 1:
+        close_all(connections)
+        probe = sqlite3.connect(':memory:')
+        limit = _attach_limit(probe)
+        probe.close()
+        raise TooManyShardsError(len(shard_files(database, regions)), limit)
+    return connections[0]
+
+
+def close_all(connections):
+    for db in connections:
+        db.close()
+
+
+def maintain(path, rebuild=None, vacuum=None):
+    """Maintenance of one shard file; returns (rows, file size)."""
+    db = sqlite3.connect(str(path))
+    try:
+        source = source_table(db)
+        ensure_rollups(db, source=source)
+        if rebuild:
+            rebuild_rollups(db, source=source)
+        if vacuum:
+            db.execute('VACUUM')
+        rows = db.execute('SELECT count(*) FROM edata').fetchone()[0]
+    finally:
+        db.close()
+    return rows, os.path.getsize(path)
+
+
+def main():
+    results = arg_parser.parse_args()
+    if re.match(r'^.+\.sqlite$', results.database):
+        results.database = re.sub(r'^(.+)\.sqlite$', '\\1', results.database)
+    shards = shard_files(results.database, results.treasury)
+    if not shards:
+        try:
+            raise NoShardsError(results.database)
+        except NoShardsError as e:
+            sys.stderr.write('{}\n'.format(e))
+            sys.exit(1)
+    with ThreadPoolExecutor(max_workers=max(1, results.jobs)) as pool:
+        futures = [(path, pool.submit(maintain, path, results.rebuild,
+                                      results.vacuum))
+                   for _, path in shards]
+        failed = 0
+        for path, future in futures:
+            try:
+                rows, size = future.result()
+            except sqlite3.Error as e:
+                failed += 1
+                sys.stderr.write('{}: {}\n'.format(path, e))
+                continue
+            if results.verbose:
+                sys.stdout.write('{:<24} {:>12} {:>10.1f} МБ\n'.format(
+                    path.name, rows, size / 1024 / 1024))
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,380 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2016-2025 Renat Nasridinov
+# This software may be freely distributed under the MIT license.
+# https://opensource.org/licenses/MIT The MIT License (MIT)
+# or see LICENSE file
+
+# Зведення витрат (сума, кількість платежів, найбільші платники/отримувачі)
+# за платником, отримувачем, регіоном, днем або місяцем. Дані читаються у
+# стовпці NumPy (з JSON-файлів порталу, файлів Parquet, кешу Arrow, див.
+# arrow_cache.py, або зведених таблиць бази даних SQLite, див. rollups.py)
+# і групуються векторно, без циклів на рівні окремих записів.
+
+import argparse
+import json
+import re
+import sqlite3
+import sys
+from datetime import date
+from pathlib import Path
+import numpy as np
+from .errors import NoShardsError, OutdatedSchemaError
+from .profiling import add_profile_argument, profiled
+from .regions import REGIONS
+from .schema import (
+    decode_code,
+    decode_date,
+    encode_code,
+    encode_date,
+    )
+from .shards import close_all, open_shard_groups
+
+
+DIMENSIONS = ('payer', 'recipt', 'region', 'day', 'month')
+# вимір: (стовпець коду у даних порталу, кількість цифр коду)
+CODE_DIMENSIONS = {'payer': ('payer_edrpou', 8),
+                   'recipt': ('recipt_edrpou', 8)}
+# зведена таблиця SQLite, з якої береться кожен вимір
+ROLLUP_TABLES = {'payer': ('rollup_day_payer', 'payer_edrpou'),
+                 'recipt': ('rollup_day_recipt', 'recipt_edrpou'),
+                 'region': ('rollup_day_region', 'region_id'),
+                 'day': ('rollup_day_region', 'region_id'),
+                 'month': ('rollup_day_region', 'region_id')}
+REGION_NAMES = {x['regionCode']: x['regionName'] for x in REGIONS}
+UNKNOWN_DAY = -1
+TOP = 10
+
+
+def iso_date(value):
+    """argparse type: ISO 8601 date `YYYY-MM-DD`."""
+    try:
+        date.fromisoformat(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(
+            'передане значення `{}` не відповідає допустимому формату дати. '
+            'Допустимий формат ISO8601: `YYYY-MM-DD`'.format(value))
+    return value
+
+
+arg_parser = argparse.ArgumentParser(
+    prog=None,
+    usage=None,
+    description="Зведення витрат за даними порталу Є-Data: суми, кількість "
+                "платежів та найбільші платники й отримувачі",
+    epilog=None
+    )
+arg_parser.add_argument('files', nargs='*',
+                        help='JSON-файли, вивантажені з порталу, файли '
+                        'Parquet або кешу Arrow (.arrow)')
+arg_parser.add_argument('-d', '--database', dest='database', default=None,
+                        help="ім'я файла бази даних SQLite (БЕЗ "
+                        "розширення), замість файлів")
+arg_parser.add_argument('--shard', action='store_true',
+                        help='база даних розділена за регіонами (див. '
+                        'shards.py)')
+arg_parser.add_argument('-b', '--by', nargs='+', choices=DIMENSIONS,
+                        default=['month'],
+                        help='виміри групування, за замовчуванням -- місяць')
+arg_parser.add_argument('-n', '--top', type=int, default=TOP,
+                        help='кількість найбільших платників, отримувачів '
+                        'та регіонів, за замовчуванням -- {}'.format(TOP))
+arg_parser.add_argument('-s', '--startdate', type=iso_date, default=None,
+                        help='початкова дата трансакцій')
+arg_parser.add_argument('-e', '--enddate', type=iso_date, default=None,
+                        help='кінцева дата трансакцій')
+arg_parser.add_argument('-j', '--json', action='store_true',
+                        help='вивести результат у форматі JSON')
+add_profile_argument(arg_parser)
+
+
+def _by_unique(values, convert, dtype):
+    """Applies `convert` once per distinct value of `values` and spreads the
+    results back over all rows."""
+    uniques, inverse = np.unique(values, return_inverse=True)
+    converted = np.array([convert(v) for v in uniques.tolist()], dtype=dtype)
+    return converted[inverse.ravel()]
+
+
+def _factorize(values, width, encode=None):
+    """Codes (int or text) -> (int32 array of group numbers, labels).
+    Distinct values are found by `np.unique`; `encode` normalises them as
+    the database stores them, values with equal results share a group."""
+    values = np.array(values, dtype=object)
+    uniques, first, inverse = np.unique(values.astype(str),
+                                        return_index=True,
+                                        return_inverse=True)
+    groups = {}
+    remap = np.array([groups.setdefault(decode_code(
+        encode(values[i], width) if encode else values[i], width),
+        len(groups)) for i in first.tolist()], dtype=np.int32)
+    return remap[inverse.ravel()], list(groups)
+
+
+def _frame(amount, day, region=None, codes=None, count=None):
+    return {'amount': amount, 'day': day, 'region': region,
+            'codes': codes or {}, 'count': count}
+
+
+def _to_kopecks(values):
+    """Amounts in hryvnias (numbers or strings) -> int64 kopecks, invalid
+    amounts are 0."""
+    try:
+        hryvnias = np.array(values, dtype=np.float64)
+    except ValueError:
+        hryvnias = _by_unique(np.array(values, dtype=str),
+                              _float_or_nan, np.float64)
+    return np.rint(np.nan_to_num(hryvnias) * 100).astype(np.int64)
+
+
+def _float_or_nan(value):
+    try:
+        return float(value)
+    except ValueError:
+        return np.nan
+
+
+def _to_day(value):
+    day = encode_date(value or None)
+    return day if isinstance(day, int) else UNKNOWN_DAY
+
+
+def _to_region(value):
+    return int(value) if value.isdigit() else 0
+
+
+def load_json(paths):
+    """Reads transactions from JSON files saved from the portal."""
+    data = []
+    for path in paths:
+        with open(path, encoding='utf-8') as f:
+            content = json.load(f)
+        if isinstance(content, dict):
+            content = content['response']['transactions']
+        data.extend(content)
+    # стовпці будуються один раз, перетворення -- для різних значень
+    amount = _to_kopecks([t.get('amount') or 0 for t in data])
+    day = _by_unique(np.array([t.get('trans_date') or '' for t in data],
+                              dtype='U10'), _to_day, np.int32)
+    region = _by_unique(np.array([t.get('region_id') or 0 for t in data],
+                                 dtype=object).astype(str),
+                        _to_region, np.int64)
+    return _frame(
+        amount, day, region=region,
+        codes={dim: _factorize([t.get(column) for t in data], width,
+                               encode=encode_code)
+               for dim, (column, width) in CODE_DIMENSIONS.items()})
+
+
+def _parquet_columns(table):
+    """Normalises columns of a Parquet table (written by `edata_convert`
+    or by `export`) to kopecks, days since 1970-01-01, region codes and
+    code strings."""
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    names = table.column_names
+    if 'amount_cop' in names:
+        amount = pc.cast(table['amount_cop'], pa.int64())
+    else:
+        amount = pc.cast(
+            pc.round(pc.multiply(pc.cast(table['amount'], pa.float64()),
+                                 100)), pa.int64())
+    trans_date = table['trans_date']
+    if pa.types.is_dictionary(trans_date.type):
+        trans_date = pc.cast(trans_date, trans_date.type.value_type)
+    if pa.types.is_string(trans_date.type) or \
+            pa.types.is_large_string(trans_date.type):
+        trans_date = pc.strptime(pc.utf8_slice_codeunits(trans_date, 0, 10),
+                                 format='%Y-%m-%d', unit='s',
+                                 error_is_null=True)
+    if not pa.types.is_date32(trans_date.type):
+        trans_date = pc.cast(trans_date, pa.date32(), safe=False)
+    day = pc.fill_null(pc.cast(trans_date, pa.int32()), UNKNOWN_DAY)
+    columns = {'amount': pc.fill_null(amount, 0), 'day': day,
+               'region': pc.fill_null(pc.cast(table['region_id'],
+                                              pa.int64()), 0)}
+    for dim, (column, _) in CODE_DIMENSIONS.items():
+        columns[dim] = pc.fill_null(pc.cast(table[column], pa.string()), '')
+    return pa.table(columns)
+
+
+def load_parquet(paths):
+    """Reads the needed columns of Parquet or cached Arrow files."""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    from .arrow_cache import SUFFIX, read_day
+    tables = []
+    for path in paths:
+        # кеш Arrow відображається у пам'ять, стовпці не копіюються
+        cached = read_day(path) if Path(path).suffix == SUFFIX else None
+        names = cached.column_names if cached is not None \
+            else pq.read_schema(str(path)).names
+        columns = [c for c in ('amount', 'amount_cop', 'trans_date',
+                               'region_id', 'payer_edrpou', 'recipt_edrpou')
+                   if c in names]
+        tables.append(_parquet_columns(
+            cached.select(columns) if cached is not None
+            else pq.read_table(str(path), columns=columns)))
+    table = pa.concat_tables(tables)
+    codes = {}
+    for dim in CODE_DIMENSIONS:
+        encoded = table[dim].combine_chunks().dictionary_encode()
+        codes[dim] = (encoded.indices.to_numpy(zero_copy_only=False),
+                      encoded.dictionary.to_pylist())
+    return _frame(
+        table['amount'].to_numpy(), table['day'].to_numpy(),
+        region=table['region'].to_numpy(), codes=codes)
+
+
+def load_sqlite(db, dim, startdate=None, enddate=None):
+    """Reads rollup table of the dimension (rows are already grouped by
+    day, `count` holds number of transactions). `db` is a connection or a
+    list of them (see `shards.open_shard_groups`)."""
+    table, key = ROLLUP_TABLES[dim]
+    where, params = [], []
+    if startdate:
+        where.append('day >= ?')
+        params.append(encode_date(startdate))
+    if enddate:
+        where.append('day <= ?')
+        params.append(encode_date(enddate))
+    qry = 'SELECT day, {}, cnt, total FROM {}{}'.format(
+        key, table, ' WHERE ' + ' AND '.join(where) if where else '')
+    rows = []
+    for c in db if isinstance(db, (list, tuple)) else [db]:
+        rows.extend(c.execute(qry, params))
+    days, keys, counts, totals = zip(*rows) if rows else ((),) * 4
+    frame = _frame(np.array(totals, dtype=np.int64),
+                   np.array(days, dtype=np.int32),
+                   count=np.array(counts, dtype=np.int64))
+    if dim in CODE_DIMENSIONS:
+        frame['codes'][dim] = _factorize(keys, CODE_DIMENSIONS[dim][1])
+    else:
+        frame['region'] = np.array(keys, dtype=np.int64)
+    return frame
+
+
+def filter_days(frame, startdate=None, enddate=None):
+    if not (startdate or enddate):
+        return frame
+    day = frame['day']
+    mask = day != UNKNOWN_DAY
+    if startdate:
+        mask &= day >= encode_date(startdate)
+    if enddate:
+        mask &= day <= encode_date(enddate)
+    return _frame(
+        frame['amount'][mask], day[mask],
+        region=frame['region'][mask] if frame['region'] is not None
+        else None,
+        codes={dim: (keys[mask], labels)
+               for dim, (keys, labels) in frame['codes'].items()},
+        count=frame['count'][mask] if frame['count'] is not None else None)
+
+
+def _group_keys(frame, dim):
+    """Returns (group number of every row, key and name of every group)."""
+    if dim in CODE_DIMENSIONS:
+        keys, labels = frame['codes'][dim]
+        return keys, [(label, '') for label in labels]
+    if dim == 'region':
+        values = frame['region']
+    elif dim == 'day':
+        values = frame['day']
+    else:
+        day = frame['day']
+        months = day.astype('datetime64[D]').astype('datetime64[M]') \
+            .astype(np.int32)
+        values = np.where(day == UNKNOWN_DAY, UNKNOWN_DAY, months)
+    uniques, keys = np.unique(values, return_inverse=True)
+    if dim == 'region':
+        labels = [(int(r), REGION_NAMES.get(int(r), '')) for r in uniques]
+    elif dim == 'day':
+        labels = [(decode_date(int(d)) if d != UNKNOWN_DAY else None, '')
+                  for d in uniques]
+    else:
+        labels = [(str(np.datetime64(int(m), 'M')) if m != UNKNOWN_DAY
+                   else None, '') for m in uniques]
+    return keys.ravel(), labels
+
+
+def summarize(frame, dim, top=TOP):
+    """Totals and counts by `dim`. Payers, recipients and regions are
+    ordered by total (first `top` of them), days and months by date.
+    Returns list of dicts with keys `key`, `name`, `count`, `total`
+    (hryvnias)."""
+    keys, labels = _group_keys(frame, dim)
+    n = len(labels)
+    counts = np.bincount(keys, weights=frame['count'], minlength=n)
+    # суми у копійках; float64 точно додає цілі до 2**53
+    totals = np.bincount(keys, weights=frame['amount'], minlength=n)
+    if dim in ('day', 'month'):
+        order = np.arange(n)
+    else:
+        order = np.argsort(-totals, kind='stable')[:top]
+    return [{'key': labels[i][0], 'name': labels[i][1],
+             'count': int(counts[i]),
+             'total': round(float(totals[i]) / 100, 2)}
+            for i in order]
+
+
+def show_table(dim, rows, out=sys.stdout):
+    out.write('\n{}\n'.format(dim))
+    for row in rows:
+        out.write('{:<12} {:<24} {:>10} {:>20,.2f}\n'.format(
+            str(row['key']), row['name'][:24], row['count'], row['total']))
+
+
+def main():
+    results = arg_parser.parse_args()
+    if not (results.files or results.database):
+        arg_parser.print_help()
+        sys.exit(2)
+    # звіти профілювання -- поруч з базою даних чи першим файлом
+    profiled(report, results, (results.database or results.files[0]) +
+             '.summary', results)
+
+
+def report(results):
+    summary = {}
+    if results.database:
+        if re.match(r'^.+\.sqlite$', results.database):
+            results.database = re.sub(r'^(.+)\.sqlite$', '\\1',
+                                      results.database)
+        try:
+            # база, розділена за регіонами, -- кілька з'єднань
+            db = open_shard_groups(results.database) if results.shard \
+                else [sqlite3.connect(results.database + '.sqlite')]
+        except (NoShardsError, OutdatedSchemaError) as e:
+            sys.stderr.write('{}\n'.format(e))
+            sys.exit(1)
+        try:
+            for dim in results.by:
+                frame = load_sqlite(db, dim, results.startdate,
+                                    results.enddate)
+                summary[dim] = summarize(frame, dim, results.top)
+        finally:
+            close_all(db)
+    else:
+        paths = [Path(p) for p in results.files]
+        parquet = [p for p in paths if p.suffix in ('.parquet', '.arrow')]
+        frame = load_parquet(parquet) if parquet else \
+            load_json([p for p in paths if p not in parquet])
+        if parquet and len(parquet) != len(paths):
+            sys.stderr.write('Файли JSON не можна змішувати з Parquet чи '
+                             'кешем Arrow (.arrow), оброблено лише Parquet '
+                             'та .arrow\n')
+        frame = filter_days(frame, results.startdate, results.enddate)
+        for dim in results.by:
+            summary[dim] = summarize(frame, dim, results.top)
+    if results.json:
+        json.dump(summary, sys.stdout, ensure_ascii=False, indent=1)
+        sys.stdout.write('\n')
+    else:
+        for dim, rows in summary.items():
+            show_table(dim, rows)
+
+
+if __name__ == '__main__':
+    main()
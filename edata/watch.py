@@ -0,0 +1,197 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2016-2025 Renat Nasridinov
+# This software may be freely distributed under the MIT license.
+# https://opensource.org/licenses/MIT The MIT License (MIT)
+# or see LICENSE file
+
+# Режим спостереження: періодично опитує `/v2/api/transactions/lastload` і,
+# щойно дата повного завантаження змінюється, завантажує нові дні,
+# додає їх до каталогу, за потреби перетворює у Parquet та завантажує до
+# бази даних SQLite. Інтервал опитування збільшується, поки дата не
+# змінюється, і повертається до мінімального після появи нових даних.
+# Стан процесу записується у JSON-файл статусу.
+
+import argparse
+import json
+import os
+import sys
+import time
+from datetime import date, datetime, timedelta
+from pathlib import Path
+from .catalog import open_catalog, update_entry
+from .core import get_lastload
+
+
+MIN_INTERVAL = 300
+MAX_INTERVAL = 3600
+BACKOFF = 1.5
+STATUS_FILE = 'watch.json'
+
+arg_parser = argparse.ArgumentParser(
+    prog=None,
+    usage=None,
+    description="Стежить за оприлюдненням нових даних порталу Є-Data та "
+                "завантажує їх",
+    epilog=None
+    )
+arg_parser.add_argument('-D', '--data-dir', dest='data_dir', default='data',
+                        help='директорія для ZIP-файлів, за замовчуванням '
+                        '-- `data`')
+arg_parser.add_argument('-s', '--since', type=str, default=None,
+                        help='остання вже завантажена дата (ISO 8601), за '
+                        'замовчуванням береться з файлу статусу або '
+                        'поточна дата lastload')
+arg_parser.add_argument('-d', '--database', dest='database', default=None,
+                        help="ім'я бази даних SQLite (БЕЗ розширення), до "
+                        "якої додавати нові дні")
+arg_parser.add_argument('--parquet', action='store_true',
+                        help='перетворювати нові дні у Parquet')
+arg_parser.add_argument('--index', action='store_true',
+                        help='будувати індекс ЄДРПОУ для нових файлів')
+arg_parser.add_argument('--status', type=str, default=STATUS_FILE,
+                        help='файл статусу, за замовчуванням -- '
+                        '`{}`'.format(STATUS_FILE))
+arg_parser.add_argument('--min-interval', type=int, default=MIN_INTERVAL,
+                        dest='min_interval',
+                        help='мінімальний інтервал опитування, секунди')
+arg_parser.add_argument('--max-interval', type=int, default=MAX_INTERVAL,
+                        dest='max_interval',
+                        help='максимальний інтервал опитування, секунди')
+arg_parser.add_argument('--once', action='store_true',
+                        help='виконати одне опитування і завершитися')
+arg_parser.add_argument('-v', '--verbose', action='store_true',
+                        help='виводити додаткову інформацію')
+
+
+def _now():
+    return datetime.now().isoformat(timespec='seconds')
+
+
+def read_status(status_file):
+    try:
+        with open(status_file, encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def write_status(status_file, status):
+    tmp_name = str(status_file) + '.tmp'
+    with open(tmp_name, 'w', encoding='utf-8') as f:
+        json.dump(status, f, ensure_ascii=False, indent=1)
+    os.replace(tmp_name, status_file)
+
+
+def next_interval(interval, advanced, failed, min_interval=MIN_INTERVAL,
+                  max_interval=MAX_INTERVAL):
+    """Adaptive polling interval: back to the minimum once new data
+    appears, growing by `BACKOFF` while nothing changes and doubling after
+    errors."""
+    if advanced:
+        return min_interval
+    factor = 2 if failed else BACKOFF
+    return int(min(max(interval * factor, min_interval), max_interval))
+
+
+def ingest_day(day, data_dir, database=None, parquet=None, index=None,
+               verbose=None):
+    """Downloads one day and passes it through the enabled stages, returns
+    path of the ZIP file."""
+    # extractor імпортується лише тут, як у pipeline.py
+    from .extractor import extract
+    zip_path = Path(data_dir, day.isoformat() + '.zip')
+    try:
+        extract(day, day, verbose=verbose, save_dir=Path(data_dir),
+                index=index)
+    except SystemExit as e:
+        raise RuntimeError('не вдалося завантажити {} (код {})'.format(
+            day, e.code))
+    if not zip_path.exists():
+        raise RuntimeError('файл {} не створено'.format(zip_path))
+    catalog = open_catalog(data_dir)
+    try:
+        update_entry(catalog, zip_path)
+    finally:
+        catalog.close()
+    if parquet:
+        # через тимчасовий файл; день, що не є CSV Є-Data, -- помилка
+        from .pipeline import convert_day
+        convert_day(zip_path, zip_path.with_suffix('.parquet'))
+    if database:
+        from .json2sqlite import EDataSQLDatabase
+        edb = EDataSQLDatabase(database=database, upsert=True)
+        try:
+            edb.import_zip(str(zip_path))
+        finally:
+            edb.close()
+    return zip_path
+
+
+def watch(data_dir='data', since=None, database=None, parquet=None,
+          index=None, status_file=STATUS_FILE, min_interval=MIN_INTERVAL,
+          max_interval=MAX_INTERVAL, once=None, verbose=None):
+    status = read_status(status_file)
+    status.update(pid=os.getpid(), started=_now(), state='starting')
+    if since:
+        status['last_ingested'] = since
+    interval = min_interval
+    while True:
+        advanced = failed = False
+        status.update(state='polling', last_poll=_now())
+        try:
+            lastload = get_lastload()
+            status['lastload'] = lastload.isoformat()
+            if not status.get('last_ingested'):
+                # перший запуск без --since: чекаємо наступного дня
+                status['last_ingested'] = lastload.isoformat()
+            day = date.fromisoformat(status['last_ingested'])
+            while day < lastload:
+                day += timedelta(days=1)
+                status.update(state='ingesting', current_day=day.isoformat())
+                write_status(status_file, status)
+                ingest_day(day, data_dir, database=database,
+                           parquet=parquet, index=index, verbose=verbose)
+                status['last_ingested'] = day.isoformat()
+                status['last_success'] = _now()
+                advanced = True
+                if verbose:
+                    sys.stdout.write('{} завантажено\n'.format(day))
+            status.pop('current_day', None)
+            status['last_ok_poll'] = _now()
+        except Exception as e:
+            failed = True
+            status.update(last_error=str(e), last_error_at=_now())
+            sys.stderr.write('{}\n'.format(e))
+        interval = next_interval(interval, advanced, failed,
+                                 min_interval=min_interval,
+                                 max_interval=max_interval)
+        status.update(state='sleeping', interval=interval,
+                      next_poll=datetime.fromtimestamp(
+                          time.time() + interval).isoformat(
+                              timespec='seconds'))
+        write_status(status_file, status)
+        if once:
+            return status
+        time.sleep(interval)
+
+
+def main():
+    results = arg_parser.parse_args()
+    Path(results.data_dir).mkdir(parents=True, exist_ok=True)
+    try:
+        watch(data_dir=results.data_dir, since=results.since,
+              database=results.database, parquet=results.parquet,
+              index=results.index, status_file=results.status,
+              min_interval=results.min_interval,
+              max_interval=results.max_interval, once=results.once,
+              verbose=results.verbose)
+    except KeyboardInterrupt:
+        status = read_status(results.status)
+        status['state'] = 'stopped'
+        write_status(results.status, status)
+
+
+if __name__ == '__main__':
+    main()
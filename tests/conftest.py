@@ -0,0 +1,35 @@
+import zipfile
+
+import pytest
+
+from edata.schema import COLUMNS
+
+
+def write_daily_zip(path, rows, columns=COLUMNS):
+    """Writes ZIP with CSV in the format of the portal's daily archives:
+    cp1251, `;`, Ukrainian titles on the first line, names on the second."""
+    lines = [';'.join('Стовпець {}'.format(n) for n in range(len(columns))),
+             ';'.join(columns)]
+    for row in rows:
+        lines.append(';'.join(str(row.get(k, '')) for k in columns))
+    with zipfile.ZipFile(path, 'w') as zf:
+        zf.writestr('transactions.csv',
+                    ('\r\n'.join(lines) + '\r\n').encode('cp1251'))
+    return path
+
+
+def transaction(id_, region_id=10, trans_date='2024-03-01', amount='100.50',
+                **kwargs):
+    d = {'id': id_, 'region_id': region_id, 'trans_date': trans_date,
+         'doc_date': trans_date, 'amount': amount,
+         'payer_edrpou': '00130850', 'recipt_edrpou': '20077720',
+         'payment_details': 'Оплата послуг'}
+    d.update(kwargs)
+    return d
+
+
+@pytest.fixture
+def daily_zip(tmp_path):
+    def make(rows, name='2024-03-01.zip'):
+        return write_daily_zip(tmp_path / name, rows)
+    return make
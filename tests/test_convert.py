@@ -0,0 +1,30 @@
+import pytest
+
+pd = pytest.importorskip('pandas')
+pytest.importorskip('pyarrow')
+
+from edata.edata_convert import load_day, parse_dates  # noqa: E402
+
+
+def test_bad_dates_are_reported_to_stderr(capsys):
+    df = pd.DataFrame({'doc_date': ['2024-03-01', 'невідомо'],
+                       'doc_v_date': ['2024-03-01', None],
+                       'trans_date': ['2024-03-01', '2024-03-02']})
+
+    df = parse_dates(df, 'optimised')
+
+    out, err = capsys.readouterr()
+    assert out == ''
+    assert "doc_date: не дати ['невідомо']" in err
+    assert df['doc_date'].isna().tolist() == [False, True]
+
+
+def test_load_day_is_quiet_unless_verbose(tmp_path, capsys):
+    path = tmp_path / 'day.csv'
+    path.write_bytes('Дата;Сума\r\ndoc_date;amount\r\n2024-03-01;1.5\r\n'
+                     .encode('cp1251'))
+
+    load_day(str(path))
+    assert capsys.readouterr().out == ''
+    load_day(str(path), verbose=True)
+    assert capsys.readouterr().out.startswith(str(path))
@@ -0,0 +1,71 @@
+import os
+
+import pytest
+
+from edata import dedupe as dedupe_module
+from edata.dedupe import dedupe, load_id_index
+from edata.schema import COLUMNS
+
+from conftest import transaction
+
+
+def write_csv(path, rows):
+    lines = [';'.join('Стовпець {}'.format(n) for n in range(len(COLUMNS))),
+             ';'.join(COLUMNS)]
+    lines.extend(';'.join(str(row.get(k, '')) for k in COLUMNS)
+                 for row in rows)
+    path.write_bytes(('\r\n'.join(lines) + '\r\n').encode('cp1251'))
+    return path
+
+
+def test_index_skips_files_without_new_ids(tmp_path, monkeypatch):
+    jan = write_csv(tmp_path / '202401.csv', [transaction(1), transaction(2)])
+    feb = write_csv(tmp_path / '202402.csv', [transaction(3), transaction(4)])
+    assert dedupe([jan, feb], index=True) == {jan: (2, 0), feb: (2, 0)}
+    assert load_id_index(jan)[0] == 2
+
+    read = []
+    csv_ids = dedupe_module._csv_ids
+    monkeypatch.setattr(dedupe_module, '_csv_ids',
+                        lambda p: read.append(p.name) or csv_ids(p))
+    mar = write_csv(tmp_path / '202403.csv', [transaction(5), transaction(2)])
+    stats = dedupe([jan, feb, mar], index=True)
+
+    assert read == ['202403.csv', '202401.csv']
+    assert stats == {mar: (2, 0), feb: (2, 0), jan: (2, 1)}
+    assert load_id_index(jan)[0] == 1
+    assert list(load_id_index(jan)[1]) == [1]
+
+
+def test_changed_file_is_read_again(tmp_path):
+    jan = write_csv(tmp_path / '202401.csv', [transaction(1)])
+    feb = write_csv(tmp_path / '202402.csv', [transaction(2)])
+    dedupe([jan, feb], index=True)
+
+    write_csv(feb, [transaction(2), transaction(1)])
+    os.utime(feb, ns=(0, os.stat(jan).st_mtime_ns + 10 ** 9))
+    assert load_id_index(feb) is None
+    assert dedupe([jan, feb], index=True) == {feb: (2, 0), jan: (1, 1)}
+
+
+def test_rewritten_parquet_gets_new_edrpou_index(tmp_path):
+    pa = pytest.importorskip('pyarrow')
+    pq = pytest.importorskip('pyarrow.parquet')
+    from edata.edrpou_index import INDEX_SUFFIX, build_index, lookup
+
+    newer, older = tmp_path / '2024-03-02.parquet', \
+        tmp_path / '2024-03-01.parquet'
+    pq.write_table(pa.table({'id': [2], 'payer_edrpou': ['00130850'],
+                             'recipt_edrpou': ['20077720']}), str(newer))
+    pq.write_table(pa.table({'id': [1, 2, 3],
+                             'payer_edrpou': ['11111111', '00130850',
+                                              '22222222'],
+                             'recipt_edrpou': ['20077720'] * 3}), str(older))
+    build_index(older)
+    before = os.stat(str(older) + INDEX_SUFFIX).st_mtime_ns
+
+    dedupe([newer, older])
+
+    assert os.stat(str(older) + INDEX_SUFFIX).st_mtime_ns != before
+    rows = [r['id'] for _, r in lookup('22222222', [older])]
+    assert rows == [3]
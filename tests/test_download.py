@@ -0,0 +1,134 @@
+import io
+import zipfile
+
+import pytest
+from requests.exceptions import HTTPError
+
+from edata import core
+from edata.client import EDataClient
+from edata.core import ChunkedEncodingError, download
+from edata.errors import CorruptDownloadError, DatesWithoutPayersError
+
+
+def zip_bytes():
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, 'w') as zf:
+        zf.writestr('transactions.csv', b'id\r\n1\r\n' * 1000)
+    return buf.getvalue()
+
+
+class FakeResponse(object):
+    """Response streaming `body`; the connection breaks after `fail_after`
+    bytes if given."""
+
+    def __init__(self, body, status_code=200, headers=None, fail_after=None):
+        self.body = body
+        self.status_code = status_code
+        self.headers = headers or {}
+        self.fail_after = fail_after
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise HTTPError('{} Error'.format(self.status_code))
+
+    def iter_content(self, chunk_size=1):
+        end = len(self.body) if self.fail_after is None else self.fail_after
+        for start in range(0, end, chunk_size):
+            yield self.body[start:min(start + chunk_size, end)]
+        if self.fail_after is not None:
+            raise ChunkedEncodingError('з\'єднання розірвано')
+
+
+class FakeSession(object):
+    """Returns scripted responses and records keyword arguments of every
+    request."""
+
+    def __init__(self, *responses):
+        self.responses = list(responses)
+        self.calls = []
+
+    def get(self, url, **kwargs):
+        self.calls.append(kwargs)
+        return self.responses.pop(0)
+
+    def close(self):
+        pass
+
+
+def test_client_timeout_applies_to_downloads(tmp_path):
+    session = FakeSession(FakeResponse(zip_bytes()))
+    client = EDataClient(base_url='http://test', timeout=(1, 2))
+    client._local.session = session
+
+    client.download('/file', tmp_path / 'out.zip')
+
+    assert session.calls[0]['timeout'] == (1, 2)
+    assert zipfile.ZipFile(tmp_path / 'out.zip').testzip() is None
+
+
+def test_corrupt_download_reports_only_when_handled(tmp_path, capsys):
+    session = FakeSession(FakeResponse(b'not a zip'))
+
+    with pytest.raises(CorruptDownloadError) as e:
+        download('http://test/file', tmp_path / 'out.zip', session=session)
+
+    assert 'out.zip' in str(e.value)
+    assert capsys.readouterr().err == ''
+    assert not (tmp_path / 'out.zip').exists()
+
+
+def test_interrupted_download_resumes_with_range(tmp_path, monkeypatch):
+    monkeypatch.setattr(core.time, 'sleep', lambda seconds: None)
+    body = zip_bytes()
+    half = len(body) // 2
+    session = FakeSession(
+        FakeResponse(body, headers={'ETag': '"v1"'}, fail_after=half),
+        FakeResponse(body[half:], status_code=206, headers={
+            'ETag': '"v1"',
+            'Content-Range': 'bytes {}-{}/{}'.format(half, len(body) - 1,
+                                                     len(body))}))
+
+    stats = download('http://test/file', tmp_path / 'out.zip',
+                     session=session, chunk_size=1000)
+
+    assert 'Range' not in session.calls[0]['headers']
+    assert session.calls[1]['headers']['Range'] == 'bytes={}-'.format(half)
+    assert session.calls[1]['headers']['If-Range'] == '"v1"'
+    assert stats['resumed_bytes'] == half
+    assert (tmp_path / 'out.zip').read_bytes() == body
+    assert [p.name for p in tmp_path.iterdir()] == ['out.zip']
+
+
+def test_changed_resource_is_fetched_again(tmp_path, monkeypatch):
+    monkeypatch.setattr(core.time, 'sleep', lambda seconds: None)
+    body = zip_bytes()
+    session = FakeSession(
+        FakeResponse(b'x' * 5000, headers={'ETag': '"v1"'}, fail_after=3000),
+        # If-Range не збігся: сервер віддає весь новий файл
+        FakeResponse(body, headers={'ETag': '"v2"'}))
+
+    stats = download('http://test/file', tmp_path / 'out.zip',
+                     session=session, chunk_size=1000)
+
+    assert stats['resumed_bytes'] == 0
+    assert (tmp_path / 'out.zip').read_bytes() == body
+
+
+def test_client_rejects_dates_without_payers():
+    session = FakeSession()
+    client = EDataClient(base_url='http://test')
+    client._local.session = session
+
+    with pytest.raises(DatesWithoutPayersError):
+        client.transactions(startdate='01-03-2024', enddate='31-03-2024')
+    assert session.calls == []
+
+
+def test_arbitrary_json_raises_on_server_error(tmp_path):
+    session = FakeSession(FakeResponse(b'', status_code=500))
+
+    with pytest.raises(HTTPError):
+        core._download_arbitrary_json(
+            '/v2/regions', ascii=False, verbose=False,
+            json_filename=str(tmp_path / 'out.json'), session=session)
+    assert not (tmp_path / 'out.json').exists()
@@ -0,0 +1,99 @@
+import csv
+import sqlite3
+from datetime import date
+
+import pytest
+
+from edata.errors import UnencodableValueError
+from edata.export import WRITERS, export
+from edata.schema import COLUMNS, INSERT, encode_row, ensure_schema
+
+
+def make_db(rows):
+    db = sqlite3.connect(':memory:')
+    ensure_schema(db)
+    db.executemany(INSERT.format(table='edata'),
+                   [encode_row(d) for d in rows])
+    db.commit()
+    return db
+
+
+def read_ids(path):
+    with open(path, encoding='utf-8', newline='') as f:
+        return sorted(int(r['id']) for r in csv.DictReader(f, delimiter=';'))
+
+
+def test_by_month_keeps_all_unknown_dates(tmp_path):
+    db = make_db([
+        {'id': 1, 'trans_date': None, 'amount': '1.00'},
+        {'id': 2, 'trans_date': '2024-01-15', 'amount': '2.00'},
+        {'id': 3, 'trans_date': 'невідомо', 'amount': '3.00'},
+        {'id': 4, 'trans_date': '2024-02-01', 'amount': '4.00'},
+        {'id': 5, 'trans_date': None, 'amount': '5.00'},
+        {'id': 6, 'trans_date': '2024-01-02', 'amount': '6.00'},
+        ])
+
+    counts = export(db, tmp_path / 'out.csv', by_month=True, batch=2)
+
+    assert {p.name: n for p, n in counts.items()} == {
+        'out-2024-01.csv': 2, 'out-2024-02.csv': 1, 'out-unknown.csv': 3}
+    assert read_ids(tmp_path / 'out-2024-01.csv') == [2, 6]
+    assert read_ids(tmp_path / 'out-unknown.csv') == [1, 3, 5]
+
+
+def test_export_filters_and_decodes(tmp_path):
+    db = make_db([
+        {'id': 1, 'trans_date': '2024-01-15', 'region_id': 10,
+         'payer_edrpou': '00130850', 'amount': '1.50'},
+        {'id': 2, 'trans_date': '2024-01-16', 'region_id': 26,
+         'payer_edrpou': '00130850', 'amount': '2.00'},
+        ])
+
+    export(db, tmp_path / 'out.csv', regions=[10])
+
+    with open(tmp_path / 'out.csv', encoding='utf-8', newline='') as f:
+        rows = list(csv.DictReader(f, delimiter=';'))
+    assert list(rows[0]) == list(COLUMNS)
+    assert [(r['id'], r['payer_edrpou'], r['amount'], r['trans_date'])
+            for r in rows] == [('1', '00130850', '1.5', '2024-01-15')]
+
+
+def test_cp1251_reports_unencodable_row(tmp_path):
+    db = make_db([
+        {'id': 1, 'trans_date': '2024-01-15', 'payment_details': 'Оплата'},
+        {'id': 2, 'trans_date': '2024-01-16', 'payment_details': 'Оплата ✓'},
+        ])
+
+    with pytest.raises(UnencodableValueError) as e:
+        export(db, tmp_path / 'out.csv', encoding='cp1251')
+
+    assert (e.value.row_id, e.value.column) == (2, 'payment_details')
+    with open(tmp_path / 'out.csv', encoding='cp1251', newline='') as f:
+        assert [r['id'] for r in csv.DictReader(f, delimiter=';')] == ['1']
+
+
+def test_parquet_keeps_rows_with_text_dates(tmp_path):
+    pq = pytest.importorskip('pyarrow.parquet')
+    db = make_db([
+        {'id': 1, 'trans_date': '2024-01-15', 'doc_date': 'невідомо'},
+        {'id': 2, 'trans_date': None},
+        ])
+
+    export(db, tmp_path / 'out.parquet', fmt='parquet')
+
+    table = pq.read_table(str(tmp_path / 'out.parquet')).to_pydict()
+    assert table['id'] == [1, 2]
+    assert table['trans_date'] == [date(2024, 1, 15), None]
+    assert table['doc_date'] == [None, None]
+
+
+def test_parquet_writer_leaves_rows_unchanged(tmp_path):
+    pytest.importorskip('pyarrow')
+    rows = [dict(dict.fromkeys(COLUMNS), id=1, trans_date='2024-01-15')]
+    writer = WRITERS['parquet'](tmp_path / 'out.parquet')
+    try:
+        writer.write(rows)
+    finally:
+        writer.close()
+
+    assert rows[0]['trans_date'] == '2024-01-15'
@@ -0,0 +1,77 @@
+import json
+import zipfile
+
+import pytest
+
+from edata import core
+from edata.catalog import scan_file
+from edata.errors import RegionsFailedError
+from edata.json2sqlite import EDataSQLDatabase
+
+from conftest import transaction, write_daily_zip
+
+
+def test_merged_archive_has_single_csv_member(tmp_path):
+    first = write_daily_zip(tmp_path / '10.zip',
+                            [transaction(1), transaction(2)])
+    second = write_daily_zip(tmp_path / '26.zip',
+                             [transaction(3, region_id=26)])
+    merged = tmp_path / 'all.zip'
+
+    core._merge_region_zips([(10, first), (26, second)], merged)
+
+    with zipfile.ZipFile(merged) as zf:
+        assert zf.namelist() == [core.MERGED_MEMBER]
+    assert scan_file(merged)['rows'] == 3
+    counts = EDataSQLDatabase(database=str(tmp_path / 'edata'),
+                              upsert=True).import_zip(merged)
+    assert counts == (3, 0, 0)
+
+
+def test_top_all_regions_uses_top100(monkeypatch):
+    calls = []
+
+    def fetch(api_part, qry_dict, region, *args):
+        calls.append((api_part, qry_dict))
+        return region, [], 0.0
+
+    monkeypatch.setattr(core, '_fetch_region', fetch)
+    core.fetch_all_regions({'regions': [10, 26]}, [10, 26], top100=True)
+
+    assert calls == [('/v2/api/transactions/top100', {})] * 2
+
+
+def test_failed_region_fails_fetch_after_saving_others(tmp_path,
+                                                        monkeypatch):
+    archive = write_daily_zip(tmp_path / '10.zip', [transaction(1)])
+
+    def fetch(api_part, qry_dict, region, *args):
+        if region == 26:
+            return region, ConnectionError('offline'), 0.0
+        return region, archive, 0.0
+
+    monkeypatch.setattr(core, '_fetch_region', fetch)
+    merged = tmp_path / 'all.zip'
+    with pytest.raises(RegionsFailedError) as e:
+        core.fetch_all_regions({}, [10, 26], output_format='0x4',
+                               zipname=merged)
+
+    assert e.value.failed == [26]
+    assert scan_file(merged)['rows'] == 1
+    report = json.loads((tmp_path / 'all.zip.regions.json').read_text())
+    assert report['26']['error'] == 'offline'
+
+
+def test_json_region_request_has_timeout(tmp_path, monkeypatch):
+    calls = []
+
+    def get(url, **kwargs):
+        calls.append(kwargs)
+        raise ConnectionError('offline')
+
+    monkeypatch.setattr(core.requests, 'get', get)
+    region, result, _ = core._fetch_region(
+        '/v2/api/transactions/', {}, 10, '0x2', str(tmp_path))
+
+    assert isinstance(result, ConnectionError)
+    assert calls[0]['timeout'] == core.DOWNLOAD_TIMEOUT
@@ -0,0 +1,34 @@
+import sqlite3
+import zipfile
+
+import pytest
+
+from edata.orgstat import load_snapshot
+
+
+def write_stat(path, lines):
+    with zipfile.ZipFile(path, 'w') as zf:
+        zf.writestr('stat.csv', '\r\n'.join(lines).encode('cp1251'))
+    return path
+
+
+def test_repeated_org_counted_once(tmp_path):
+    path = write_stat(tmp_path / '_stat', [
+        'edrpou;name;docs', '00130850;Орг;1', '00130850;Орг;2',
+        '20077720;Інша;3'])
+    db = sqlite3.connect(':memory:')
+
+    counts = load_snapshot(db, path, snapshot='2025-01-31')
+
+    assert counts['added'] == 2
+    assert counts['duplicate'] == 1
+    assert db.execute('SELECT count(*) FROM org_stat').fetchone()[0] == 2
+    again = load_snapshot(db, path, snapshot='2025-02-01')
+    assert (again['unchanged'], again['changed']) == (2, 0)
+
+
+def test_unknown_key_column(tmp_path):
+    path = write_stat(tmp_path / '_stat', ['edrpou;name', '00130850;Орг'])
+
+    with pytest.raises(ValueError, match='`code`.*edrpou, name'):
+        load_snapshot(sqlite3.connect(':memory:'), path, key='code')
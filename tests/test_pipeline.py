@@ -0,0 +1,92 @@
+import sqlite3
+
+import pytest
+
+from edata.pipeline import Pipeline, Task, build_tasks
+
+from conftest import transaction, write_daily_zip
+
+
+@pytest.fixture
+def data_dir(tmp_path):
+    data_dir = tmp_path / 'data'
+    data_dir.mkdir()
+    write_daily_zip(data_dir / '2024-03-01.zip',
+                    [transaction(1), transaction(2, region_id=26)])
+    return data_dir
+
+
+def run(data_dir, output_dir, stages, **kwargs):
+    pipeline = Pipeline(data_dir, **kwargs)
+    try:
+        return pipeline.run(build_tasks(data_dir, output_dir,
+                                        str(output_dir.parent / 'edata'),
+                                        stages=stages))
+    finally:
+        pipeline.close()
+
+
+def test_cache_task_uses_catalog_of_main_thread(data_dir, tmp_path):
+    pytest.importorskip('pyarrow')
+    from edata.arrow_cache import read_day, source_of
+    from edata.catalog import get_entry, open_catalog
+
+    output_dir = tmp_path / 'output'
+    assert run(data_dir, output_dir, ['cache']) == {'cache:2024-03-01': 'done'}
+
+    cached = output_dir / 'cache' / '2024-03-01.arrow'
+    catalog = open_catalog(data_dir)
+    sha256 = get_entry(catalog, data_dir / '2024-03-01.zip')['sha256']
+    catalog.close()
+    assert source_of(cached) == sha256
+    assert read_day(cached, ['id'])['id'].to_pylist() == [1, 2]
+    assert run(data_dir, output_dir, ['cache']) == \
+        {'cache:2024-03-01': 'fresh'}
+
+
+def test_existing_days_are_not_extracted_again(data_dir, tmp_path):
+    from edata.catalog import open_catalog, update_entry
+
+    (data_dir / '2024-03-02.zip').write_bytes(b'not a zip')
+    catalog = open_catalog(data_dir)
+    update_entry(catalog, data_dir / '2024-03-02.zip')
+    tasks = build_tasks(data_dir, tmp_path / 'output', 'edata',
+                        stages=['extract'],
+                        days=['2024-03-01', '2024-03-02', '2024-03-03'],
+                        catalog=catalog)
+    catalog.close()
+
+    assert [t.name for t in tasks] == ['extract:2024-03-02',
+                                       'extract:2024-03-03']
+
+
+def test_load_closes_database(data_dir, tmp_path, monkeypatch):
+    from edata.json2sqlite import EDataSQLDatabase
+
+    closed = []
+    close = EDataSQLDatabase.close
+    monkeypatch.setattr(EDataSQLDatabase, 'close',
+                        lambda self: closed.append(self) or close(self))
+    status = run(data_dir, tmp_path / 'output', ['load'])
+
+    assert status == {'load:2024-03-01': 'done'}
+    assert len(closed) == 1
+    db = sqlite3.connect(str(tmp_path / 'edata.sqlite'))
+    assert db.execute('SELECT count(*) FROM edata').fetchone()[0] == 2
+
+
+def test_damaged_input_after_task_fails_only_that_task(data_dir, capsys):
+    zip_path = data_dir / '2024-03-01.zip'
+    tasks = [
+        Task('damage', lambda: zip_path.write_bytes(b'not a zip'),
+             inputs=lambda: [zip_path]),
+        Task('other', lambda: None),
+        ]
+    pipeline = Pipeline(data_dir, jobs=1)
+    try:
+        status = pipeline.run(tasks)
+    finally:
+        pipeline.close()
+
+    assert status == {'damage': 'failed', 'other': 'done'}
+    assert capsys.readouterr().err.startswith('damage: ')
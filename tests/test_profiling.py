@@ -0,0 +1,47 @@
+import time
+
+from edata.profiling import collapsed_stacks
+
+
+class FakeStats(object):
+    def __init__(self, stats):
+        self.stats = stats
+
+
+def layered_graph(levels):
+    """Every function of a level calls both functions of the next one:
+    2 ** levels paths from the root. Every function takes one second, only
+    the last level has own time."""
+    funcs = [[('m.py', level, 'f{}_{}'.format(level, n)) for n in (0, 1)]
+             for level in range(levels)]
+    root = ('m.py', 0, 'main')
+    stats = {root: (1, 1, 0.0, 2.0, {})}
+    for level, row in enumerate(funcs):
+        callers = [root] if not level else funcs[level - 1]
+        for func in row:
+            edges = {c: (1, 1, 0.0, 1.0 / len(callers)) for c in callers}
+            own = 1.0 if level == levels - 1 else 0.0
+            stats[func] = (len(callers), len(callers), own, 1.0, edges)
+    return stats
+
+
+def test_shared_call_graph_is_linear():
+    started = time.perf_counter()
+    stacks = collapsed_stacks(FakeStats(layered_graph(40)))
+
+    assert time.perf_counter() - started < 1
+    assert len(stacks) < 4 * 40
+    # ребра коротші за MIN_STACK_TIME відкидаються
+    assert abs(sum(stacks.values()) - 2.0) < 1e-4
+
+
+def test_recursion_is_cut():
+    main, rec = ('m.py', 1, 'main'), ('m.py', 2, 'rec')
+    stacks = collapsed_stacks(FakeStats({
+        main: (1, 1, 0.5, 2.0, {}),
+        rec: (3, 1, 1.5, 1.5, {main: (1, 1, 0.5, 1.5),
+                               rec: (2, 2, 1.0, 1.0)}),
+        }))
+
+    assert stacks == {'main (m.py:1)': 0.5,
+                      'main (m.py:1);rec (m.py:2)': 1.5}
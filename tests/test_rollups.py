@@ -0,0 +1,75 @@
+import sqlite3
+
+import pytest
+
+from edata.rollups import ROLLUPS, rebuild_rollups
+from edata.schema import INSERT, encode_row, ensure_schema
+
+from conftest import transaction
+
+
+def rollups(db):
+    return {table: db.execute('SELECT * FROM {} ORDER BY 1, 2'.format(table))
+            .fetchall() for table in ROLLUPS}
+
+
+def insert(db, *rows):
+    db.executemany(INSERT.format(table='edata'),
+                   [encode_row(r) for r in rows])
+    db.commit()
+
+
+@pytest.fixture
+def database(tmp_path):
+    path = str(tmp_path / 'edata.sqlite')
+    db = sqlite3.connect(path)
+    ensure_schema(db)
+    db.close()
+    return path
+
+
+@pytest.mark.parametrize('recursive', ['ON', 'OFF'])
+def test_replaced_row_is_counted_once(database, recursive):
+    # нове з'єднання: ensure_rollups на ньому не викликався
+    db = sqlite3.connect(database)
+    db.execute('PRAGMA recursive_triggers = {}'.format(recursive))
+    for _ in range(3):
+        insert(db, transaction(1, amount='1.00'))
+
+    assert db.execute('SELECT count(*) FROM edata').fetchone()[0] == 1
+    assert rollups(db) == {
+        'rollup_day_region': [(19783, 10, 1, 100)],
+        'rollup_day_payer': [(19783, 130850, 1, 100)],
+        'rollup_day_recipt': [(19783, 20077720, 1, 100)],
+        }
+
+
+def test_insert_update_and_delete(database):
+    db = sqlite3.connect(database)
+    insert(db, transaction(1, amount='1.00'), transaction(2, amount='2.00'),
+           transaction(3, region_id=26, amount='4.00'))
+    assert rollups(db)['rollup_day_region'] == [(19783, 10, 2, 300),
+                                                (19783, 26, 1, 400)]
+
+    insert(db, transaction(2, region_id=26, amount='8.00'))
+    db.execute('UPDATE edata SET amount = 1600 WHERE id = 3')
+    db.execute('DELETE FROM edata WHERE id = 1')
+    db.commit()
+
+    assert rollups(db)['rollup_day_region'] == [(19783, 26, 2, 2400)]
+    assert rollups(db)['rollup_day_payer'] == [(19783, 130850, 2, 2400)]
+
+
+def test_rebuild_matches_triggers(database):
+    db = sqlite3.connect(database)
+    insert(db, transaction(1), transaction(2, trans_date='2024-03-02'),
+           transaction(3, payer_edrpou='1234'), transaction(1, amount='3'))
+    expected = rollups(db)
+
+    db.execute('DELETE FROM rollup_day_payer')
+    rebuild_rollups(db)
+
+    assert rollups(db) == expected
+    assert expected['rollup_day_payer'] == [
+        (19783, 130850, 1, 300), (19783, 4000000001234, 1, 10050),
+        (19784, 130850, 1, 10050)]
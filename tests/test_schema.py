@@ -0,0 +1,172 @@
+import sqlite3
+
+import pytest
+
+from edata.schema import (
+    COLUMNS,
+    INSERT,
+    SCHEMA_VERSION,
+    decode_row,
+    encode_row,
+    ensure_schema,
+    get_layout,
+    migrate,
+    normalise,
+    schema_version,
+    )
+
+from conftest import transaction
+
+
+# таблиця `edata` до компактної схеми: core.make_sqlite (19 стовпців) та
+# json2sqlite (13 стовпців)
+OLD_COLUMNS = {
+    19: COLUMNS,
+    13: COLUMNS[:13],
+    }
+OLD_TYPES = {'amount': 'real', 'region_id': 'integer', 'recipt_mfo': 'integer',
+             'payer_mfo': 'integer'}
+
+
+class FailingConnection(sqlite3.Connection):
+    """Raises after the first committed batch, as if the process was
+    killed."""
+
+    def commit(self):
+        super().commit()
+        raise KeyboardInterrupt
+
+
+def old_rows():
+    return [
+        transaction(1, amount=100.5, payer_name='Платник'),
+        transaction(2, region_id=26, amount=0.07,
+                    trans_date='2024-03-02T00:00:00+02:00'),
+        transaction(3, amount=12.345, payer_edrpou='1234'),
+        transaction(4, trans_date=None, amount=None),
+        ]
+
+
+def make_old_db(path, width):
+    columns = OLD_COLUMNS[width]
+    db = sqlite3.connect(str(path))
+    db.execute('CREATE TABLE edata ({})'.format(', '.join(
+        '{} {}'.format(k, 'integer PRIMARY KEY ON CONFLICT REPLACE'
+                       if k == 'id' else OLD_TYPES.get(k, 'text'))
+        for k in columns)))
+    db.executemany('INSERT INTO edata ({}) VALUES ({})'.format(
+        ', '.join(columns), ', '.join(':' + k for k in columns)),
+        [{k: d.get(k) for k in columns} for d in old_rows()])
+    db.commit()
+    db.close()
+
+
+def make_compact_db(path):
+    db = sqlite3.connect(str(path))
+    ensure_schema(db)
+    rows = old_rows() + [transaction(5, payer_mfo='820172',
+                                     payer_bank='ДКСУ', region_id=26)]
+    db.executemany(INSERT.format(table='edata'),
+                   [encode_row(d) for d in rows])
+    db.commit()
+    db.close()
+
+
+def contents(db):
+    rows = db.execute('SELECT {} FROM edata ORDER BY id'.format(
+        ', '.join(COLUMNS))).fetchall()
+    rollups = {table: db.execute(
+        'SELECT * FROM {} ORDER BY 1, 2'.format(table)).fetchall()
+        for table in ('rollup_day_region', 'rollup_day_payer',
+                      'rollup_day_recipt')}
+    return rows, rollups
+
+
+def region_totals(db):
+    return db.execute('SELECT region_id, sum(cnt), sum(total) FROM '
+                      'rollup_day_region GROUP BY region_id ORDER BY '
+                      'region_id').fetchall()
+
+
+@pytest.mark.parametrize('width', sorted(OLD_COLUMNS))
+def test_migrate_old_layout(tmp_path, width):
+    path = tmp_path / 'edata.sqlite'
+    make_old_db(path, width)
+
+    db = sqlite3.connect(str(path))
+    assert migrate(db, batch=3) == 4
+
+    assert schema_version(db) == SCHEMA_VERSION
+    rows = [decode_row(r) for r in db.execute(
+        'SELECT {} FROM edata ORDER BY id'.format(', '.join(COLUMNS)))]
+    assert [(d['id'], d['amount'], d['trans_date'], d['payer_edrpou'])
+            for d in rows] == [(1, 100.5, '2024-03-01', '00130850'),
+                               (2, 0.07, '2024-03-02', '00130850'),
+                               (3, 12.35, '2024-03-01', '1234'),
+                               (4, None, None, '00130850')]
+    assert rows[0]['payer_name'] == 'Платник'
+    assert rows[0]['doc_date'] == ('2024-03-01' if width == 19 else None)
+    assert region_totals(db) == [(10, 3, 11285), (26, 1, 7)]
+    assert migrate(db) == 0
+
+
+def test_interrupted_migration_resumes(tmp_path):
+    path = tmp_path / 'edata.sqlite'
+    make_old_db(path, 19)
+    with pytest.raises(KeyboardInterrupt):
+        migrate(sqlite3.connect(str(path), factory=FailingConnection),
+                batch=3)
+
+    db = sqlite3.connect(str(path))
+    assert schema_version(db) < SCHEMA_VERSION
+    assert db.execute('SELECT count(*) FROM edata_compact').fetchone()[0] == 3
+    assert migrate(db, batch=3) == 1
+
+    assert [r[0] for r in db.execute('SELECT id FROM edata')] == [1, 2, 3, 4]
+    assert region_totals(db) == [(10, 3, 11285), (26, 1, 7)]
+
+
+def test_normalise_keeps_rows_and_rollups(tmp_path):
+    path = tmp_path / 'edata.sqlite'
+    make_compact_db(path)
+    db = sqlite3.connect(str(path))
+    before = contents(db)
+
+    assert normalise(db, batch=2) == 5
+
+    assert db.execute("SELECT type FROM sqlite_master WHERE name = 'edata'"
+                      ).fetchone() == ('view',)
+    assert contents(db) == before
+    assert db.execute('SELECT count(*) FROM org').fetchone()[0] == 4
+    assert normalise(db) == 0
+
+
+def test_interrupted_normalisation_resumes(tmp_path):
+    path = tmp_path / 'edata.sqlite'
+    make_compact_db(path)
+    db = sqlite3.connect(str(path))
+    before = contents(db)
+    db.close()
+    with pytest.raises(KeyboardInterrupt):
+        normalise(sqlite3.connect(str(path), factory=FailingConnection),
+                  batch=2)
+
+    db = sqlite3.connect(str(path))
+    assert db.execute('SELECT count(*) FROM edata_facts').fetchone()[0] == 2
+    assert normalise(db, batch=2) == 3
+
+    assert contents(db) == before
+
+
+def test_rollups_follow_normalised_writes(tmp_path):
+    path = tmp_path / 'edata.sqlite'
+    make_compact_db(path)
+    db = sqlite3.connect(str(path))
+    normalise(db)
+
+    layout = get_layout(db)
+    db.executemany(layout.insert, [layout.encode(transaction(
+        n, region_id=26, amount='1.00')) for n in (1, 6)])
+    db.commit()
+
+    assert region_totals(db) == [(10, 2, 1235), (26, 4, 10257)]
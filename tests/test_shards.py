@@ -0,0 +1,89 @@
+import sqlite3
+
+import pytest
+
+from edata.errors import TooManyShardsError
+from edata.export import export
+from edata.json2sqlite import ShardedSQLDatabase
+from edata.shards import (
+    SHARD_KEYS,
+    close_all,
+    open_shard_groups,
+    open_sharded,
+    shard_files,
+    )
+from edata.summary import load_sqlite, summarize
+
+from conftest import transaction
+
+
+@pytest.fixture
+def sharded(tmp_path, daily_zip):
+    """Sharded database with two transactions in every region."""
+    rows = []
+    for n, region in enumerate(SHARD_KEYS):
+        day = '2024-{:02d}-01'.format(n % 12 + 1)
+        rows.append(transaction(2 * n + 1, region_id=region or 'x',
+                                trans_date=day, amount='1.00'))
+        rows.append(transaction(2 * n + 2, region_id=region or 'x',
+                                trans_date=day, amount='2.50'))
+    database = str(tmp_path / 'edata')
+    counts = ShardedSQLDatabase(database=database, upsert=True).import_zip(
+        daily_zip(rows))
+    assert counts == (len(rows), 0, 0)
+    return database
+
+
+def test_every_region_gets_own_file(sharded):
+    files = shard_files(sharded)
+    assert [key for key, _ in files] == sorted(SHARD_KEYS)
+    for key, path in files:
+        db = sqlite3.connect(str(path))
+        assert db.execute('SELECT count(*) FROM edata').fetchone()[0] == 2
+
+
+def test_groups_cover_more_shards_than_attach_limit(sharded):
+    connections = open_shard_groups(sharded)
+    try:
+        limit = connections[0].getlimit(sqlite3.SQLITE_LIMIT_ATTACHED)
+        assert len(connections) == -(-len(SHARD_KEYS) // limit)
+        total = sum(c.execute('SELECT count(*) FROM edata').fetchone()[0]
+                    for c in connections)
+        assert total == 2 * len(SHARD_KEYS)
+    finally:
+        close_all(connections)
+
+
+def test_open_sharded_reports_attach_limit(sharded):
+    probe = sqlite3.connect(':memory:')
+    probe.setlimit(sqlite3.SQLITE_LIMIT_ATTACHED, len(SHARD_KEYS))
+    if probe.getlimit(sqlite3.SQLITE_LIMIT_ATTACHED) >= len(SHARD_KEYS):
+        pytest.skip('SQLite allows attaching every shard')
+    with pytest.raises(TooManyShardsError):
+        open_sharded(sharded)
+    db = open_sharded(sharded, regions=[10, 26])
+    assert db.execute('SELECT count(*) FROM edata').fetchone()[0] == 4
+    db.close()
+
+
+def test_export_of_all_shards_by_month(sharded, tmp_path):
+    connections = open_shard_groups(sharded)
+    try:
+        counts = export(connections, tmp_path / 'out.csv', by_month=True,
+                        batch=7)
+    finally:
+        close_all(connections)
+    assert sum(counts.values()) == 2 * len(SHARD_KEYS)
+    assert len(counts) == 12
+    assert sorted(p.name for p in counts)[0] == 'out-2024-01.csv'
+
+
+def test_summary_of_all_shards(sharded):
+    connections = open_shard_groups(sharded)
+    try:
+        rows = summarize(load_sqlite(connections, 'payer'), 'payer')
+    finally:
+        close_all(connections)
+    assert rows == [{'key': '00130850', 'name': '',
+                     'count': 2 * len(SHARD_KEYS),
+                     'total': 3.5 * len(SHARD_KEYS)}]
@@ -0,0 +1,47 @@
+import json
+
+import pytest
+
+from edata import summary
+from edata.summary import load_json, summarize
+
+
+def write_json(path, transactions):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({'response': {'transactions': transactions,
+                                'errors': []}}, f)
+    return path
+
+
+def test_load_json_columns(tmp_path):
+    path = write_json(tmp_path / 'edata.json', [
+        {'amount': '100.50', 'trans_date': '2024-03-01T10:00:00',
+         'region_id': 10, 'payer_edrpou': '00130850'},
+        {'amount': 2, 'trans_date': None, 'region_id': '26',
+         'payer_edrpou': ' 00130850 '},
+        {'amount': 'немає', 'trans_date': 'невідомо', 'region_id': None,
+         'payer_edrpou': '130850'},
+        ])
+
+    frame = load_json([path])
+
+    assert frame['amount'].tolist() == [10050, 200, 0]
+    assert frame['day'].tolist() == [19783, -1, -1]
+    assert frame['region'].tolist() == [10, 26, 0]
+    assert summarize(frame, 'payer') == [
+        {'key': '00130850', 'name': '', 'count': 2, 'total': 102.5},
+        {'key': '130850', 'name': '', 'count': 1, 'total': 0.0}]
+    assert summarize(frame, 'month') == [
+        {'key': None, 'name': '', 'count': 2, 'total': 2.0},
+        {'key': '2024-03', 'name': '', 'count': 1, 'total': 100.5}]
+
+
+def test_invalid_startdate_is_rejected(tmp_path, monkeypatch, capsys):
+    path = write_json(tmp_path / 'edata.json', [])
+    monkeypatch.setattr('sys.argv', ['summary', str(path), '-s', '2024-13'])
+
+    with pytest.raises(SystemExit) as e:
+        summary.main()
+
+    assert e.value.code == 2
+    assert '`2024-13`' in capsys.readouterr().err
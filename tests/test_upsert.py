@@ -0,0 +1,42 @@
+import sqlite3
+
+from edata.json2sqlite import EDataSQLDatabase
+
+from conftest import transaction
+
+
+def test_csv_reimport_leaves_identical_rows(tmp_path, daily_zip):
+    path = daily_zip([transaction(101), transaction(102, region_id=26)])
+    database = str(tmp_path / 'edata')
+
+    first = EDataSQLDatabase(database=database, upsert=True).import_zip(path)
+    second = EDataSQLDatabase(database=database, upsert=True).import_zip(path)
+
+    assert first == (2, 0, 0)
+    assert second == (0, 0, 2)
+
+
+def test_csv_reimport_revises_changed_rows(tmp_path, daily_zip):
+    database = str(tmp_path / 'edata')
+    EDataSQLDatabase(database=database, upsert=True).import_zip(
+        daily_zip([transaction(101), transaction(102)]))
+
+    counts = EDataSQLDatabase(database=database, upsert=True).import_zip(
+        daily_zip([transaction(101), transaction(102, amount='7.00'),
+                   transaction(103)], name='2024-03-02.zip'))
+
+    assert counts == (1, 1, 1)
+    db = sqlite3.connect(database + '.sqlite')
+    assert db.execute('SELECT id, region_id, amount FROM edata ORDER BY id'
+                      ).fetchall() == [(101, 10, 10050), (102, 10, 700),
+                                       (103, 10, 10050)]
+
+
+def test_csv_and_json_rows_hash_alike(tmp_path, daily_zip):
+    database = str(tmp_path / 'edata')
+    edb = EDataSQLDatabase(database=database, upsert=True)
+    edb.import_zip(daily_zip([transaction(101)]))
+
+    d = transaction(101)
+    d.update(id=101, region_id=10)
+    assert edb._upsert_json([d]) == (0, 0, 1)
@@ -0,0 +1,58 @@
+import os
+import subprocess
+import sys
+import types
+from datetime import date
+from pathlib import Path
+
+import pytest
+
+from edata import extractor, watch
+from edata.catalog import get_entry, open_catalog
+
+from conftest import transaction, write_daily_zip
+
+
+def test_import_has_no_side_effects(tmp_path):
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path))
+    subprocess.run([sys.executable, '-c',
+                    'import edata.watch, edata.extractor, edata.pipeline'],
+                   cwd=str(tmp_path), env=env, check=True)
+
+    assert list(tmp_path.iterdir()) == []
+
+
+@pytest.fixture
+def fake_extract(monkeypatch):
+    def extract(startdate, enddate, verbose=None, save_dir=None, index=None):
+        write_daily_zip(Path(save_dir, startdate.isoformat() + '.zip'),
+                        [transaction(1)])
+    monkeypatch.setattr(extractor, 'extract', extract)
+
+
+def test_ingest_catalogs_only_new_day(tmp_path, fake_extract):
+    write_daily_zip(tmp_path / '2024-02-29.zip', [transaction(2)])
+
+    path = watch.ingest_day(date(2024, 3, 1), tmp_path)
+
+    catalog = open_catalog(tmp_path)
+    try:
+        assert get_entry(catalog, path)['rows'] == 1
+        assert get_entry(catalog, tmp_path / '2024-02-29.zip') is None
+    finally:
+        catalog.close()
+
+
+def test_day_that_cannot_be_converted_is_not_recorded(tmp_path, monkeypatch,
+                                                      fake_extract):
+    convert = types.ModuleType('edata.edata_convert')
+    convert.load_day = lambda csv, profile: 1
+    monkeypatch.setitem(sys.modules, 'edata.edata_convert', convert)
+    monkeypatch.setattr(watch, 'get_lastload', lambda: date(2024, 3, 1))
+
+    status = watch.watch(data_dir=tmp_path, since='2024-02-29', parquet=True,
+                         status_file=tmp_path / 'watch.json', once=True)
+
+    assert status['last_ingested'] == '2024-02-29'
+    assert 'не є CSV' in status['last_error']
+    assert not list(tmp_path.glob('*.parquet*'))